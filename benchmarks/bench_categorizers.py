@@ -0,0 +1,90 @@
+"""
+Benchmark of the header / footer categorizer engines of pdf_cluster on synthetic documents.
+Reports run time, peak python memory, the agreement of every engine with the labels of the default dbscan
+engine and the precision / recall of the header / footer label against the generated running headers / footers.
+
+usage : python benchmarks/bench_categorizers.py --pages 100 500 2000
+"""
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from block_store import BlockStore
+from pdf_cluster import CATEGORIZER_ENGINES, get_categorizer
+from pdf_extractor import PDFExtractor
+from synthetic_pdf import is_running_text, make_synthetic_pdf
+
+def extract_block_vectors(pdf_path:str) -> list:
+    """
+    the categorizer input of PDFExtractor for the given pdf
+    """
+    extractor = PDFExtractor(pdf_path)
+    page_stores = []
+    with contextlib.redirect_stderr(io.StringIO()):
+        for record in extractor.iter_page_records(table_mode="off"):
+            extractor.headers.add_fontsizes(record.fontsizes)
+            page_stores.append(record.blocks)
+    extractor.block_store = BlockStore.concat(page_stores)
+    extractor.block_store.assign_headers(extractor.headers.compute_header_id())
+    return extractor.get_categorize_vectors()
+
+def run_engine(engine:str, blocks:list) -> tuple:
+    """
+    run time, peak traced memory and labels of the engine
+    the memory is traced in a second run as tracing slows down the python code of the engines
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        categorizer = get_categorizer(engine, blocks)
+        categorizer.run()
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        get_categorizer(engine, blocks).run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak, categorizer.labels
+
+def precision_recall(labels:list, truth:list) -> tuple:
+    true_pos = sum(1 for label, is_true in zip(labels, truth) if label == 1 and is_true)
+    n_pred, n_true = sum(labels), sum(truth)
+    return (true_pos / n_pred if n_pred else 1.0), (true_pos / n_true if n_true else 1.0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--engines", nargs="+", default=list(CATEGORIZER_ENGINES), choices=list(CATEGORIZER_ENGINES))
+    parser.add_argument("--table-density", type=float, default=0.1)
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'blocks':>7} {'engine':>15} {'time_s':>8} {'peak_mb':>8} {'agree':>7} {'prec':>6} {'recall':>7}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_pages in args.pages:
+            pdf_path = str(Path(tmp_dir) / f"synthetic_{n_pages}.pdf")
+            make_synthetic_pdf(pdf_path, n_pages=n_pages, table_density=args.table_density)
+            blocks = extract_block_vectors(pdf_path)
+            truth = [is_running_text(" ".join(text_lst)) for _, text_lst, _, _ in blocks]
+
+            reference_labels = None
+            for engine in args.engines:
+                elapsed, peak, labels = run_engine(engine, blocks)
+                if engine == "dbscan":
+                    reference_labels = labels
+                agreement = "-"
+                if reference_labels is not None:
+                    agreement = f"{sum(a == b for a, b in zip(labels, reference_labels)) / len(labels):.4f}"
+                precision, recall = precision_recall(labels, truth)
+                print(
+                    f"{n_pages:>6} {len(blocks):>7} {engine:>15} {elapsed:>8.3f} {peak / 2**20:>8.1f} {agreement:>7} "
+                    f"{precision:>6.3f} {recall:>7.3f}"
+                )
+
+if __name__ == "__main__":
+    main()
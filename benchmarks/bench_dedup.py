@@ -0,0 +1,111 @@
+"""
+Near-duplicate detection of section_dedup.SectionDedup on a synthetic corpus : every document has unique sections
+and a share of boilerplate sections drawn from a small pool, each copy with a few words replaced (a changed date,
+name or amount). The indexing time, the precision / recall of the duplicates (a copy of a boilerplate section
+after its first occurrence is a true duplicate, the unique sections must never be one) and the dedup ratio are
+reported for every threshold. A copy is compared with the first copy (its canonical section), not with the
+original text, so two copies differ by up to twice the edits.
+
+usage : python benchmarks/bench_dedup.py --documents 200
+        python benchmarks/bench_dedup.py --documents 1000 --edits 0 2 5 --thresholds 0.8 0.85 0.9
+"""
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_search import make_vocabulary
+from section_dedup import SectionDedup
+
+BOILERPLATE_SECTIONS = 20
+UNIQUE_SECTIONS = 30
+BOILERPLATE_PER_DOCUMENT = 10
+
+def make_text(vocabulary:list, n_words:int, rnd:random.Random) -> str:
+    return " ".join(rnd.choices(vocabulary, k=n_words))
+
+def edit_text(text:str, vocabulary:list, n_edits:int, rnd:random.Random) -> str:
+    words = text.split()
+    for _ in range(n_edits):
+        words[rnd.randrange(len(words))] = rnd.choice(vocabulary)
+    return " ".join(words)
+
+def make_corpus(n_documents:int, n_words:int, n_edits:int, seed:int = 0) -> list:
+    """
+    (doc_id, sections, boilerplate id of every section or None) of the documents
+    """
+    rnd = random.Random(seed)
+    vocabulary = make_vocabulary(rnd)
+    boilerplate = [make_text(vocabulary, n_words, rnd) for _ in range(BOILERPLATE_SECTIONS)]
+    corpus = []
+    for doc_idx in range(n_documents):
+        sources = [None] * UNIQUE_SECTIONS + rnd.sample(range(BOILERPLATE_SECTIONS), BOILERPLATE_PER_DOCUMENT)
+        rnd.shuffle(sources)
+        sections = [
+            {
+                "title": f"section {section_idx}",
+                "page_nos": [section_idx + 1],
+                "content": (
+                    make_text(vocabulary, n_words, rnd) if source is None
+                    else edit_text(boilerplate[source], vocabulary, n_edits, rnd)
+                ),
+            }
+            for section_idx, source in enumerate(sources)
+        ]
+        corpus.append((f"doc_{doc_idx:05d}", sections, sources))
+    return corpus
+
+def run(corpus:list, threshold:float, db_path:Path) -> dict:
+    dedup = SectionDedup(db_path, threshold=threshold)
+    seen = set()
+    true_positives = false_positives = false_negatives = 0
+    start = time.perf_counter()
+    for doc_id, sections, sources in corpus:
+        refs = dedup.add_document(doc_id, sections)
+        for ref, source in zip(refs, sources):
+            expected = source is not None and source in seen
+            true_positives += ref is not None and expected
+            false_positives += ref is not None and not expected
+            false_negatives += ref is None and expected
+            if source is not None:
+                seen.add(source)
+    seconds = time.perf_counter() - start
+    report = dedup.report(top=0)
+    return {
+        "seconds": seconds,
+        "precision": true_positives / max(true_positives + false_positives, 1),
+        "recall": true_positives / max(true_positives + false_negatives, 1),
+        "dedup_ratio": report["dedup_ratio"],
+        "db_mb": db_path.stat().st_size / 2**20,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--words-per-section", type=int, default=150)
+    parser.add_argument("--edits", type=int, nargs="+", default=[0, 1, 3], help="words replaced in every copy")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.8, 0.85, 0.9])
+    args = parser.parse_args()
+
+    n_sections = args.documents * (UNIQUE_SECTIONS + BOILERPLATE_PER_DOCUMENT)
+    print(
+        f"{'edits':>6} {'threshold':>10} {'sections':>9} {'seconds':>8} {'sec/s':>8} {'prec':>6} {'recall':>7} "
+        f"{'ratio':>6} {'db_mb':>6}"
+    )
+    for n_edits in args.edits:
+        corpus = make_corpus(args.documents, args.words_per_section, n_edits)
+        for threshold in args.thresholds:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                result = run(corpus, threshold, Path(tmp_dir) / "dedup.db")
+            print(
+                f"{n_edits:>6} {threshold:>10.2f} {n_sections:>9} {result['seconds']:>8.2f} "
+                f"{n_sections / result['seconds']:>8.0f} {result['precision']:>6.3f} {result['recall']:>7.3f} "
+                f"{result['dedup_ratio']:>6.3f} {result['db_mb']:>6.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
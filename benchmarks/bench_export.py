@@ -0,0 +1,130 @@
+"""
+Load time of parsed documents from the json files compared with the parquet / arrow datasets of dataset_writer.
+Synthetic processed_data json files (sections, toc, tables) are written and compacted into the datasets, then the
+sections of all documents are loaded into a pandas dataframe : from the json files, from the full datasets, with
+column projection (title and page_nos only) and for a single document (partition filter).
+Every load is repeated and the median is reported.
+
+usage : python benchmarks/bench_export.py --documents 500 --sections 200
+        python benchmarks/bench_export.py --documents 2000 --workers 4 --gzip
+"""
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import pandas as pd
+from dataset_writer import DATASET_FORMATS, compact_json_dir, import_pyarrow, open_dataset
+from json_writer import json_suffix, read_json, write_json
+from section_index import json_doc_id
+
+WORDS = [
+    "income", "tax", "exemption", "deduction", "salary", "allowance", "investment", "declaration", "section",
+    "rebate", "assessment", "year", "employee", "employer", "house", "rent", "interest", "loan", "premium", "policy",
+    "pension", "fund", "capital", "gains", "return", "form", "limit", "amount", "payment", "receipt",
+]
+
+def make_document(rnd:random.Random, doc_idx:int, n_sections:int, words_per_section:int) -> dict:
+    """
+    processed_data of a synthetic document, one section per page
+    """
+    sections = []
+    toc = []
+    tables = []
+    for section_idx in range(n_sections):
+        title = " ".join(rnd.choices(WORDS, k=4)).title()
+        toc.append({"page": section_idx + 1, "text": title, "header_tag_md": f"h{rnd.randint(1, 3)}"})
+        sections.append({
+            "title": title,
+            "page_nos": [section_idx + 1],
+            "content": " ".join(rnd.choices(WORDS, k=words_per_section)),
+        })
+        table = []
+        if section_idx % 10 == 0:
+            table = ["|" + "|".join(rnd.choices(WORDS, k=4)) + "|\n|---|---|---|---|\n" + "|1|2|3|4|\n" * 5]
+        tables.append({"page": section_idx + 1, "tables": table})
+    return {
+        "document_name": f"doc_{doc_idx:05d}.pdf",
+        "local_doc_path": f"/data/uploads/doc_{doc_idx:05d}.pdf",
+        "table_of_contentx_(toc)": toc,
+        "tables": tables,
+        "sections": sections,
+    }
+
+def load_json_sections(json_dir:Path) -> pd.DataFrame:
+    """
+    the sections of all json files as one dataframe, the way the downstream jobs load them today
+    """
+    rows = []
+    for json_path in sorted(json_dir.iterdir()):
+        document_id = json_doc_id(json_path)
+        for section_idx, section in enumerate(read_json(json_path)["sections"]):
+            rows.append({"document_id": document_id, "section_idx": section_idx, **section})
+    return pd.DataFrame(rows)
+
+def median_time(fn, repeat:int) -> tuple:
+    """
+    (median seconds, result of the last run)
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+def dir_mb(path:Path) -> float:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file()) / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=500)
+    parser.add_argument("--sections", type=int, default=200, help="sections per document")
+    parser.add_argument("--words-per-section", type=int, default=150)
+    parser.add_argument("--gzip", action="store_true", help="gzip compressed json files")
+    parser.add_argument("--workers", type=int, default=1, help="processes of the compaction")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per load, the median is reported")
+    args = parser.parse_args()
+    pds = import_pyarrow().dataset
+
+    rnd = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_dir = Path(tmp_dir) / "json"
+        json_dir.mkdir()
+        for doc_idx in range(args.documents):
+            document = make_document(rnd, doc_idx, args.sections, args.words_per_section)
+            write_json(json_dir / f"doc_{doc_idx:05d}{json_suffix(args.gzip)}", document, compress=args.gzip)
+        n_sections = args.documents * args.sections
+        print(f"{args.documents} documents :: {n_sections} sections :: json {dir_mb(json_dir):.1f} MB")
+
+        rows = []
+        seconds, frame = median_time(lambda: load_json_sections(json_dir), args.repeat)
+        rows.append(("json", "all columns", seconds, len(frame)))
+        document_id = f"doc_{args.documents // 2:05d}"
+        for format in DATASET_FORMATS:
+            dataset_dir = Path(tmp_dir) / format
+            start = time.perf_counter()
+            compact_json_dir(str(json_dir), str(dataset_dir), format=format, workers=args.workers)
+            print(f"{format} :: compacted in {time.perf_counter() - start:.1f} s :: {dir_mb(dataset_dir):.1f} MB")
+            sections = open_dataset(dataset_dir, "sections", format=format)
+            loads = {
+                "all columns": lambda: sections.to_table().to_pandas(),
+                "title, page_nos": lambda: sections.to_table(columns=["document_id", "title", "page_nos"]).to_pandas(),
+                "one document": lambda: sections.to_table(filter=pds.field("document_id") == document_id).to_pandas(),
+            }
+            for name, load in loads.items():
+                seconds, frame = median_time(load, args.repeat)
+                rows.append((format, name, seconds, len(frame)))
+
+        json_seconds = rows[0][2]
+        print(f"\n{'source':<8} {'load':<16} {'seconds':>8} {'rows':>8} {'speedup':>8}")
+        for source, name, seconds, n_rows in rows:
+            print(f"{source:<8} {name:<16} {seconds:>8.3f} {n_rows:>8} {json_seconds / seconds:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
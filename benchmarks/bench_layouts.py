@@ -0,0 +1,77 @@
+"""
+Header / footer detection with the layout templates of layout_templates.LayoutStore on a series of synthetic
+documents sharing one layout (like a monthly report) : the first document is detected in full and learns the
+template, the following ones are matched against it. Every document is also extracted without templates and the
+time of the detection (categorize + header levels, or the template match), the agreement of the labels and header
+levels with the full detection and the precision / recall against the generated running headers / footers are
+reported. The last document has no running headers, its match is poor and it falls back to the full detection.
+
+usage : python benchmarks/bench_layouts.py --documents 6 --pages 200
+        python benchmarks/bench_layouts.py --pages 1000 --engine repetition
+"""
+import argparse
+import contextlib
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from bench_categorizers import precision_recall
+from layout_templates import LayoutStore
+from pdf_cluster import CATEGORIZER_ENGINES
+from pdf_extractor import PDFExtractor
+from synthetic_pdf import is_running_text, make_synthetic_pdf
+
+DETECTION_STAGES = ("categorize", "header_levels", "layout_match", "layout_learn")
+
+def extract(pdf_path:str, engine:str, layouts:LayoutStore = None) -> PDFExtractor:
+    extractor = PDFExtractor(pdf_path)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        extractor.extract_blocks(extract_tables=False, categorizer_engine=engine, layouts=layouts)
+    return extractor
+
+def detection_seconds(extractor:PDFExtractor) -> float:
+    return sum(extractor.stats.timings.get(stage, 0.0) for stage in DETECTION_STAGES)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=6, help="documents of the series, one more without headers")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--engine", default="dbscan", choices=list(CATEGORIZER_ENGINES))
+    args = parser.parse_args()
+
+    print(
+        f"{'doc':>4} {'pages':>6} {'blocks':>7} {'template':>9} {'full_s':>7} {'layout_s':>9} {'agree':>7} "
+        f"{'levels':>7} {'prec':>6} {'recall':>7}"
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        layouts = LayoutStore(Path(tmp_dir) / "layouts")
+        # warm up the imports of the engines so the first document is not charged for them
+        warm_up_path = str(Path(tmp_dir) / "warm_up.pdf")
+        make_synthetic_pdf(warm_up_path, n_pages=10, seed=-1)
+        extract(warm_up_path, args.engine)
+
+        for doc_idx in range(args.documents + 1):
+            running_headers = doc_idx < args.documents
+            # the page count of a report varies from month to month
+            n_pages = args.pages + 10 * (doc_idx % 3)
+            pdf_path = str(Path(tmp_dir) / f"report_{doc_idx}.pdf")
+            make_synthetic_pdf(pdf_path, n_pages=n_pages, seed=doc_idx, running_headers=running_headers)
+
+            full = extract(pdf_path, args.engine)
+            templated = extract(pdf_path, args.engine, layouts=layouts)
+            labels = templated.labels.tolist()
+            texts = templated.block_store.iter_block_lines(templated.block_store.line_texts())
+            truth = [is_running_text(" ".join(text_lst)) for text_lst in texts]
+            precision, recall = precision_recall(labels, truth)
+            agreement = (templated.labels == full.labels).mean()
+            print(
+                f"{doc_idx:>4} {n_pages:>6} {len(labels):>7} {'hit' if templated.layout_template else 'miss':>9} "
+                f"{detection_seconds(full):>7.3f} {detection_seconds(templated):>9.3f} {agreement:>7.4f} "
+                f"{str(templated.headers.header_id == full.headers.header_id):>7} {precision:>6.3f} {recall:>7.3f}"
+            )
+
+if __name__ == "__main__":
+    main()
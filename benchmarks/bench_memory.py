@@ -0,0 +1,101 @@
+"""
+Peak memory of a full PDFExtractor run on a large synthetic document.
+Every run is done in a fresh python process so that the peak resident set size (ru_maxrss) only covers
+that extraction. --src runs the extraction with the sources of another checkout, e.g. to compare with an
+earlier revision. --memory-budget-mb runs the windowed mode of the extractor and --write-json streams the result
+to a json file (PDFExtractor.write_json) instead of returning it.
+
+usage : python benchmarks/bench_memory.py --pages 1000 --workers 1
+        python benchmarks/bench_memory.py --pages 5000 --write-json --memory-budget-mb 256
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import fitz
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from synthetic_pdf import make_synthetic_pdf
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# runs in the child process, prints the measurements as json on the last line
+CHILD_SCRIPT = """
+import contextlib, io, json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+from pdf_extractor import PDFExtractor
+
+kwargs = json.loads(sys.argv[3])
+json_path = sys.argv[4]
+start = time.perf_counter()
+extractor = PDFExtractor(sys.argv[2])
+with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+    if json_path:
+        extractor.write_json(json_path, outputs=("raw_data", "processed_data"), **kwargs)
+        n_sections = None
+    else:
+        result = extractor.extract_all_text_blocks(**kwargs)
+        n_sections = len(result["processed_data"]["sections"])
+block_store = getattr(extractor, "block_store", None)
+print(json.dumps({
+    "seconds": time.perf_counter() - start,
+    "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "blocks": len(block_store),
+    "sections": n_sections,
+    "block_store_bytes": block_store.nbytes() if hasattr(block_store, "nbytes") else None,
+}))
+"""
+
+def measure(src_dir:str, pdf_path:str, kwargs:dict, json_path:str = "") -> dict:
+    """
+    measurements of one extraction in a fresh process, the peak rss is the one of the main process only
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, src_dir, pdf_path, json.dumps(kwargs), json_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1000])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--table-mode", default="screened")
+    parser.add_argument("--engine", default="dbscan", help="header / footer detection engine")
+    parser.add_argument("--src", default=str(SRC_DIR), help="source directory of the PDFExtractor to measure")
+    parser.add_argument("--memory-budget-mb", type=float, help="run the windowed mode with this memory budget")
+    parser.add_argument("--write-json", action="store_true", help="write the result with write_json")
+    parser.add_argument("--pdf", help="measure this pdf instead of synthetic documents")
+    args = parser.parse_args()
+
+    kwargs = {"workers": args.workers, "table_mode": args.table_mode, "categorizer_engine": args.engine}
+    if args.memory_budget_mb is not None:
+        kwargs["memory_budget_mb"] = args.memory_budget_mb
+
+    print(f"{'pages':>6} {'blocks':>7} {'sections':>9} {'time_s':>8} {'peak_rss_mb':>12} {'store_mb':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_pages in [None] if args.pdf else args.pages:
+            if args.pdf:
+                pdf_path = args.pdf
+                with fitz.open(pdf_path) as doc:
+                    n_pages = len(doc)
+            else:
+                pdf_path = str(Path(tmp_dir) / f"synthetic_{n_pages}.pdf")
+                make_synthetic_pdf(pdf_path, n_pages=n_pages)
+            json_path = str(Path(tmp_dir) / "result.json") if args.write_json else ""
+            result = measure(args.src, pdf_path, kwargs, json_path)
+            store_mb = "-"
+            if result["block_store_bytes"] is not None:
+                store_mb = f"{result['block_store_bytes'] / 2**20:.2f}"
+            sections = "-" if result["sections"] is None else result["sections"]
+            print(
+                f"{n_pages:>6} {result['blocks']:>7} {sections:>9} {result['seconds']:>8.2f} "
+                f"{result['peak_rss_kb'] / 1024:>12.1f} {store_mb:>9}"
+            )
+
+if __name__ == "__main__":
+    main()
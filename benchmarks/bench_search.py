@@ -0,0 +1,101 @@
+"""
+Build and query time of the section full text index (section_index.SectionIndex) on synthetic sections.
+The section texts draw their words from a vocabulary with a zipf distribution, so the queries cover rare,
+medium and very frequent terms. Every query is repeated and the median / 95th percentile latency is reported.
+
+usage : python benchmarks/bench_search.py --sections 100000
+        python benchmarks/bench_search.py --sections 10000 100000 --words-per-section 200 --repeat 50
+"""
+import argparse
+import itertools
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from section_index import SectionIndex
+
+VOCABULARY_SIZE = 50000
+SECTIONS_PER_DOCUMENT = 100
+
+def make_vocabulary(rnd:random.Random) -> list:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rnd.choice(letters) for _ in range(rnd.randint(3, 10))))
+    return sorted(words)
+
+def iter_documents(n_sections:int, words_per_section:int, vocabulary:list, rnd:random.Random):
+    """
+    yields (doc_id, sections) with SECTIONS_PER_DOCUMENT sections per document
+    """
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    for doc_idx in range(0, n_sections, SECTIONS_PER_DOCUMENT):
+        sections = []
+        for section_idx in range(min(SECTIONS_PER_DOCUMENT, n_sections - doc_idx)):
+            words = rnd.choices(vocabulary, cum_weights=cum_weights, k=words_per_section + 3)
+            sections.append({
+                "title": " ".join(words[:3]).title(),
+                "page_nos": [section_idx + 1],
+                "content": " ".join(words[3:]),
+            })
+        yield f"doc_{doc_idx // SECTIONS_PER_DOCUMENT:05d}", sections
+
+def get_queries(vocabulary:list) -> dict:
+    """
+    queries by kind, the vocabulary is sorted by zipf rank (most frequent first)
+    """
+    return {
+        "frequent term": (vocabulary[0], False),
+        "medium term": (vocabulary[500], False),
+        "rare term": (vocabulary[40000], False),
+        "two terms": (f"{vocabulary[10]} {vocabulary[300]}", False),
+        "phrase": (f'"{vocabulary[0]} {vocabulary[1]}"', True),
+        "prefix": (f"{vocabulary[100][:3]}*", True),
+        "or": (f"{vocabulary[2000]} OR {vocabulary[3000]}", True),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, nargs="+", default=[100000])
+    parser.add_argument("--words-per-section", type=int, default=120)
+    parser.add_argument("--limit", type=int, default=10, help="hits per query")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per query")
+    args = parser.parse_args()
+
+    for n_sections in args.sections:
+        rnd = random.Random(0)
+        # ranked by frequency : the zipf weights are assigned in this order
+        vocabulary = make_vocabulary(rnd)
+        rnd.shuffle(vocabulary)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = SectionIndex(Path(tmp_dir) / "index.db")
+            # only the time of add_document, not of generating the sections
+            build_s = 0.0
+            for doc_id, sections in iter_documents(n_sections, args.words_per_section, vocabulary, rnd):
+                start = time.perf_counter()
+                index.add_document(doc_id, sections, document_name=f"{doc_id}.pdf", json_file=f"{doc_id}.json")
+                build_s += time.perf_counter() - start
+            stats = index.stats()
+            print(
+                f"\n{stats['sections']} sections of {args.words_per_section} words in {stats['documents']} documents :: "
+                f"indexed in {build_s:.1f} s ({stats['sections'] / build_s:.0f} sections/s) :: "
+                f"{stats['bytes'] / 2**20:.1f} MB"
+            )
+            print(f"{'query':<15} {'hits':>5} {'median_ms':>10} {'p95_ms':>8}")
+            for kind, (query, raw) in get_queries(vocabulary).items():
+                latencies = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    hits = index.search(query, limit=args.limit, raw=raw)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                latencies.sort()
+                p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+                print(f"{kind:<15} {len(hits):>5} {statistics.median(latencies):>10.2f} {p95:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Benchmark of the section / toc construction of PDFExtractor on large synthetic documents.
+Compares the current implementation with the previous iterrows based one and checks that both build the
+same sections.
+
+usage : python benchmarks/bench_sections.py --pages 200 1000 5000 --headings-per-page 3
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from block_store import BlockStore
+from pdf_extractor import PDFExtractor
+
+WORDS = "income tax exemption section clause allowance deduction salary rent house property capital gains".split()
+HEADER_ID = {20: "# ", 16: "## ", 14: "### "}
+BODY_SIZE = 11
+
+def synthetic_extractor(
+        n_pages:int, blocks_per_page:int = 12, headings_per_page:int = 3, seed:int = 0
+        ) -> PDFExtractor:
+    """
+    PDFExtractor with the block store and labels set as by extract_blocks, with random headings between
+    multi line paragraphs
+    """
+    rnd = random.Random(seed)
+    heading_prob = headings_per_page / blocks_per_page
+    page_stores = []
+    for page in range(1, n_pages + 1):
+        blocks = []
+        for blk in range(blocks_per_page):
+            if rnd.random() < heading_prob:
+                lines = [(f"{rnd.choice(WORDS).title()} {page}.{blk}", rnd.choice(list(HEADER_ID)))]
+            else:
+                n_lines = rnd.randint(1, 6)
+                # some empty lines, they are dropped from the sections
+                lines = [
+                    (" ".join(rnd.choice(WORDS) for _ in range(10)) if rnd.random() > 0.05 else " ", BODY_SIZE)
+                    for _ in range(n_lines)
+                ]
+            blocks.append(
+                {
+                    "type": 0,
+                    "number": blk,
+                    "bbox": (72.0, 80.0 + blk * 50, 520.0, 120.0 + blk * 50),
+                    "lines": [{"spans": [{"text": txt, "size": size}]} for txt, size in lines],
+                }
+            )
+        page_stores.append(BlockStore.from_page_blocks(page, blocks))
+
+    extractor = PDFExtractor.__new__(PDFExtractor)
+    extractor.block_store = BlockStore.concat(page_stores)
+    extractor.block_store.assign_headers(HEADER_ID)
+    extractor.labels = np.zeros(len(extractor.block_store), dtype=np.int8)
+    return extractor
+
+def legacy_sections(pdf_data:pd.DataFrame) -> list:
+    """
+    the previous iterrows based section construction, kept as the reference implementation
+    """
+    expl_data = pdf_data[pdf_data["cluster"] == 0].copy()
+    expl_data = expl_data.explode("text_and_tag")
+    expl_data.reset_index(drop = True, inplace = True)
+
+    ind_to_drop = []
+    for ind, rec in expl_data.iterrows():
+        if rec["text_and_tag"]["txt"].strip() == "":
+            ind_to_drop.append(ind)
+
+    expl_data.drop(index = ind_to_drop, inplace = True)
+    expl_data.reset_index(drop = True, inplace =True)
+
+    expl_data["text"] = [d["txt"] for d in expl_data["text_and_tag"]]
+    expl_data["header_tag"] = [d["tag"] for d in expl_data["text_and_tag"]]
+    expl_data["header_tag"] = ["".join(lst) for lst in expl_data["header_tag"]]
+
+    h_tags = expl_data["header_tag"].value_counts().index.tolist()
+    h_tags = [tag for tag in h_tags if tag != ""]
+    h_tags.sort()
+    if len(h_tags) > 6:
+        h_tags = h_tags[:6]
+    h_tags_map = {ele: f"h{ele.count('#')}" for ele in h_tags}
+    h_tags_map = {key: val for key, val in h_tags_map.items() if int(val[1:]) <= 6}
+    expl_data["header_tag_md"] = expl_data["header_tag"].map(h_tags_map)
+
+    header_df = expl_data.dropna(subset="header_tag_md")[["header_tag", "header_tag_md", "text"]].copy()
+    header_df.reset_index(drop=False , inplace=True)
+    header_df["start_index"] = header_df["index"] + 1
+    header_df["end_index"] = header_df["index"].shift(-1)
+    header_df["end_index"] = header_df["end_index"].fillna(expl_data.shape[0])
+
+    if header_df.iloc[0]["start_index"] != 0:
+        init_header_df = pd.DataFrame(
+            [[0, "no_tag", "h0", "**no_header**", 0, header_df.iloc[0]["start_index"] - 1]],
+            columns=header_df.columns,
+        )
+        header_df = pd.concat([init_header_df, header_df])
+    header_df.reset_index(drop = True, inplace = True)
+    header_df["end_index"] = header_df["end_index"].astype(int)
+
+    sections = []
+    for ind, rec in header_df.iterrows():
+        sub_dt = expl_data.iloc[rec["start_index"] : rec["end_index"]].copy()
+        sections.append(
+            {
+                "title" : rec["text"],
+                "page_nos": list(dict.fromkeys(sub_dt["page"].values.tolist()).keys()),
+                "content": "\n".join(sub_dt["text"].values.tolist()),
+            }
+        )
+    return sections
+
+def current_sections(extractor:PDFExtractor) -> list:
+    """
+    section construction of PDFExtractor on an already extracted block store
+    """
+    header_df = extractor.build_header_index()
+    return list(extractor.iter_header_sections(header_df))
+
+def timed(func, *args) -> tuple:
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[200, 1000, 5000])
+    parser.add_argument("--blocks-per-page", type=int, default=12)
+    parser.add_argument("--headings-per-page", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="only time the current implementation")
+    args = parser.parse_args()
+
+    print(f"{'pages':>7} {'lines':>8} {'sections':>9} {'legacy_s':>9} {'current_s':>10} {'speedup':>8}")
+    for n_pages in args.pages:
+        extractor = synthetic_extractor(n_pages, args.blocks_per_page, args.headings_per_page)
+        n_lines = extractor.block_store.n_lines
+        current_time, sections = timed(current_sections, extractor)
+        if args.skip_legacy:
+            print(f"{n_pages:>7} {n_lines:>8} {len(sections):>9} {'-':>9} {current_time:>10.3f} {'-':>8}")
+            continue
+        legacy_time, legacy = timed(legacy_sections, extractor.pdf_data)
+        if legacy != sections:
+            raise AssertionError(f"sections differ from the legacy implementation for {n_pages} pages")
+        print(
+            f"{n_pages:>7} {n_lines:>8} {len(sections):>9} {legacy_time:>9.3f} {current_time:>10.3f} "
+            f"{legacy_time / current_time:>7.1f}x"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Cold start latency of the extraction stack : the import time of pdf_extractor, the time until a process pool is
+ready and the latency of its first and second pdf, with and without the warm up initializer (pdf_extractor.warm_up).
+--api measures the Fast API service as well : the time until the app has started (lifespan, which warms the
+workers with PDF_PARSER_WARM_WORKERS) and the latency of the first /parsepdf/ task (needs httpx).
+Every measurement is done in a fresh python process. --src measures the sources of another checkout, e.g. to
+compare with an earlier revision (only the cold runs if it has no warm up).
+
+usage : python benchmarks/bench_startup.py --pages 20
+        python benchmarks/bench_startup.py --api --repeat 3 --src ../baseline/src
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from synthetic_pdf import make_synthetic_pdf
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+# runs in the child process, prints the measurements as json on the last line
+POOL_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import pdf_extractor
+from batch import process_document
+import_s = time.perf_counter() - start
+
+from concurrent.futures import ProcessPoolExecutor
+pdf_path, engine, warm = sys.argv[2], sys.argv[3], sys.argv[4] == "warm"
+options = {"outputs": ("processed_data",), "gzip": False, "cache": None, "extract": {"categorizer_engine": engine}}
+initializer = pdf_extractor.warm_up if warm else None
+with ProcessPoolExecutor(max_workers=1, initializer=initializer, initargs=(engine,) if warm else ()) as pool:
+    start = time.perf_counter()
+    if warm:
+        # the workers are started by the first submitted task
+        pool.submit(os.getpid).result()
+    ready_s = time.perf_counter() - start
+    latencies = []
+    for _ in range(2):
+        start = time.perf_counter()
+        record = pool.submit(process_document, pdf_path, options).result()
+        assert record["status"] == "completed", record["status"]
+        latencies.append(time.perf_counter() - start)
+print(json.dumps({"import_s": import_s, "ready_s": ready_s, "first_s": latencies[0], "second_s": latencies[1]}))
+"""
+
+API_SCRIPT = """
+import json, logging, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+import asgi
+from fastapi.testclient import TestClient
+import_s = time.perf_counter() - start
+logging.getLogger().setLevel(logging.WARNING)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+pdf_path = sys.argv[2]
+start = time.perf_counter()
+with TestClient(asgi.app) as client:
+    ready_s = time.perf_counter() - start
+    start = time.perf_counter()
+    with open(pdf_path, "rb") as f:
+        response = client.post("/parsepdf/", files=[("files", (os.path.basename(pdf_path), f, "application/pdf"))])
+    task_id = response.json()["tasks"][0]["task_id"]
+    while True:
+        status = client.get(f"/task_status/{task_id}/").json()["status"]
+        if status == "completed" or status.startswith("failed"):
+            break
+        time.sleep(0.01)
+    first_s = time.perf_counter() - start
+    assert status == "completed", status
+    json_files = [path.name for path in asgi.JSON_DIR.glob(f"{os.path.basename(pdf_path)[:-4]}*")]
+print(json.dumps({
+    "import_s": import_s, "ready_s": ready_s, "first_s": first_s, "second_s": None,
+    "upload_dir": str(asgi.UPLOAD_DIR), "json_dir": str(asgi.JSON_DIR), "json_files": json_files,
+}))
+"""
+
+def measure(script:str, args:list, env:dict = None, cwd:str = None) -> dict:
+    """
+    measurements of the script run in a fresh process
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", script, *args], check=True, capture_output=True, text=True,
+        env={**os.environ, **(env or {})}, cwd=cwd,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def has_warm_up(src_dir:str) -> bool:
+    return "def warm_up(" in (Path(src_dir) / "pdf_extractor.py").read_text(encoding="utf-8")
+
+def cleanup_api_files(pdf_path:str, result:dict):
+    """
+    removes the upload and the json file the service wrote to its data directory
+    """
+    content_hash = hashlib.sha256(Path(pdf_path).read_bytes()).hexdigest()
+    for path in [Path(result["upload_dir"]) / f"{content_hash}.pdf", Path(result["upload_dir"]) / Path(pdf_path).name]:
+        path.unlink(missing_ok=True)
+    for file_name in result["json_files"]:
+        (Path(result["json_dir"]) / file_name).unlink(missing_ok=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=20, help="pages of the synthetic document")
+    parser.add_argument("--pdf", help="measure this pdf instead of a synthetic document")
+    parser.add_argument("--engine", default="dbscan", help="header / footer detection engine")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement, the median is reported")
+    parser.add_argument("--api", action="store_true", help="measure the Fast API service as well")
+    parser.add_argument("--src", default=str(SRC_DIR), help="source directory to measure")
+    parser.add_argument("--output", help="write the results as json to this file")
+    args = parser.parse_args()
+
+    modes = ["cold", "warm"] if has_warm_up(args.src) else ["cold"]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = args.pdf
+        if pdf_path is None:
+            pdf_path = str(Path(tmp_dir) / f"startup_{os.getpid()}.pdf")
+            make_synthetic_pdf(pdf_path, n_pages=args.pages)
+
+        for mode in modes:
+            runs = [measure(POOL_SCRIPT, [args.src, pdf_path, args.engine, mode]) for _ in range(args.repeat)]
+            results[f"pool_{mode}"] = runs
+            if not args.api:
+                continue
+            runs = []
+            for run_idx in range(args.repeat):
+                # every run gets an empty result cache, the page cache is off, asgi writes app.log to its cwd
+                env = {
+                    "PDF_PARSER_WARM_WORKERS": str(mode == "warm").lower(),
+                    "PDF_PARSER_WORKERS": "1",
+                    "PDF_PARSER_CACHE_DIR": str(Path(tmp_dir) / f"cache_{mode}_{run_idx}"),
+                    "PDF_PARSER_PAGE_CACHE_MAX_MB": "0",
+                    "PDF_PARSER_CATEGORIZER": args.engine,
+                }
+                result = measure(API_SCRIPT, [args.src, pdf_path], env=env, cwd=tmp_dir)
+                cleanup_api_files(pdf_path, result)
+                runs.append(result)
+            results[f"api_{mode}"] = runs
+
+    print(f"{'run':<10} {'import_s':>9} {'ready_s':>8} {'first_s':>8} {'second_s':>9} {'ready+first_s':>14}")
+    summary = {}
+    for name, runs in results.items():
+        row = {
+            key: statistics.median(run[key] for run in runs) if runs[0][key] is not None else None
+            for key in ("import_s", "ready_s", "first_s", "second_s")
+        }
+        row["ready_first_s"] = statistics.median(run["ready_s"] + run["first_s"] for run in runs)
+        summary[name] = row
+        second = "-" if row["second_s"] is None else f"{row['second_s']:.3f}"
+        print(
+            f"{name:<10} {row['import_s']:>9.3f} {row['ready_s']:>8.3f} {row['first_s']:>8.3f} {second:>9} "
+            f"{row['ready_first_s']:>14.3f}"
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"src": args.src, "engine": args.engine, "summary": summary, "runs": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Benchmark suite of the pdf parser on synthetic documents.
+Times and memory profiles every stage of PDFExtractor and of the header / footer categorizers, measures the
+end-to-end throughput of the Fast API service (asgi.py) with a local test client and writes the results as json.
+A previous result file can be given with --compare to report the stages that got slower.
+
+usage : python benchmarks/bench_suite.py --pages 50 200 1000 --output bench_results.json
+        python benchmarks/bench_suite.py --pages 50 200 1000 --compare bench_results.json
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import fitz
+import numpy as np
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+from block_store import BlockStore
+from pdf_cluster import CATEGORIZER_ENGINES, get_categorizer
+from pdf_extractor import TABLE_MODES, PDFExtractor
+from synthetic_pdf import make_synthetic_pdf
+
+RESULT_FORMAT = 1
+
+class StageRecorder:
+    """
+    records the run time of every stage, or with trace_memory the peak traced python memory of every stage
+    """
+
+    def __init__(self, trace_memory:bool = False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name:str):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_bytes, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            yield
+        if self.trace_memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            self.stages[name] = {"peak_bytes": peak_bytes - start_bytes}
+        else:
+            self.stages[name] = {"seconds": time.perf_counter() - start}
+
+def run_stages(pdf_path:str, table_mode:str, engines:list, recorder:StageRecorder) -> dict:
+    """
+    runs the stages of PDFExtractor.extract_all_text_blocks one after the other, returns the document counters
+    """
+    with recorder.stage("open"):
+        extractor = PDFExtractor(pdf_path)
+
+    with recorder.stage("page_text"):
+        records = list(extractor.iter_page_records(table_mode="off"))
+
+    n_tables = 0
+    with recorder.stage("tables"):
+        for page in extractor.pdf_doc:
+            if table_mode == "exhaustive" or (table_mode == "screened" and extractor.is_table_candidate(page)):
+                n_tables += len(page.find_tables().tables)
+
+    with recorder.stage("headers"):
+        for record in records:
+            extractor.headers.add_fontsizes(record.fontsizes)
+        extractor.headers.compute_header_id()
+
+    with recorder.stage("block_store"):
+        extractor.block_store = BlockStore.concat([record.blocks for record in records])
+        extractor.block_store.assign_headers(extractor.headers.header_id)
+    del records
+    extractor.tables_dict_lst = []
+
+    labels = {}
+    for engine in engines:
+        with recorder.stage(f"categorize_{engine}"):
+            categorizer = get_categorizer(engine, extractor.get_categorize_vectors())
+            categorizer.run()
+        labels[engine] = categorizer.labels
+    extractor.labels = np.array(labels[engines[0]], dtype=np.int8)
+
+    with recorder.stage("sections"):
+        sections = list(extractor.iter_processed_sections(process_data=True))
+
+    with recorder.stage("raw_data"):
+        raw_sections = list(extractor.iter_raw_records())
+
+    with recorder.stage("serialize"):
+        n_bytes = len(json.dumps({"raw_data": raw_sections, "processed_data": sections}, indent=4))
+
+    extractor.pdf_doc.close()
+    return {
+        "blocks": len(extractor.block_store),
+        "lines": extractor.block_store.n_lines,
+        "tables": n_tables,
+        "sections": len(sections),
+        "json_bytes": n_bytes,
+    }
+
+def profile_document(pdf_path:str, table_mode:str, engines:list) -> dict:
+    """
+    stage timings of a first run and the stage peak memory of a second, traced run (tracing slows python down)
+    """
+    timing = StageRecorder()
+    counters = run_stages(pdf_path, table_mode, engines, timing)
+
+    memory = StageRecorder(trace_memory=True)
+    tracemalloc.start()
+    try:
+        run_stages(pdf_path, table_mode, engines, memory)
+    finally:
+        tracemalloc.stop()
+
+    stages = {name: {**stage, **memory.stages[name]} for name, stage in timing.stages.items()}
+    counters["total_seconds"] = sum(stage["seconds"] for stage in stages.values())
+    counters["stages"] = stages
+    return counters
+
+def run_end_to_end(tmp_dir:str, n_docs:int, n_pages:int, doc_options:dict, timeout:float) -> dict:
+    """
+    uploads n_docs synthetic pdfs to /parsepdf/ of the Fast API app and waits until all tasks are done
+    the caches and stores of the service are pointed to an empty directory so that every pdf is extracted and the
+    data directory of the repository is left alone
+    """
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError as e:
+        return {"skipped": f"fastapi test client not available :: {str(e)}"}
+
+    # asgi.DATA_DIR is absolute, the working directory does not move its stores. The page cache and the layout
+    # templates of an earlier run would skip the extraction of the pages
+    for variable, name in {
+        "PDF_PARSER_CACHE_DIR": "e2e_cache",
+        "PDF_PARSER_PAGE_CACHE_DIR": "e2e_page_cache",
+        "PDF_PARSER_LAYOUT_DIR": "e2e_layouts",
+        "PDF_PARSER_DATASET_DIR": "e2e_datasets",
+        "PDF_PARSER_JOB_DB": "e2e_jobs.db",
+        "PDF_PARSER_SECTION_INDEX_DB": "e2e_section_index.db",
+        "PDF_PARSER_DEDUP_DB": "e2e_section_dedup.db",
+    }.items():
+        os.environ[variable] = str(Path(tmp_dir) / name)
+    cwd = os.getcwd()
+    # asgi writes its app.log to the working directory
+    os.chdir(tmp_dir)
+    try:
+        import asgi
+    finally:
+        os.chdir(cwd)
+    # the per request logs of the service and of the test client would flood the report
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    run_id = uuid.uuid4().hex[:8]
+    files = []
+    for doc_idx in range(n_docs):
+        pdf_bytes = make_synthetic_pdf(n_pages=n_pages, seed=1000 + doc_idx, **doc_options)
+        files.append(("files", (f"bench_{run_id}_{doc_idx}.pdf", pdf_bytes, "application/pdf")))
+
+    statuses = {}
+    try:
+        with TestClient(asgi.app) as client:
+            start = time.perf_counter()
+            response = client.post("/parsepdf/", files=files)
+            response.raise_for_status()
+            pending = {task["task_id"] for task in response.json()["tasks"]}
+            while pending and time.perf_counter() - start < timeout:
+                for task_id in list(pending):
+                    status = client.get(f"/task_status/{task_id}/").json()["status"]
+                    if status == "completed" or status.startswith("failed"):
+                        statuses[task_id] = status
+                        pending.discard(task_id)
+                time.sleep(0.05)
+            elapsed = time.perf_counter() - start
+    finally:
+        # uploads are stored by content hash, the json files are named after the file name and the hash
+        for _, (file_name, pdf_bytes, _) in files:
+            content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+            (asgi.UPLOAD_DIR / f"{content_hash}.pdf").unlink(missing_ok=True)
+            for json_path in asgi.JSON_DIR.glob(f"{Path(file_name).stem}-{content_hash[:12]}.json*"):
+                json_path.unlink()
+
+    n_completed = sum(1 for status in statuses.values() if status == "completed")
+    return {
+        "docs": n_docs,
+        "pages_per_doc": n_pages,
+        "workers": asgi.MAX_WORKERS,
+        "completed": n_completed,
+        "failed": len(statuses) - n_completed,
+        "timed_out": n_docs - len(statuses),
+        "seconds": elapsed,
+        "docs_per_sec": n_completed / elapsed,
+        "pages_per_sec": n_completed * n_pages / elapsed,
+    }
+
+def get_version_info() -> dict:
+    """
+    revision and library versions the results were measured with
+    """
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        revision = None
+    return {
+        "git_revision": revision,
+        "python": platform.python_version(),
+        "pymupdf": fitz.VersionBind,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def compare_results(baseline:dict, results:dict, tolerance:float) -> list:
+    """
+    (document pages, stage, baseline seconds, seconds) of the stages more than tolerance slower than the baseline
+    """
+    baseline_docs = {doc["pages"]: doc for doc in baseline["documents"]}
+    regressions = []
+    for doc in results["documents"]:
+        baseline_doc = baseline_docs.get(doc["pages"])
+        if baseline_doc is None:
+            continue
+        stage_seconds = {name: stage["seconds"] for name, stage in doc["stages"].items()}
+        stage_seconds["total"] = doc["total_seconds"]
+        baseline_seconds = {name: stage["seconds"] for name, stage in baseline_doc["stages"].items()}
+        baseline_seconds["total"] = baseline_doc["total_seconds"]
+        for name, seconds in stage_seconds.items():
+            if name in baseline_seconds and seconds > baseline_seconds[name] * (1 + tolerance):
+                regressions.append((doc["pages"], name, baseline_seconds[name], seconds))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--heading-depth", type=int, default=3)
+    parser.add_argument("--headings-per-page", type=float, default=2.0)
+    parser.add_argument("--table-density", type=float, default=0.1)
+    parser.add_argument("--no-running-headers", action="store_true")
+    parser.add_argument("--table-mode", default="screened", choices=TABLE_MODES)
+    parser.add_argument("--engines", nargs="+", default=list(CATEGORIZER_ENGINES), choices=list(CATEGORIZER_ENGINES))
+    parser.add_argument("--e2e-docs", type=int, default=4, help="number of pdfs uploaded to the api, 0 to skip")
+    parser.add_argument("--e2e-pages", type=int, default=20)
+    parser.add_argument("--e2e-timeout", type=float, default=600)
+    parser.add_argument("--output", help="json file the results are written to")
+    parser.add_argument("--compare", help="json results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slow down before a stage is reported")
+    args = parser.parse_args()
+
+    doc_options = {
+        "heading_depth": args.heading_depth,
+        "headings_per_page": args.headings_per_page,
+        "table_density": args.table_density,
+        "running_headers": not args.no_running_headers,
+    }
+    results = {
+        "format": RESULT_FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "version": get_version_info(),
+        "config": {**doc_options, "table_mode": args.table_mode, "engines": args.engines},
+        "documents": [],
+        "end_to_end": None,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_pages in args.pages:
+            pdf_path = str(Path(tmp_dir) / f"synthetic_{n_pages}.pdf")
+            make_synthetic_pdf(pdf_path, n_pages=n_pages, **doc_options)
+            doc = profile_document(pdf_path, args.table_mode, args.engines)
+            doc["pages"] = n_pages
+            results["documents"].append(doc)
+
+            print(f"\n{n_pages} pages :: {doc['blocks']} blocks :: {doc['tables']} tables :: {doc['sections']} sections")
+            print(f"{'stage':>24} {'time_s':>8} {'peak_mb':>8}")
+            for name, stage in doc["stages"].items():
+                print(f"{name:>24} {stage['seconds']:>8.3f} {stage['peak_bytes'] / 2**20:>8.1f}")
+            print(f"{'total':>24} {doc['total_seconds']:>8.3f}")
+
+        if args.e2e_docs > 0:
+            results["end_to_end"] = run_end_to_end(tmp_dir, args.e2e_docs, args.e2e_pages, doc_options, args.e2e_timeout)
+            print(f"\nend to end :: {json.dumps(results['end_to_end'])}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.tolerance)
+        print(f"\ncompared with {args.compare} ({baseline['version'].get('git_revision')}) :: tolerance {args.tolerance:.0%}")
+        for n_pages, name, baseline_seconds, seconds in regressions:
+            print(f"REGRESSION {n_pages} pages :: {name} :: {baseline_seconds:.3f}s -> {seconds:.3f}s")
+        if regressions:
+            sys.exit(1)
+        print("no regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Synthetic pdf generator for the benchmarks.
+Builds documents with numbered headings, paragraphs, running headers / footers with page numbers and ruled tables.
+The generated running headers / footers (see is_running_text) are the ground truth of the header / footer engines
+in bench_categorizers and bench_layouts, the documents are also the corpus of bench_suite, bench_memory and
+bench_startup.
+
+usage : python benchmarks/synthetic_pdf.py out.pdf --pages 500 --heading-depth 3 --table-density 0.2
+"""
+import argparse
+import random
+
+import fitz
+
+WORDS = (
+    "income tax exemption section clause allowance deduction salary rent house property capital gains "
+    "assessment return employer benefit interest dividend pension gratuity leave travel"
+).split()
+
+RUNNING_HEADER = "Synthetic Annual Report"
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+LEFT_MARGIN, TOP_MARGIN, BOTTOM_MARGIN = 72, 80, 760
+BODY_FONTSIZE = 10
+# font size of the heading levels 1, 2, 3 ... larger than the body text so that they are identified as headers
+HEADING_FONTSIZES = [20, 16, 13, 12, 11.5, 11]
+
+def running_footer(page_no:int, n_pages:int) -> str:
+    return f"Page {page_no} of {n_pages}"
+
+def is_running_text(text:str) -> bool:
+    """
+    whether the block text is one of the generated running headers / footers
+    """
+    text = " ".join(text.split())
+    return text == RUNNING_HEADER or (text.startswith("Page ") and " of " in text)
+
+def draw_table(page, top:float, n_rows:int, n_cols:int, rnd:random.Random) -> float:
+    """
+    ruled table with cell borders at the given top position, returns its bottom
+    """
+    col_width, row_height = (PAGE_WIDTH - 2 * LEFT_MARGIN) / n_cols, 18
+    bottom = top + n_rows * row_height
+    for row in range(n_rows + 1):
+        page.draw_line((LEFT_MARGIN, top + row * row_height), (PAGE_WIDTH - LEFT_MARGIN, top + row * row_height))
+    for col in range(n_cols + 1):
+        page.draw_line((LEFT_MARGIN + col * col_width, top), (LEFT_MARGIN + col * col_width, bottom))
+    for row in range(n_rows):
+        for col in range(n_cols):
+            cell = rnd.choice(WORDS) if row == 0 else str(rnd.randint(0, 99999))
+            page.insert_text(
+                (LEFT_MARGIN + col * col_width + 4, top + row * row_height + 13), cell, fontsize=BODY_FONTSIZE
+            )
+    return bottom
+
+def make_synthetic_pdf(
+        path:str = None, n_pages:int = 100, heading_depth:int = 3, headings_per_page:float = 2.0,
+        table_density:float = 0.1, running_headers:bool = True, seed:int = 0,
+        ) -> bytes:
+    """
+    generate a synthetic pdf, writes it to path when given and returns the pdf bytes
+    :: Args ::
+        Param :: heading_depth :: number of heading levels (1 to 6)
+        Param :: headings_per_page :: average number of headings per page
+        Param :: table_density :: fraction of pages with a ruled table
+        Param :: running_headers :: add a running header and a "Page x of n" footer to every page
+    """
+    rnd = random.Random(seed)
+    heading_depth = max(1, min(heading_depth, len(HEADING_FONTSIZES)))
+    heading_numbers = [0] * heading_depth
+    doc = fitz.open()
+    for page_idx in range(n_pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        if running_headers:
+            page.insert_text((LEFT_MARGIN, 40), RUNNING_HEADER, fontsize=9)
+            page.insert_text((PAGE_WIDTH / 2 - 30, 810), running_footer(page_idx + 1, n_pages), fontsize=9)
+
+        table_top = None
+        if rnd.random() < table_density:
+            table_top = rnd.uniform(TOP_MARGIN + 100, BOTTOM_MARGIN - 200)
+
+        y = TOP_MARGIN
+        while y < BOTTOM_MARGIN:
+            if table_top is not None and y >= table_top:
+                y = draw_table(page, y, rnd.randint(3, 8), rnd.randint(2, 5), rnd) + 24
+                table_top = None
+            elif rnd.random() < headings_per_page / 8:
+                level = rnd.randint(0, heading_depth - 1)
+                heading_numbers[level] += 1
+                heading_numbers[level + 1:] = [0] * (heading_depth - level - 1)
+                number = ".".join(str(num) for num in heading_numbers[:level + 1])
+                fontsize = HEADING_FONTSIZES[level]
+                page.insert_text((LEFT_MARGIN, y + fontsize), f"{number} {rnd.choice(WORDS).title()}", fontsize=fontsize)
+                y += fontsize + 14
+            else:
+                for _ in range(rnd.randint(2, 6)):
+                    if y >= BOTTOM_MARGIN:
+                        break
+                    line = " ".join(rnd.choice(WORDS) for _ in range(11))
+                    page.insert_text((LEFT_MARGIN, y + BODY_FONTSIZE), line, fontsize=BODY_FONTSIZE)
+                    y += BODY_FONTSIZE + 3
+                y += 12
+
+    pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    if path is not None:
+        with open(path, "wb") as f:
+            f.write(pdf_bytes)
+    return pdf_bytes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--heading-depth", type=int, default=3)
+    parser.add_argument("--headings-per-page", type=float, default=2.0)
+    parser.add_argument("--table-density", type=float, default=0.1)
+    parser.add_argument("--no-running-headers", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_synthetic_pdf(
+        args.path, n_pages=args.pages, heading_depth=args.heading_depth, headings_per_page=args.headings_per_page,
+        table_density=args.table_density, running_headers=not args.no_running_headers, seed=args.seed,
+    )
+
+if __name__ == "__main__":
+    main()
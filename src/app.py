@@ -1,23 +1,65 @@
 # streamlit app file
-import os 
-import json
-import tempfile
+import os
 
 import streamlit as st
-from pdf_extractor import PDFExtractor
+from app_jobs import ParseJobs
 
-def save_json(data, filename):
+# seconds between two refreshes of the progress while pdfs are parsed
+REFRESH_SECONDS = 1.0
+
+@st.cache_resource
+def get_jobs() -> ParseJobs:
+    """
+    background process pool of the app, shared by all sessions and kept across reruns
+    """
+    return ParseJobs()
+
+def show_status(jobs:ParseJobs) -> bool:
     """
+    shows the overall and per file progress of the uploaded pdfs, returns whether all of them are finished
     """
-    with open(filename, "w") as f:
-        json.dump(data, f, indent=4)
+    files = st.session_state.processed_files
+    statuses = jobs.statuses([content_hash for content_hash, _ in files])
+    n_finished = sum(status["state"] in ("completed", "failed", "unknown") for status in statuses)
+    st.progress(n_finished / len(files), f"Parsed {n_finished} of {len(files)} PDF files")
+
+    for (_, file_name), status in zip(files, statuses):
+        if status["state"] == "queued":
+            st.progress(0.0, f"{file_name} :: queued")
+        elif status["state"] == "running":
+            if status["pages"]:
+                st.progress(
+                    status["pages_done"] / status["pages"],
+                    f"{file_name} :: page {status['pages_done']} of {status['pages']}",
+                )
+            else:
+                st.progress(0.0, f"{file_name} :: opening")
+        elif status["state"] == "completed":
+            if status["cached"]:
+                st.success(f"Processed {file_name} (parsed before)")
+            else:
+                st.success(f"Processed {file_name} :: {status['pages']} pages in {status['seconds']:.1f} s")
+        elif status["state"] == "failed":
+            st.error(f"Failed to parse {file_name} :: {status['error']}")
+    return n_finished == len(files)
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def show_live_status(jobs:ParseJobs):
+    """
+    refreshes the progress without rerunning the whole app, the app is rerun once to show the downloads when
+    all pdfs are finished
+    """
+    if show_status(jobs):
+        st.rerun()
 
 def main():
     """
     """
     st.title("PDF Parser")
+    jobs = get_jobs()
 
     if "processed_files" not in st.session_state:
+        # (content hash, file name) of the uploaded pdfs
         st.session_state.processed_files = []
 
     with st.form("upload-form", clear_on_submit=True):
@@ -26,43 +68,35 @@ def main():
 
     if uploaded_files and submitted:
         st.write("Files uploaded successfully")
-        progress_bar = st.progress(0, "Parsing the PDF files")
-        total_files = len(uploaded_files)
-
-        for i, uploaded_file in enumerate(uploaded_files):
-            if uploaded_file is not None:
-                temp_dir = tempfile.gettempdir()
-                temp_file_path = os.path.join(temp_dir, f"{uploaded_file.name}")
-                with open(temp_file_path, "wb") as temp_file:
-                    temp_file.write(uploaded_file.read())
-            
-                extractor = PDFExtractor(temp_file_path)
-                data = extractor.extract_all_text_blocks(process_data=True, extract_tables=True, plot_cluster=False)
+        # the pdfs are parsed in the background, a pdf parsed before (same content) is not parsed again
+        for uploaded_file in uploaded_files:
+            content_hash = jobs.submit(uploaded_file.name, uploaded_file.getvalue())
+            if (content_hash, uploaded_file.name) not in st.session_state.processed_files:
+                st.session_state.processed_files.append((content_hash, uploaded_file.name))
 
-                output_filename = f"{os.path.splitext(uploaded_file.name)[0]}.json"
-                temp_json_path = os.path.join(temp_dir, output_filename)
-                save_json(data["processed_data"], temp_json_path)
+    files = st.session_state.processed_files
+    if files:
+        statuses = jobs.statuses([content_hash for content_hash, _ in files])
+        if any(status["state"] in ("queued", "running") for status in statuses):
+            show_live_status(jobs)
+        else:
+            show_status(jobs)
+            st.subheader("Download Processed Files")
+            for (_, file_name), status in zip(files, statuses):
+                if status["state"] != "completed" or not status["json_path"].exists():
+                    continue
+                output_filename = f"{os.path.splitext(file_name)[0]}.json"
+                with open(status["json_path"], "rb") as f:
+                    st.download_button(label=f"Download {output_filename}",
+                                       data=f,
+                                       file_name=output_filename,
+                                       mime="application/json",
+                                       key=f"download-{status['json_path'].stem}-{file_name}")
 
-                st.session_state.processed_files.append((temp_json_path, output_filename))
-                st.success(f"Processed {uploaded_file}")
-                progress_bar.progress((i+1) / total_files)
-    
-    if st.session_state.processed_files:
-        st.subheader("Download Processed Files")
-        for temp_json_file, output_filename in st.session_state.processed_files:
-            with open(temp_json_file, "rb") as f:
-                st.download_button(label=f"Download {output_filename}",
-                                   data=f, 
-                                   file_name=output_filename,
-                                   mime="application/json")
     if st.button("Clear Content"):
-        for temp_json_file, _ in st.session_state.processed_files:
-            os.remove(temp_json_file)
-        st.session_state.processed_files = []
-
-        for temp_json_file, _ in st.session_state.processed_files:
-            os.remove(temp_json_file)
+        # the parsed files are kept for the next upload of the same pdfs, up to PDF_PARSER_APP_JSON_MAX_MB
         st.session_state.processed_files = []
+        st.rerun()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,185 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from json_writer import write_json
+from pdf_extractor import PDFExtractor, warm_up
+from result_cache import hash_bytes
+
+# parsed json files of the streamlit app by pdf content hash, a pdf uploaded again is served from its file
+APP_JSON_DIR = Path(os.environ.get("PDF_PARSER_APP_JSON_DIR", Path(tempfile.gettempdir()) / "pdf_parser_app"))
+# size of APP_JSON_DIR, the least recently used json files are deleted beyond it
+APP_JSON_MAX_MB = float(os.environ.get("PDF_PARSER_APP_JSON_MAX_MB", 1024))
+# number of pdfs parsed at the same time
+APP_WORKERS = int(os.environ.get("PDF_PARSER_APP_WORKERS", os.cpu_count() or 1))
+# the page progress of a running pdf is sent to the app at most every PROGRESS_INTERVAL seconds
+PROGRESS_INTERVAL = 0.5
+
+class ProgressWriter:
+    """
+    progress callback of an extraction in a pool worker, writes (pages done, number of pages) of the pdf to the
+    shared progress dict at most every PROGRESS_INTERVAL seconds and after the last page
+    """
+
+    def __init__(self, progress, content_hash:str):
+        self.progress = progress
+        self.content_hash = content_hash
+        self.last_report = 0.0
+
+    def __call__(self, pages_done:int, n_pages:int):
+        now = time.perf_counter()
+        if pages_done < n_pages and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        self.progress[self.content_hash] = (pages_done, n_pages)
+
+def parse_pdf(file_name:str, pdf_bytes:bytes, content_hash:str, json_path:str, progress) -> dict:
+    """
+    pool worker : parses the pdf and writes its processed_data to json_path, returns the pages and run time
+    """
+    start = time.perf_counter()
+    progress[content_hash] = (0, None)
+    extractor = None
+    try:
+        extractor = PDFExtractor(file_name, stream=pdf_bytes)
+        data = extractor.extract_all_text_blocks(
+            process_data=True, extract_tables=True, plot_cluster=False, outputs=("processed_data",),
+            progress=ProgressWriter(progress, content_hash),
+        )
+        write_json(json_path, data["processed_data"])
+    except Exception as e:
+        # pymupdf exceptions cannot be sent back to the app process
+        raise Exception(str(e)) from None
+    finally:
+        if extractor is not None:
+            extractor.pdf_doc.close()
+    return {"pages": data["stats"]["counters"].get("pages"), "seconds": time.perf_counter() - start, "cached": False}
+
+class ParseJobs:
+    """
+    Parses the pdfs uploaded to the streamlit app in a background process pool, so that the app stays responsive
+    while a batch of pdfs is parsed. The jobs are memoized by pdf content hash : a pdf uploaded again (by any
+    session, or after a rerun) gets the job of the first upload, and the parsed json file of APP_JSON_DIR is reused
+    without parsing when it exists. The json files beyond max_bytes are deleted least recently used first, like the
+    entries of a ResultCache, a pdf whose file was deleted is parsed again. The workers report the page progress of
+    their pdf in a shared dict. One instance is shared by all sessions of the app (st.cache_resource).
+    :: Args ::
+        Param :: max_workers :: number of worker processes
+        Param :: json_dir :: directory of the parsed json files
+        Param :: max_bytes :: maximum total size of the json files
+    """
+
+    def __init__(
+            self, max_workers:int = APP_WORKERS, json_dir:str = APP_JSON_DIR, max_bytes:int = int(APP_JSON_MAX_MB * 2**20),
+            ):
+        self.json_dir = Path(json_dir)
+        self.json_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        # the streamlit server runs several threads, forking it is not safe
+        self.ctx = multiprocessing.get_context("spawn")
+        self.manager = self.ctx.Manager()
+        self.progress = self.manager.dict()
+        self.pool = self.start_pool()
+        self.futures = {}
+        self.lock = threading.Lock()
+        # files of earlier runs of the app
+        self.evict()
+
+    def start_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self.ctx, initializer=warm_up)
+
+    def json_path(self, content_hash:str) -> Path:
+        return self.json_dir / f"{content_hash}.json"
+
+    def submit(self, file_name:str, pdf_bytes:bytes) -> str:
+        """
+        queues the pdf unless it is parsed or being parsed already, returns its content hash
+        """
+        content_hash = hash_bytes(pdf_bytes)
+        json_path = self.json_path(content_hash)
+        with self.lock:
+            future = self.futures.get(content_hash)
+            if future is not None and not future.done():
+                return content_hash
+            try:
+                # a file parsed before is marked as recently used for the eviction
+                os.utime(json_path)
+                parsed = True
+            except FileNotFoundError:
+                parsed = False
+            if future is not None and future.exception() is None and parsed:
+                return content_hash
+            # a failed job is run again, as is a job whose json file was evicted
+            if parsed:
+                future = Future()
+                future.set_result({"pages": None, "seconds": 0.0, "cached": True})
+            else:
+                job_args = (file_name, pdf_bytes, content_hash, str(json_path), self.progress)
+                try:
+                    future = self.pool.submit(parse_pdf, *job_args)
+                except BrokenProcessPool:
+                    # a worker died (e.g. a crash in pymupdf), its pdfs failed and the pool takes no more jobs
+                    self.pool = self.start_pool()
+                    future = self.pool.submit(parse_pdf, *job_args)
+                future.add_done_callback(lambda _: self.evict())
+            self.futures[content_hash] = future
+        return content_hash
+
+    def evict(self) -> int:
+        """
+        deletes the least recently used json files until the directory fits in max_bytes, returns the number of
+        deleted files
+        """
+        entries = []
+        for path in self.json_dir.glob("*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        n_evicted = 0
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+            n_evicted += 1
+        return n_evicted
+
+    def statuses(self, content_hashes:list) -> list:
+        """
+        status of the jobs of the pdfs, the progress dict is read once for all of them
+        """
+        progress = self.progress.copy()
+        return [self.status(content_hash, progress) for content_hash in content_hashes]
+
+    def status(self, content_hash:str, progress:dict = None) -> dict:
+        """
+        state (queued, running, completed, failed or unknown) of the job of the pdf with its page progress, result
+        or error
+        """
+        future = self.futures.get(content_hash)
+        if future is None:
+            return {"state": "unknown"}
+        if not future.done():
+            progress = self.progress if progress is None else progress
+            pages_done, n_pages = progress.get(content_hash, (None, None))
+            if pages_done is None:
+                return {"state": "queued"}
+            return {"state": "running", "pages_done": pages_done, "pages": n_pages}
+        self.progress.pop(content_hash, None)
+        if future.exception() is not None:
+            return {"state": "failed", "error": str(future.exception())}
+        return {"state": "completed", "json_path": self.json_path(content_hash), **future.result()}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.manager.shutdown()
@@ -1,20 +1,36 @@
 import asyncio
+import hashlib
 import json
 import logging
 import os
 import re
 import shutil
+import sqlite3
+import time
 import uuid
-from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
 from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
 from pathlib import Path
 from typing import List
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
-from fastapi.responses import FileResponse
+import fitz
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Query, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 
-from pdf_extractor import PDFExtractor
+from dataset_writer import DATASET_FORMATS, import_pyarrow, partition_dir, write_document
+from job_store import JobStore, is_finished
+from json_writer import ENCODER, json_suffix, write_json
+from layout_templates import LayoutStore
+from metrics import MetricsRegistry
+from pdf_extractor import PDFExtractor, layout_key_options, set_document_info, warm_up
+from result_cache import ResultCache, make_cache_key
+from scheduler import JobScheduler, estimate_cost, parse_tenant_weights
+from section_dedup import DEFAULT_THRESHOLD, SectionDedup, dedup_sections
+from section_index import SectionIndex
+from stage_stats import StageStats
+from worker_pool import WorkerPool
 
 logging.basicConfig(level=logging.INFO,
                     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
@@ -33,15 +49,174 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 JSON_DIR = Path(DATA_DIR / "json_files")
 JSON_DIR.mkdir(exist_ok=True)
 
+CACHE_DIR = Path(os.environ.get("PDF_PARSER_CACHE_DIR", DATA_DIR / "cache"))
+# size of the parsed result cache, least recently used results are evicted beyond it
+CACHE_MAX_MB = int(os.environ.get("PDF_PARSER_CACHE_MAX_MB", 1024))
+
+# cache of the extracted pages by page content, revised pdfs only decode their changed pages
+PAGE_CACHE_DIR = Path(os.environ.get("PDF_PARSER_PAGE_CACHE_DIR", DATA_DIR / "page_cache"))
+PAGE_CACHE_MAX_MB = int(os.environ.get("PDF_PARSER_PAGE_CACHE_MAX_MB", 1024))
+
+# layouts of recurring documents, a pdf matching a learned layout skips the header / footer clustering
+LAYOUT_TEMPLATES = os.environ.get("PDF_PARSER_LAYOUT_TEMPLATES", "false").lower() in ("1", "true", "yes")
+LAYOUT_DIR = Path(os.environ.get("PDF_PARSER_LAYOUT_DIR", DATA_DIR / "layouts"))
+
+# task statuses shared by all api processes (uvicorn workers) and their pool workers, finished tasks are kept
+# PDF_PARSER_JOB_TTL_SECONDS and expired every JOB_EXPIRE_INTERVAL seconds
+JOB_DB_PATH = Path(os.environ.get("PDF_PARSER_JOB_DB", DATA_DIR / "jobs.db"))
+JOB_TTL_SECONDS = float(os.environ.get("PDF_PARSER_JOB_TTL_SECONDS", 24 * 3600))
+JOB_EXPIRE_INTERVAL = 60
+# the page progress of a running task is written to the job store at most every PROGRESS_INTERVAL seconds
+PROGRESS_INTERVAL = float(os.environ.get("PDF_PARSER_PROGRESS_INTERVAL", 0.5))
+# seconds between the job store reads of /task_events/ and /task_updates/, a comment line is sent on idle event
+# streams every EVENTS_KEEPALIVE_SECONDS so that proxies keep the connection open
+EVENTS_POLL_SECONDS = 0.25
+EVENTS_KEEPALIVE_SECONDS = 15
+# longest wait of a /task_updates/ request and number of tasks one request can watch
+LONG_POLL_MAX_SECONDS = 60
+MAX_WATCHED_TASKS = 1000
+
+# full text index of the sections of the parsed json files, updated when a task completes, see /search/
+SECTION_INDEX_DB = Path(os.environ.get("PDF_PARSER_SECTION_INDEX_DB", DATA_DIR / "section_index.db"))
+SEARCH_MAX_LIMIT = 100
+
+# near-duplicate sections across the parsed pdfs (boilerplate, standard clauses) are written to the json files as a
+# reference to their first occurrence instead of their content, see /dedup_report/
+SECTION_DEDUP = os.environ.get("PDF_PARSER_DEDUP", "false").lower() in ("1", "true", "yes")
+SECTION_DEDUP_DB = Path(os.environ.get("PDF_PARSER_DEDUP_DB", DATA_DIR / "section_dedup.db"))
+SECTION_DEDUP_THRESHOLD = float(os.environ.get("PDF_PARSER_DEDUP_THRESHOLD", DEFAULT_THRESHOLD))
+
+# header / footer detection engine, one of pdf_cluster.CATEGORIZER_ENGINES
+CATEGORIZER_ENGINE = os.environ.get("PDF_PARSER_CATEGORIZER", "dbscan")
+# table detection mode, one of pdf_extractor.TABLE_MODES
+TABLE_MODE = os.environ.get("PDF_PARSER_TABLE_MODE", "screened")
+
+# write the parsed json files gzip compressed (.json.gz)
+JSON_GZIP = os.environ.get("PDF_PARSER_JSON_GZIP", "false").lower() in ("1", "true", "yes")
+# also write the parsed pdfs as parquet / arrow datasets partitioned by document (see dataset_writer), off when empty
+DATASET_FORMAT = os.environ.get("PDF_PARSER_DATASET_FORMAT", "").lower()
+if DATASET_FORMAT and DATASET_FORMAT not in DATASET_FORMATS:
+    raise Exception(f"Invalid PDF_PARSER_DATASET_FORMAT :: {DATASET_FORMAT} :: expected one of {DATASET_FORMATS}")
+DATASET_DIR = Path(os.environ.get("PDF_PARSER_DATASET_DIR", DATA_DIR / "datasets"))
+# only the processed data is written to the json files, the raw block records are not built
+OUTPUTS = ("processed_data",)
+# memory budget of one extraction, larger pdfs are extracted in windows of pages spilled to disk, 0 disables it
+MEMORY_BUDGET_MB = float(os.environ.get("PDF_PARSER_MEMORY_BUDGET_MB", 0)) or None
+
+# uploads are read in chunks of this size, hashed while they are received and stored as UPLOAD_DIR / <sha256>.pdf
+UPLOAD_CHUNK_BYTES = 1 << 20
+# pdfs up to this size are kept in memory while they are received and handed to the pool workers in shared memory,
+# larger pdfs are opened by the workers from UPLOAD_DIR. 0 disables the shared memory handoff
+SHM_MAX_MB = float(os.environ.get("PDF_PARSER_SHM_MAX_MB", 256))
+
+# number of pdf extractions running concurrently in the process pool
+MAX_WORKERS = int(os.environ.get("PDF_PARSER_WORKERS", os.cpu_count() or 1))
+# warm up the api process and start the pool workers with a small extraction before the service takes requests
+WARM_WORKERS = os.environ.get("PDF_PARSER_WARM_WORKERS", "true").lower() in ("1", "true", "yes")
+# number of pdfs allowed to wait in the queue, uploads beyond it are rejected with 503
+MAX_QUEUE_SIZE = int(os.environ.get("PDF_PARSER_QUEUE_SIZE", 100))
+# order of the queued pdfs, one of scheduler.SCHEDULING_POLICIES. fair shares the workers between the tenants
+# (X-Tenant-ID header, else the client address) and runs the pdfs of a tenant by their estimated cost, cheapest first
+SCHEDULER_POLICY = os.environ.get("PDF_PARSER_SCHEDULER", "fair")
+# estimated cost (page equivalents) a queued pdf moves ahead per second, bounds the wait of large pdfs
+SCHEDULER_AGING = float(os.environ.get("PDF_PARSER_SCHEDULER_AGING", 10))
+# share of the tenants as "tenant_a=2,tenant_b=0.5", the default weight is 1
+TENANT_WEIGHTS = parse_tenant_weights(os.environ.get("PDF_PARSER_TENANT_WEIGHTS", ""))
+# pdfs of one tenant extracted at the same time and waiting in the queue, 0 is unlimited
+TENANT_MAX_RUNNING = int(os.environ.get("PDF_PARSER_TENANT_MAX_RUNNING", 0))
+TENANT_QUEUE_SIZE = int(os.environ.get("PDF_PARSER_TENANT_QUEUE_SIZE", 0))
+# seconds from the upload until a pdf has to be extracted, a running extraction is killed when it is late. A request
+# can ask for a shorter timeout, 0 disables the deadline
+JOB_TIMEOUT_SECONDS = float(os.environ.get("PDF_PARSER_JOB_TIMEOUT", 900))
+DEADLINE_EXCEEDED = "failed : deadline exceeded"
+# status of the tasks left queued or running by an api process that stopped (restart, crash), set at startup
+ORPHANED = "failed : service restarted before the task finished"
+# seconds between the job store reads for the cancel requests of the tasks of this api process
+CANCEL_POLL_SECONDS = 0.5
+# number of /parsepdf/stream/ requests extracted at the same time, they run in threads of the api process
+MAX_STREAMS = int(os.environ.get("PDF_PARSER_MAX_STREAMS", 2))
+# seconds a rejected client is asked to wait before retrying
+RETRY_AFTER_SECONDS = int(os.environ.get("PDF_PARSER_RETRY_AFTER", 30))
+
+metrics = MetricsRegistry()
+QUEUE_DEPTH = metrics.gauge("pdf_parser_queue_depth", "Number of pdfs waiting in the queue")
+QUEUE_COST = metrics.gauge("pdf_parser_queue_cost", "Estimated cost of the pdfs waiting in the queue in pages")
+JOBS_IN_FLIGHT = metrics.gauge("pdf_parser_jobs_in_flight", "Number of pdfs being extracted in the process pool")
+STREAMS_IN_FLIGHT = metrics.gauge("pdf_parser_streams_in_flight", "Number of pdfs being streamed")
+JOBS_TOTAL = metrics.counter("pdf_parser_jobs_total", "Finished pdf jobs by status", ("status",))
+PAGES_TOTAL = metrics.counter("pdf_parser_pages_total", "Pages extracted")
+BYTES_WRITTEN_TOTAL = metrics.counter("pdf_parser_bytes_written_total", "Bytes of parsed json written")
+PAGE_CACHE_TOTAL = metrics.counter("pdf_parser_page_cache_total", "Page cache lookups by result", ("result",))
+LAYOUT_TOTAL = metrics.counter("pdf_parser_layout_templates_total", "Layout template matches by result", ("result",))
+DEDUP_SECTIONS_TOTAL = metrics.counter(
+    "pdf_parser_dedup_sections_total", "Sections written as reference to a near-duplicate section"
+)
+DEDUP_BYTES_TOTAL = metrics.counter("pdf_parser_dedup_bytes_total", "Section content bytes replaced by a reference")
+QUEUE_WAIT_SECONDS = metrics.histogram("pdf_parser_queue_wait_seconds", "Time pdfs wait in the queue")
+JOB_LATENCY_SECONDS = metrics.histogram(
+    "pdf_parser_job_latency_seconds", "Time from the upload of a pdf until its task is finished"
+)
+STAGE_SECONDS = metrics.histogram("pdf_parser_stage_seconds", "Time spent per extraction stage", ("stage",))
+
 @dataclass
 class Item:
     """
     dataclass to store task_id, pdf filepath and filename
+    file_path is the content addressed upload, file_name the uploaded file name. With shm_name the worker reads the
+    size bytes of the pdf from that shared memory block instead of file_path.
+    tenant, pages and cost (see scheduler.estimate_cost) order the task in the queue, the task is stopped at the
+    deadline (time.perf_counter) or when it is cancelled
     """
 
     task_id: uuid.UUID
     file_path: str
     fil_path_wo_extn: str
+    enqueued_at: float = 0.0
+    file_name: str = ""
+    content_hash: str = ""
+    shm_name: str = None
+    size: int = 0
+    tenant: str = "default"
+    pages: int = 0
+    cost: float = 0.0
+    deadline: float = None
+    cancelled: bool = False
+
+@dataclass
+class Upload:
+    """
+    dataclass to store a received pdf : its sha256, content addressed path, size and the content itself when it
+    is small enough for the shared memory handoff (see SHM_MAX_MB)
+    """
+
+    file_name: str
+    content_hash: str
+    file_path: Path
+    size: int
+    content: bytearray = None
+
+# caches and stores of the service, opened by open_stores when the app starts and in every pool worker so that
+# importing the module creates no files
+result_cache = page_cache = layouts = job_store = section_index = section_dedup = None
+
+def open_stores():
+    """
+    opens the caches and stores of the service (see the paths above), once per process
+    forked pool workers inherit the stores of the api process
+    """
+    global result_cache, page_cache, layouts, job_store, section_index, section_dedup
+    if job_store is not None:
+        return
+    result_cache = ResultCache(CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024)
+    if PAGE_CACHE_MAX_MB > 0:
+        page_cache = ResultCache(PAGE_CACHE_DIR, max_bytes=PAGE_CACHE_MAX_MB * 1024 * 1024)
+    if LAYOUT_TEMPLATES:
+        layouts = LayoutStore(LAYOUT_DIR)
+    section_index = SectionIndex(SECTION_INDEX_DB)
+    if SECTION_DEDUP:
+        section_dedup = SectionDedup(SECTION_DEDUP_DB, threshold=SECTION_DEDUP_THRESHOLD)
+    DATASET_DIR.mkdir(parents=True, exist_ok=True)
+    job_store = JobStore(JOB_DB_PATH, ttl_seconds=JOB_TTL_SECONDS)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -49,13 +224,94 @@ async def lifespan(app: FastAPI):
     lifespan : code to run before the fast api app instantiation
     """
 
-    q = asyncio.Queue()
-    pool = ProcessPoolExecutor()
-    asyncio.create_task(process_request(q,pool))
-    yield {"q": q, "pool": pool}
+    await asyncio.to_thread(open_stores)
+    n_orphaned = await asyncio.to_thread(job_store.fail_orphaned, {"status": ORPHANED})
+    if n_orphaned:
+        logging.warning(f"{n_orphaned} queued or running tasks of stopped api processes marked as failed")
+    scheduler = JobScheduler(
+        maxsize=MAX_QUEUE_SIZE, policy=SCHEDULER_POLICY, aging_cost_per_second=SCHEDULER_AGING,
+        tenant_weights=TENANT_WEIGHTS, tenant_max_running=TENANT_MAX_RUNNING,
+    )
+    # the pool workers have to share the resource tracker of the api process : a worker started before it would
+    # start its own tracker on the first shared memory block it attaches and unlink the block when it exits
+    resource_tracker.ensure_running()
+    pool = await start_workers()
+    dispatchers = [asyncio.create_task(process_request(scheduler, pool)) for _ in range(MAX_WORKERS)]
+    dispatchers.append(asyncio.create_task(expire_jobs()))
+    dispatchers.append(asyncio.create_task(watch_cancel_requests(scheduler)))
+    logging.info(f"started {MAX_WORKERS} dispatchers :: queue size :: {MAX_QUEUE_SIZE} :: scheduler :: {SCHEDULER_POLICY}")
+    yield {"scheduler": scheduler, "pool": pool}
+    for dispatcher in dispatchers:
+        dispatcher.cancel()
     pool.shutdown()
 
-task_statuses = {}
+def init_worker():
+    """
+    process pool initializer : opens the stores when the worker did not inherit them and warms it up with
+    PDF_PARSER_WARM_WORKERS
+    """
+    open_stores()
+    if WARM_WORKERS:
+        warm_worker()
+
+def warm_worker():
+    """
+    a worker imports and initializes the extraction stack before its first pdf
+    a failed warm up is only logged, the worker would break the pool otherwise
+    """
+    try:
+        warm_up(categorizer_engine=CATEGORIZER_ENGINE, table_mode=TABLE_MODE)
+        if DATASET_FORMAT:
+            import_pyarrow()
+    except Exception:
+        logging.exception("warm up of the pool worker failed")
+
+async def start_workers() -> WorkerPool:
+    """
+    warms up the api process (it runs the /parsepdf/stream/ extractions) with PDF_PARSER_WARM_WORKERS and starts the
+    pool workers, forked workers inherit the warm modules of the api process
+    """
+    start = time.perf_counter()
+    if WARM_WORKERS:
+        await asyncio.to_thread(warm_worker)
+    pool = WorkerPool(MAX_WORKERS, initializer=init_worker)
+    await pool.start()
+    logging.info(f"started the api process and {MAX_WORKERS} pool workers in {time.perf_counter() - start:.2f} s")
+    return pool
+
+async def expire_jobs():
+    """
+    deletes the finished jobs older than JOB_TTL_SECONDS from the job store
+    """
+    while True:
+        try:
+            n_expired = await asyncio.to_thread(job_store.expire)
+            if n_expired:
+                logging.info(f"expired {n_expired} finished jobs")
+        except Exception:
+            logging.exception("expiring the finished jobs failed")
+        await asyncio.sleep(JOB_EXPIRE_INTERVAL)
+
+async def watch_cancel_requests(scheduler:JobScheduler):
+    """
+    cancels the tasks of this api process cancelled through another api process (uvicorn workers)
+    """
+    while True:
+        await asyncio.sleep(CANCEL_POLL_SECONDS)
+        task_ids = scheduler.queued_task_ids() + list(running_jobs)
+        if not task_ids:
+            continue
+        try:
+            for task_id in await asyncio.to_thread(job_store.cancel_requests, task_ids):
+                cancel_local_task(scheduler, uuid.UUID(task_id))
+        except Exception:
+            logging.exception("reading the cancel requests failed")
+
+# shared memory blocks of the queued / running tasks by task id, unlinked when the task is finished
+shared_buffers = {}
+# (item, asyncio task awaiting the extraction) of the running tasks by task id
+running_jobs = {}
+stream_slots = asyncio.Semaphore(MAX_STREAMS)
 app = FastAPI(title="PDF_PARSER", version="1.0", lifespan=lifespan)
 
 @app.get("/ping/")
@@ -63,17 +319,38 @@ async def ping():
     logging.info(msg = "ping to check the service")
     return {"message": "Ping Successful"}
 
-async def copy_pdf_file(file):
+async def copy_pdf_file(file) -> Upload:
     """
     async copy of pdf files
+    the upload is hashed while it is received and stored content addressed as UPLOAD_DIR / <sha256>.pdf, so
+    concurrent uploads with the same file name never overwrite each other and identical pdfs are stored once
     """
 
-    file_path = UPLOAD_DIR / file.filename
-    with file_path.open("wb") as f:
-        await asyncio.to_thread(shutil.copyfileobj, file.file, f)
+    digest = hashlib.sha256()
+    content = bytearray() if SHM_MAX_MB > 0 else None
+    size = 0
+    tmp_path = UPLOAD_DIR / f".{uuid.uuid4().hex}.tmp"
+    try:
+        with tmp_path.open("wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                digest.update(chunk)
+                size += len(chunk)
+                if content is not None:
+                    content += chunk
+                    if size > SHM_MAX_MB * 1024 * 1024:
+                        content = None
+                await asyncio.to_thread(f.write, chunk)
+        file_path = UPLOAD_DIR / f"{digest.hexdigest()}.pdf"
+        # the same content may be stored already, replacing it is atomic and harmless
+        os.replace(tmp_path, file_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+    return Upload(file.filename, digest.hexdigest(), file_path, size, content)
 
-async def copy_file_tasks(files):
+async def copy_file_tasks(files) -> list:
     """
+    copies the pdf files concurrently, returns their Upload records in the order of the pdf files
     """
     tasks = []
 
@@ -87,18 +364,117 @@ async def copy_file_tasks(files):
 
         if file.content_type == "application/pdf":
             tasks.append(copy_pdf_file(file))
-    await asyncio.gather(*tasks)
+    return await asyncio.gather(*tasks)
 
 def save_json(file_name:str, data:dict):
     """
+    writes the parsed data as compact json file (gzip compressed with PDF_PARSER_JSON_GZIP), returns its path
     """
-    json_path = JSON_DIR / f"{file_name}.json"
-
-    with json_path.open("w") as json_file:
-        json.dump(data, json_file, indent=4)
+    json_path = JSON_DIR / f"{file_name}{json_suffix(JSON_GZIP)}"
+    write_json(json_path, data, compress=JSON_GZIP)
 
     return json_path
 
+def dedup_document(doc_id:str, data:dict, content_hash:str, stats:StageStats) -> dict:
+    """
+    the parsed data with the near-duplicate sections replaced by a reference to their canonical section when
+    PDF_PARSER_DEDUP is set, on a failure the data is returned as is
+    """
+    if section_dedup is None:
+        return data
+    try:
+        with stats.time("dedup"):
+            refs = section_dedup.add_document(
+                doc_id, data["sections"], document_name=data["document_name"], content_hash=content_hash,
+            )
+    except Exception:
+        logging.exception(f"deduplicating the sections of {doc_id} failed")
+        return data
+    stats.count("dedup_sections", sum(ref is not None for ref in refs))
+    stats.count("dedup_bytes", sum(
+        len(section["content"].encode("utf-8")) for section, ref in zip(data["sections"], refs) if ref is not None
+    ))
+    return {**data, "sections": dedup_sections(data["sections"], refs)}
+
+def index_sections(doc_id:str, data:dict, json_path:Path, content_hash:str, stats:StageStats):
+    """
+    adds the sections of the parsed json file to the section index, a failure is only logged as the json file is
+    written already
+    """
+    try:
+        with stats.time("index"):
+            section_index.add_document(
+                doc_id, data["sections"], document_name=data["document_name"], content_hash=content_hash,
+                json_file=json_path.name,
+            )
+    except Exception:
+        logging.exception(f"indexing the sections of {json_path.name} failed")
+
+def save_dataset(doc_id:str, data:dict, stats:StageStats) -> dict:
+    """
+    writes the parsed data as partition doc_id of the datasets in DATASET_DIR when PDF_PARSER_DATASET_FORMAT is set,
+    returns the dataset info of the task status or None. A failure is only logged as the json file is written already
+    """
+    if not DATASET_FORMAT:
+        return None
+    try:
+        with stats.time("save_dataset"):
+            n_bytes = write_document(DATASET_DIR, doc_id, data, format=DATASET_FORMAT)
+    except Exception:
+        logging.exception(f"writing the {DATASET_FORMAT} dataset of {doc_id} failed")
+        return None
+    stats.count("dataset_bytes_written", n_bytes)
+    return {
+        "format": DATASET_FORMAT, "document_id": doc_id,
+        "sections": str(partition_dir(DATASET_DIR, "sections", doc_id).relative_to(DATA_DIR)),
+    }
+
+def share_pdf(item:Item, content:bytearray):
+    """
+    copies the pdf content to a new shared memory block for the pool worker of the task
+    the block is owned by the api process and unlinked by release_pdf when the task is finished
+    """
+    if not content:
+        return
+    shm = shared_memory.SharedMemory(create=True, size=len(content))
+    shm.buf[:len(content)] = content
+    shared_buffers[item.task_id] = shm
+    item.shm_name = shm.name
+    item.size = len(content)
+
+def release_pdf(item:Item):
+    shm = shared_buffers.pop(item.task_id, None)
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+
+def read_shared_pdf(shm_name:str, size:int) -> bytes:
+    """
+    pool worker : copy of the pdf in the shared memory block, pymupdf needs a bytes object it can hold on to
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+
+class ProgressReporter:
+    """
+    progress callback of an extraction, writes the pages done of the task to the job store at most every
+    PROGRESS_INTERVAL seconds and after the last page
+    """
+
+    def __init__(self, task_id:uuid.UUID):
+        self.task_id = task_id
+        self.last_report = 0.0
+
+    def __call__(self, pages_done:int, n_pages:int):
+        now = time.perf_counter()
+        if pages_done < n_pages and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        job_store.update(self.task_id, {"status" : "processing", "progress": {"pages_done": pages_done, "pages": n_pages}})
+
 def process_pdf_extraction_task(item:Item, process_data: bool= True, extract_table: bool = True):
     """
     """
@@ -110,72 +486,406 @@ def process_pdf_extraction_task(item:Item, process_data: bool= True, extract_tab
         logging.info(f"Item details :: {item}")
         logging.info(f"file_path :: {str(item.file_path)}")
 
-        task_statuses[task_id] = {"status" : "processing"}
-        # logging.info(task_statuses[task_id])
+        job_store.update(task_id, {"status" : "processing"})
 
-        extractor = PDFExtractor(str(pdf_file_path))
+        stream = read_shared_pdf(item.shm_name, item.size) if item.shm_name else None
+        extractor = PDFExtractor(str(pdf_file_path), stream=stream)
         data = extractor.extract_all_text_blocks(process_data=process_data, 
                                                  plot_cluster=False, 
-                                                 extract_tables=extract_table
+                                                 extract_tables=extract_table,
+                                                 cache=result_cache,
+                                                 categorizer_engine=CATEGORIZER_ENGINE,
+                                                 table_mode=TABLE_MODE,
+                                                 outputs=OUTPUTS,
+                                                 page_cache=page_cache,
+                                                 memory_budget_mb=MEMORY_BUDGET_MB,
+                                                 layouts=layouts,
+                                                 progress=ProgressReporter(task_id),
                                                  )
         logging.info(f"data :: {data.keys()}")
-        json_path = save_json(json_file_name, data["processed_data"])
-
-        logging.info(f"data :: {data.keys()}")
-        json_path = save_json(json_file_name, data["processed_data"])
+        set_document_info(data, str(pdf_file_path), item.file_name)
+        stats = extractor.stats
+        data["processed_data"] = dedup_document(json_file_name, data["processed_data"], item.content_hash, stats)
+        with stats.time("save_json"):
+            json_path = save_json(json_file_name, data["processed_data"])
+        stats.count("bytes_written", json_path.stat().st_size)
+        index_sections(json_file_name, data["processed_data"], json_path, item.content_hash, stats)
+        dataset = save_dataset(json_file_name, data, stats)
 
         logging.info("changing the status!!!")
 
-        task_statuses[task_id] = {
+        task_status = {
             "status" : "completed",
             "download_url": {"filename" : json_file_name, "download_url": f"/download/{json_path.name}"},
+            "stats": stats.to_dict(),
         }
+        if dataset is not None:
+            task_status["dataset"] = dataset
 
-        logging.info(f"task_id :: {task_id} :: task_status :: {task_statuses[task_id]}")
+        logging.info(f"task_id :: {task_id} :: task_status :: {task_status}")
 
     except Exception as e:
-        task_statuses[task_id] = {"status" : f"failed : {str(e)}"}
-    
-    return task_id, task_statuses[task_id]
+        task_status = {"status" : f"failed : {str(e)}"}
 
-async def process_request(q:asyncio.Queue, pool:ProcessPoolExecutor):
+    job_store.update(task_id, task_status)
+    return task_id, task_status
+
+def get_cached_result(upload:Upload, process_data: bool= True, extract_table: bool = True):
+    """
+    returns the cached extraction result of the pdf (same options as process_pdf_extraction_task) or None
+    """
+    cache_key = make_cache_key(
+        upload.content_hash, process_data=process_data, extract_tables=extract_table,
+        categorizer_engine=CATEGORIZER_ENGINE, table_mode=TABLE_MODE if extract_table else "off",
+        outputs=list(OUTPUTS), **layout_key_options(layouts),
+    )
+    cached_result = result_cache.get(cache_key)
+    if cached_result is None:
+        return None
+    return set_document_info(cached_result, str(upload.file_path), upload.file_name)
+
+async def process_request(scheduler:JobScheduler, pool:WorkerPool):
     """
     run the process in the pool
+    one dispatcher is started per pool worker so that up to MAX_WORKERS pdfs are processed concurrently
+    the extraction is stopped (its pool worker killed) when the deadline of the task passes or it is cancelled
     """
     while True:
-        item = await q.get()
-        loop = asyncio.get_running_loop()
-        task_statuses[item.task_id] = {"status" : "sending the task to process pool"}
-        result = await loop.run_in_executor(pool, process_pdf_extraction_task, item)
-        q.task_done()
-        logging.info(f"result :: {result}")
-        task_statuses[result[0]] = result[1]
+        item = await scheduler.get()
+        QUEUE_WAIT_SECONDS.observe(time.perf_counter() - item.enqueued_at)
+        JOBS_IN_FLIGHT.inc()
+        task_status = {"status" : "sending the task to process pool"}
+        try:
+            timeout = None if item.deadline is None else item.deadline - time.perf_counter()
+            if timeout is not None and timeout <= 0:
+                task_status = await asyncio.to_thread(stop_task, item, {"status": f"{DEADLINE_EXCEEDED} while queued"})
+                continue
+            await asyncio.to_thread(job_store.update, item.task_id, task_status)
+            job = asyncio.create_task(asyncio.wait_for(pool.run(process_pdf_extraction_task, item), timeout))
+            running_jobs[item.task_id] = (item, job)
+            result = await job
+            logging.info(f"result :: {result}")
+            task_status = result[1]
+        except asyncio.TimeoutError:
+            logging.warning(f"task_id :: {item.task_id} :: {item.pages} pages :: deadline exceeded, extraction stopped")
+            task_status = await asyncio.to_thread(stop_task, item, {"status": DEADLINE_EXCEEDED})
+        except asyncio.CancelledError:
+            # the dispatcher itself is cancelled when the service shuts down
+            if not item.cancelled:
+                raise
+            logging.info(f"task_id :: {item.task_id} :: cancelled, extraction stopped")
+            task_status = await asyncio.to_thread(stop_task, item, {"status": "cancelled"})
+        except Exception as e:
+            logging.exception(f"task_id :: {item.task_id} :: process pool failure")
+            task_status = await asyncio.to_thread(stop_task, item, {"status" : f"failed : {str(e)}"})
+        finally:
+            running_jobs.pop(item.task_id, None)
+            release_pdf(item)
+            scheduler.task_done(item)
+            JOBS_IN_FLIGHT.dec()
+            record_task_metrics(task_status, item.enqueued_at)
+
+def stop_task(item:Item, task_status:dict) -> dict:
+    """
+    writes the status of a task stopped by its dispatcher, unless the pool worker finished the task just before
+    """
+    current = job_store.get(item.task_id)
+    if current is not None and is_finished(current["status"]):
+        return current
+    job_store.update(item.task_id, task_status)
+    return task_status
+
+def cancel_local_task(scheduler:JobScheduler, task_id:uuid.UUID) -> bool:
+    """
+    cancels a task of this api process : a queued task is removed from the queue, the extraction of a running task
+    is stopped by its dispatcher. Returns False when the task is neither queued nor running in this process
+    """
+    item = scheduler.remove(task_id)
+    if item is not None:
+        release_pdf(item)
+        job_store.update(item.task_id, {"status": "cancelled"})
+        record_task_metrics({"status": "cancelled"}, item.enqueued_at)
+        return True
+    if task_id in running_jobs:
+        item, job = running_jobs[task_id]
+        item.cancelled = True
+        job.cancel()
+        return True
+    return False
+
+def record_task_metrics(task_status:dict, enqueued_at:float):
+    """
+    adds a finished task (its status and the stage timings / counters of its extraction) to the metrics
+    """
+    if task_status["status"] == "cancelled":
+        JOBS_TOTAL.inc(status="cancelled")
+    elif task_status["status"].startswith(DEADLINE_EXCEEDED):
+        JOBS_TOTAL.inc(status="timeout")
+    elif task_status["status"] != "completed":
+        JOBS_TOTAL.inc(status="failed")
+    elif task_status["stats"]["counters"].get("cache_hits"):
+        JOBS_TOTAL.inc(status="cached")
+    else:
+        JOBS_TOTAL.inc(status="completed")
+    JOB_LATENCY_SECONDS.observe(time.perf_counter() - enqueued_at)
+
+    stats = task_status.get("stats", {})
+    for stage, seconds in stats.get("timings_s", {}).items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    counters = stats.get("counters", {})
+    PAGES_TOTAL.inc(counters.get("pages", 0))
+    PAGE_CACHE_TOTAL.inc(counters.get("page_cache_hits", 0), result="hit")
+    PAGE_CACHE_TOTAL.inc(counters.get("page_cache_misses", 0), result="miss")
+    LAYOUT_TOTAL.inc(counters.get("layout_hits", 0), result="hit")
+    LAYOUT_TOTAL.inc(counters.get("layout_misses", 0), result="miss")
+    BYTES_WRITTEN_TOTAL.inc(counters.get("bytes_written", 0))
+    DEDUP_SECTIONS_TOTAL.inc(counters.get("dedup_sections", 0))
+    DEDUP_BYTES_TOTAL.inc(counters.get("dedup_bytes", 0))
+
+def check_queue_capacity(scheduler:JobScheduler, n_items:int, tenant:str):
+    """
+    reject the request with 503 when the queue cannot take n_items more pdfs, with 429 when the tenant would have
+    more than PDF_PARSER_TENANT_QUEUE_SIZE pdfs queued
+    """
+    free_slots = scheduler.maxsize - scheduler.qsize() if scheduler.maxsize > 0 else n_items
+    if n_items > free_slots:
+        logging.warning(f"queue full :: requested {n_items} :: free slots {free_slots}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Too many pdfs queued. {free_slots} slot(s) free for {n_items} pdf(s). Please retry later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    tenant_slots = TENANT_QUEUE_SIZE - scheduler.tenant_qsize(tenant) if TENANT_QUEUE_SIZE > 0 else n_items
+    if n_items > tenant_slots:
+        logging.warning(f"tenant queue full :: tenant {tenant} :: requested {n_items} :: free slots {tenant_slots}")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many pdfs queued for {tenant}. {tenant_slots} slot(s) free for {n_items} pdf(s). Please retry later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+def create_jobs(tasks:list):
+    """
+    adds the jobs of the (upload, item, task status) of a request to the job store
+    """
+    for upload, item, task_status in tasks:
+        job_store.create(item.task_id, task_status, content_hash=upload.content_hash, file_name=upload.file_name)
+
+def update_jobs(task_ids:list, task_status:dict):
+    for task_id in task_ids:
+        job_store.update(task_id, task_status)
+
+def count_pages(upload:Upload) -> int:
+    """
+    page count of the uploaded pdf for its cost estimate, 0 when it cannot be opened (its extraction fails quickly)
+    """
+    try:
+        doc = fitz.open(stream=upload.content) if upload.content is not None else fitz.open(upload.file_path)
+        with doc:
+            return doc.page_count
+    except Exception:
+        return 0
+
+def get_deadline(enqueued_at:float, timeout:float = None) -> float:
+    """
+    time (time.perf_counter) the task has to be finished by : the requested timeout or PDF_PARSER_JOB_TIMEOUT
+    after the upload, whichever is shorter. None when neither is set
+    """
+    timeouts = [seconds for seconds in (timeout, JOB_TIMEOUT_SECONDS) if seconds]
+    return enqueued_at + min(timeouts) if timeouts else None
 
 @app.post("/parsepdf/")
-async def parse_pdf(request : Request, files : List[UploadFile] = File(...)):
+async def parse_pdf(
+        request : Request, files : List[UploadFile] = File(...), timeout: float = None,
+        x_tenant_id: str = Header(None),
+        ):
     """
+    queues the pdfs for extraction. The pdfs of a tenant (X-Tenant-ID header, else the client address) share the
+    workers fairly with the other tenants, see PDF_PARSER_SCHEDULER. timeout (seconds) shortens the deadline of the
+    tasks, an extraction still running at its deadline is stopped
     """
-    await copy_file_tasks(files)
+    if timeout is not None and timeout <= 0:
+        raise HTTPException(status_code=422, detail="timeout must be above 0")
+    tenant = x_tenant_id or (request.client.host if request.client else "default")
+    scheduler = request.state.scheduler
+    pdf_files = [file for file in files if file.content_type == "application/pdf"]
+    check_queue_capacity(scheduler, len(pdf_files), tenant)
 
-    task_results = []
-    for file in files:
-        if file.content_type == "application/pdf":
-            task_id = uuid.uuid4()
-            task_statuses[task_id] = {"status" : "pending"}
+    uploads = await copy_file_tasks(files)
+    # the cost estimates of the pdfs, the page count only needs the page tree
+    page_counts = await asyncio.gather(*[asyncio.to_thread(count_pages, upload) for upload in uploads])
+
+    tasks = []
+    for upload, pages in zip(uploads, page_counts):
+        task_id = uuid.uuid4()
+        cost = estimate_cost(pages, upload.size, TABLE_MODE)
+        task_status = {"status" : "pending", "tenant": tenant, "estimate": {"pages": pages, "cost": round(cost, 1)}}
+
+        filename_wo_ext = upload.file_name.replace(".pdf", "")
+        filename_wo_ext = re.sub(r"\s+", " ", filename_wo_ext)
+        filename_wo_ext = re.sub(r"\s", "_", filename_wo_ext)
+        # the json files of different pdfs uploaded with the same name must not overwrite each other
+        filename_wo_ext = f"{filename_wo_ext}-{upload.content_hash[:12]}"
+        enqueued_at = time.perf_counter()
+        item = Item(
+            task_id=task_id, file_path=upload.file_path, fil_path_wo_extn=filename_wo_ext,
+            enqueued_at=enqueued_at, file_name=upload.file_name, content_hash=upload.content_hash,
+            tenant=tenant, pages=pages, cost=cost, deadline=get_deadline(enqueued_at, timeout),
+        )
+
+        stats = StageStats()
+        with stats.time("cache_lookup"):
+            cached_result = await asyncio.to_thread(get_cached_result, upload)
+        tasks.append((upload, item, task_status, stats, cached_result))
+    await asyncio.to_thread(create_jobs, [(upload, item, task_status) for upload, item, task_status, _, _ in tasks])
+
+    # the queue may have filled up while the files were copied and the jobs created, nothing is awaited between this
+    # check and the puts of the pdfs that are not in the result cache
+    try:
+        check_queue_capacity(scheduler, sum(cached_result is None for *_, cached_result in tasks), tenant)
+    except HTTPException as e:
+        task_ids = [item.task_id for _, item, *_ in tasks]
+        await asyncio.to_thread(update_jobs, task_ids, {"status": f"failed : {e.detail}"})
+        raise
+    for upload, item, _, _, cached_result in tasks:
+        if cached_result is None:
+            share_pdf(item, upload.content)
+            scheduler.put_nowait(item)
+
+        # background_tasks.add_task(process_pdf_extraction_task, file_path, task_id, filename_wo_ext)
+
+    for upload, item, _, stats, cached_result in tasks:
+        if cached_result is None:
+            continue
+        filename_wo_ext = item.fil_path_wo_extn
+        cached_result["processed_data"] = await asyncio.to_thread(
+            dedup_document, filename_wo_ext, cached_result["processed_data"], upload.content_hash, stats
+        )
+        with stats.time("save_json"):
+            json_path = await asyncio.to_thread(save_json, filename_wo_ext, cached_result["processed_data"])
+        stats.count("cache_hits")
+        stats.count("bytes_written", json_path.stat().st_size)
+        await asyncio.to_thread(
+            index_sections, filename_wo_ext, cached_result["processed_data"], json_path, upload.content_hash, stats
+        )
+        dataset = await asyncio.to_thread(save_dataset, filename_wo_ext, cached_result, stats)
+        logging.info(f"task_id :: {item.task_id} :: served from cache")
+        task_status = {
+            "status" : "completed",
+            "download_url": {"filename" : filename_wo_ext, "download_url": f"/download/{json_path.name}"},
+            "stats": stats.to_dict(),
+        }
+        if dataset is not None:
+            task_status["dataset"] = dataset
+        await asyncio.to_thread(job_store.update, item.task_id, task_status)
+        record_task_metrics(task_status, item.enqueued_at)
+
+    return {
+        "tasks": [
+            {"task_id" : item.task_id, "file_name": upload.file_name, "estimate": task_status["estimate"]}
+            for upload, item, task_status, _, _ in tasks
+        ]
+    }
+
+def iter_ndjson_sections(
+        pdf_file_path:str, process_data: bool= True, extract_table: bool = True, stream:bytearray = None,
+        ):
+    """
+    yields the parsed sections of the pdf as json lines, a failure is reported as a last {"error": ...} line
+    the pdf is read from stream when given
+    """
+    try:
+        extractor = PDFExtractor(str(pdf_file_path), stream=stream)
+        for section in extractor.iter_sections(
+            process_data=process_data, extract_tables=extract_table, categorizer_engine=CATEGORIZER_ENGINE,
+            table_mode=TABLE_MODE, page_cache=page_cache, memory_budget_mb=MEMORY_BUDGET_MB, layouts=layouts,
+        ):
+            yield ENCODER.encode(section) + "\n"
+    except Exception as e:
+        logging.exception(f"streaming extraction of {pdf_file_path} failed")
+        yield json.dumps({"error": str(e)}) + "\n"
+
+@app.post("/parsepdf/stream/")
+async def parse_pdf_stream(file : UploadFile = File(...)):
+    """
+    parse a single pdf and stream its sections as NDJSON (one json section per line) while they are built
+    """
+    if file.content_type != "application/pdf":
+        raise HTTPException(status_code=415, detail=f"{file.filename} is not a valid pdf")
 
-            file_path = UPLOAD_DIR / file.filename
-            task_results.append({"task_id" : task_id, "file_name": file.filename})
+    if stream_slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many pdfs are streamed. Please retry later",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    await stream_slots.acquire()
 
-            filename_wo_ext = file.filename.replace(".pdf", "")
-            filename_wo_ext = re.sub(r"\s+", " ", filename_wo_ext)
-            filename_wo_ext = re.sub(r"\s", "_", filename_wo_ext)
-            item = Item(task_id=task_id, file_path=file_path, fil_path_wo_extn=filename_wo_ext)
+    try:
+        upload = await copy_pdf_file(file)
+    except Exception:
+        stream_slots.release()
+        raise
 
-            request.state.q.put_nowait(item)
+    async def ndjson_lines():
+        STREAMS_IN_FLIGHT.inc()
+        try:
+            sections = iter_ndjson_sections(upload.file_path, stream=upload.content)
+            async for line in iterate_in_threadpool(sections):
+                yield line
+        finally:
+            STREAMS_IN_FLIGHT.dec()
+            stream_slots.release()
 
-            # background_tasks.add_task(process_pdf_extraction_task, file_path, task_id, filename_wo_ext)
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
-    return {"tasks": task_results}
+@app.get("/search/")
+async def search_sections(q: str, limit: int = 10, document: str = None, raw: bool = False):
+    """
+    full text search over the sections of the parsed pdfs, the best sections by bm25 score first.
+    The sections have to contain all words of q, with raw q is a SQLite FTS5 query (OR, NOT, prefix*, "phrases",
+    title:word). document limits the search to one parsed json file (its name without .json)
+    """
+    limit = min(max(limit, 1), SEARCH_MAX_LIMIT)
+    start = time.perf_counter()
+    try:
+        hits = await asyncio.to_thread(section_index.search, q, limit=limit, doc_id=document, raw=raw)
+    except sqlite3.OperationalError as e:
+        raise HTTPException(status_code=422, detail=f"invalid query :: {str(e)}")
+    for hit in hits:
+        hit["download_url"] = f"/download/{hit.pop('json_file')}"
+    return {"query": q, "hits": hits, "took_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+@app.get("/dedup_report/")
+async def get_dedup_report(top: int = 10):
+    """
+    dedup ratio of the parsed pdfs (share of the section content written as reference to a near-duplicate section)
+    and the most duplicated sections, 404 when PDF_PARSER_DEDUP is not set
+    """
+    if section_dedup is None:
+        raise HTTPException(status_code=404, detail="section dedup is disabled, set PDF_PARSER_DEDUP")
+    return await asyncio.to_thread(section_dedup.report, top=min(max(top, 0), SEARCH_MAX_LIMIT))
+
+@app.get("/dedup_section/{doc_id}/{section_idx}/")
+async def get_dedup_section(doc_id: str, section_idx: int):
+    """
+    title and content of the canonical section a duplicate_of reference points to
+    """
+    if section_dedup is None:
+        raise HTTPException(status_code=404, detail="section dedup is disabled, set PDF_PARSER_DEDUP")
+    section = await asyncio.to_thread(section_dedup.get_section, doc_id, section_idx)
+    if section is None:
+        raise HTTPException(status_code=404, detail=f"no canonical section {section_idx} of {doc_id}")
+    return section
+
+@app.get("/metrics")
+async def get_metrics(request : Request):
+    """
+    service metrics in the Prometheus text format
+    """
+    QUEUE_DEPTH.set(request.state.scheduler.qsize())
+    QUEUE_COST.set(request.state.scheduler.queued_cost)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 def is_valid_uuid(input_string: str) -> bool:
     """
@@ -191,21 +901,133 @@ async def get_task_status(task_id: str):
     """
     """
     if is_valid_uuid(task_id):
-        status = task_statuses.get(uuid.UUID(task_id), {"status": "Task not found"})
+        status = job_store.get(task_id) or {"status": "Task not found"}
     else:
         status = {"status": "invalid task id"}
     
     return status
 
+@app.post("/cancel_task/{task_id}/")
+async def cancel_task(request : Request, task_id: str):
+    """
+    cancels a queued or running task, a running extraction is stopped. The task status becomes cancelled
+    a task queued / running in another api process (uvicorn workers) is cancelled by that process within
+    CANCEL_POLL_SECONDS
+    """
+    if not is_valid_uuid(task_id):
+        raise HTTPException(status_code=422, detail="invalid task id")
+    status = job_store.get(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if is_finished(status["status"]) or not job_store.request_cancel(task_id):
+        raise HTTPException(status_code=409, detail=f"Task is finished already :: {status['status']}")
+    cancel_local_task(request.state.scheduler, uuid.UUID(task_id))
+
+    return {"task_id": task_id, "status": job_store.get(task_id)["status"], "cancel_requested": True}
+
+def validate_task_ids(task_ids:List[str]) -> List[str]:
+    """
+    the distinct task ids in the given order, invalid ids and more than MAX_WATCHED_TASKS are rejected with 422
+    """
+    task_ids = list(dict.fromkeys(task_ids))
+    if len(task_ids) > MAX_WATCHED_TASKS:
+        raise HTTPException(status_code=422, detail=f"at most {MAX_WATCHED_TASKS} task ids per request")
+    invalid = [task_id for task_id in task_ids if not is_valid_uuid(task_id)]
+    if invalid:
+        raise HTTPException(status_code=422, detail=f"invalid task ids :: {invalid}")
+    return task_ids
+
+async def get_task_changes(task_ids:List[str], since:int) -> tuple:
+    """
+    statuses of the tasks written after the version since : ({task_id: status}, version of the last change)
+    """
+    changes = await asyncio.to_thread(job_store.changes, task_ids, since)
+    return {task_id: status for task_id, _, status in changes}, max([since] + [version for _, version, _ in changes])
+
+@app.get("/task_updates/")
+async def get_task_updates(task_ids: List[str] = Query(...), since: int = 0, timeout: float = 30):
+    """
+    long poll for the status of many tasks : waits up to timeout seconds until one of the tasks changes after the
+    version since and returns the changed statuses (with the page progress of running tasks), the version to pass
+    as since of the next request and the tasks not finished yet. since=0 returns the current status of all tasks
+    """
+    task_ids = validate_task_ids(task_ids)
+    deadline = time.monotonic() + min(max(timeout, 0), LONG_POLL_MAX_SECONDS)
+    while True:
+        tasks, version = await get_task_changes(task_ids, since)
+        if tasks or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(EVENTS_POLL_SECONDS)
+
+    current = tasks if since == 0 else (await get_task_changes(task_ids, 0))[0]
+    pending = [task_id for task_id, status in current.items() if not is_finished(status["status"])]
+    if since == 0:
+        for task_id in task_ids:
+            tasks.setdefault(task_id, {"status": "Task not found"})
+    return {"version": version, "tasks": tasks, "pending": pending}
+
+@app.get("/task_events/")
+async def get_task_events(request : Request, task_ids: List[str] = Query(...)):
+    """
+    server sent events of the status changes of the tasks : one "status" event per change with the task id and its
+    status (with the page progress of running tasks) as json data, the current status of every task first.
+    The event id is the job store version, a reconnecting client resumes after its Last-Event-ID.
+    The stream ends when all tasks are finished
+    """
+    task_ids = validate_task_ids(task_ids)
+    last_event_id = request.headers.get("last-event-id", "0")
+    since = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def events():
+        version = since
+        # the current statuses, tasks unchanged since Last-Event-ID are not sent again
+        changes = await asyncio.to_thread(job_store.changes, task_ids, 0)
+        found = {task_id for task_id, _, _ in changes}
+        pending = set(found)
+        for task_id in task_ids:
+            if task_id not in found:
+                yield f"event: status\ndata: {ENCODER.encode({'task_id': task_id, 'status': 'Task not found'})}\n\n"
+        last_sent = time.monotonic()
+        while True:
+            for task_id, task_version, status in changes:
+                if is_finished(status["status"]):
+                    pending.discard(task_id)
+                if task_version <= version:
+                    continue
+                version = task_version
+                last_sent = time.monotonic()
+                yield f"id: {version}\nevent: status\ndata: {ENCODER.encode({'task_id': task_id, **status})}\n\n"
+            if not pending or await request.is_disconnected():
+                break
+            if time.monotonic() - last_sent >= EVENTS_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keepalive\n\n"
+            await asyncio.sleep(EVENTS_POLL_SECONDS)
+            changes = await asyncio.to_thread(job_store.changes, list(pending), version)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/jobs/{content_hash}/")
+async def get_jobs_by_hash(content_hash: str):
+    """
+    tasks of the pdf with the given sha256 (the name of the stored upload), the latest first
+    """
+    if not re.fullmatch(r"[0-9a-f]{64}", content_hash):
+        raise HTTPException(status_code=422, detail="content hash must be a sha256 hex digest")
+
+    return {"content_hash": content_hash, "tasks": job_store.find(content_hash)}
+
 @app.get("/download/{filename}")
-async def download_parsed_files(file_name:str):
+async def download_parsed_files(filename:str):
     """
+    download a parsed json (or .json.gz) file
     """
-    json_path = JSON_DIR / file_name
-    if not json_path.exists():
-        return HTTPException(status_code=404, detail=f"File {file_name} not found")
-    
-    return FileResponse(json_path, media_type="application/json", filename=file_name)
+    json_path = JSON_DIR / filename
+    if not json_path.is_file():
+        raise HTTPException(status_code=404, detail=f"File {filename} not found")
+
+    media_type = "application/gzip" if filename.endswith(".gz") else "application/json"
+    return FileResponse(json_path, media_type=media_type, filename=filename)
 
 def delete_all_files(directory):
     """
@@ -227,18 +1049,30 @@ def delete_all_files(directory):
         return False
     
 @app.get("/cleanup_files/")
-async def delete_files():
+async def delete_files(clear_cache: bool = True):
     """
+    deletes the uploaded pdfs, the parsed json files and datasets, and the parsed result / page caches and the
+    layout templates unless clear_cache is false
     """
     upload_dir_del_success = delete_all_files(UPLOAD_DIR)
     json_dir_del_success = delete_all_files(JSON_DIR)
+    # the indexed sections point to the deleted json files, as do the references to the canonical sections
+    json_dir_del_success = json_dir_del_success and section_index.clear() and delete_all_files(DATASET_DIR)
+    json_dir_del_success = json_dir_del_success and (section_dedup is None or section_dedup.clear())
+    cache_del_success = True
+    if clear_cache:
+        cache_del_success = (
+            result_cache.clear() and (page_cache is None or page_cache.clear()) and (layouts is None or layouts.clear())
+        )
 
-    if upload_dir_del_success and json_dir_del_success:
-        return {"status": "Cleanup Successful"}
+    if upload_dir_del_success and json_dir_del_success and cache_del_success:
+        return {"status": "Cleanup Successful", "cache": result_cache.stats()}
     
     else:
         return {
             "status" : f"""PDF File directory cleanup : {upload_dir_del_success} \n\n 
-            Processed json file directory cleanup : {json_dir_del_success}"""
+            Processed json file directory cleanup : {json_dir_del_success} \n\n 
+            Parsed result cache cleanup : {cache_del_success}""",
+            "cache": result_cache.stats(),
         }
 
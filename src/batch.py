@@ -0,0 +1,343 @@
+"""
+Batch extraction of a corpus of pdfs from the command line.
+The pdfs of a directory (searched recursively) or of a manifest (one pdf path per line) are extracted in a process
+pool. The results are written as sharded JSON lines files (one document per line, a new shard every --shard-size
+documents), as one json file per document or as parquet / arrow datasets partitioned by document. Every finished
+document is recorded in checkpoint.jsonl of the output directory, running the same command again skips the
+documents already done, so an interrupted run resumes.
+
+usage : python src/batch.py data/corpus --output data/batch --workers 8
+        python src/batch.py manifest.txt --output data/batch --format json --gzip --memory-budget-mb 512
+        python src/batch.py data/corpus --output data/batch --format parquet --outputs raw_data processed_data
+        python src/batch.py data/monthly_reports --output data/batch --layout-dir data/layouts
+"""
+import argparse
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from dataset_writer import DATASET_FORMATS
+from json_writer import ENCODER, json_suffix
+from layout_templates import LayoutStore
+from pdf_cluster import CATEGORIZER_ENGINES
+from pdf_extractor import OUTPUTS, TABLE_MODES, PDFExtractor, validate_outputs
+from result_cache import ResultCache
+from tqdm import tqdm
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+# documents submitted to the pool per worker, bounds the results waiting to be written
+PENDING_PER_WORKER = 2
+# status of the documents in flight when a worker process died (e.g. a crash in pymupdf or the out of memory killer)
+WORKER_DIED = "failed : worker process died"
+
+def find_pdfs(source:str) -> list:
+    """
+    pdf paths of a directory (recursively, sorted) or of a manifest file with one path per line
+    relative paths of a manifest are relative to the manifest, empty lines and lines starting with # are skipped
+    """
+    source = Path(source)
+    if source.is_dir():
+        return sorted(str(path) for path in source.rglob("*") if path.suffix.lower() == ".pdf" and path.is_file())
+
+    pdf_paths = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = Path(line)
+            if not path.is_absolute():
+                path = source.parent / path
+            pdf_paths.append(str(path))
+    return pdf_paths
+
+def document_id(pdf_path:str) -> str:
+    """
+    output name of a document : file name and a short hash of the path, pdfs of different folders may share a name
+    """
+    path_hash = hashlib.sha1(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()[:8]
+    return f"{Path(pdf_path).stem}-{path_hash}"
+
+def process_document(pdf_path:str, options:dict, json_dir:str = None, dataset_dir:str = None) -> dict:
+    """
+    process pool worker : extracts a single pdf
+    with json_dir the result is written to a json file in it, with dataset_dir to the parquet / arrow datasets in it
+    (options["format"]), otherwise it is returned as encoded json line
+    the pdf extractor output (progress bars, prints) is discarded, failures are returned as status
+    """
+    start = time.perf_counter()
+    record = {"path": pdf_path, "status": "completed", "pages": 0}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            extractor = PDFExtractor(pdf_path)
+            record["pages"] = len(extractor.pdf_doc)
+            if json_dir is not None:
+                json_path = Path(json_dir) / f"{document_id(pdf_path)}{json_suffix(options['gzip'])}"
+                record["bytes"] = extractor.write_json(
+                    json_path, outputs=options["outputs"], compress=options["gzip"], **options["extract"],
+                )
+                record["file"] = json_path.name
+            elif dataset_dir is not None:
+                record["bytes"] = extractor.write_dataset(
+                    dataset_dir, document_id(pdf_path), outputs=options["outputs"], format=options["format"],
+                    **options["extract"],
+                )
+                record["file"] = document_id(pdf_path)
+            else:
+                result = extractor.extract_all_text_blocks(
+                    outputs=options["outputs"], cache=options["cache"], **options["extract"],
+                )
+                record["line"] = ENCODER.encode({"path": pdf_path, **result}) + "\n"
+            extractor.pdf_doc.close()
+    except Exception as e:
+        record["status"] = f"failed : {str(e)}"
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+class Checkpoint:
+    """
+    Append only log of the finished documents of a batch run, one json record per line.
+    For the JSON lines output a record also holds the shard and the end offset of the document line, so that a
+    shard can be cut back to its last recorded document when a run was interrupted while writing it.
+    """
+
+    def __init__(self, output_dir:Path):
+        self.path = output_dir / CHECKPOINT_FILE
+        self.records = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a partially written last line of an interrupted run
+                        continue
+                    self.records[record["path"]] = record
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def is_done(self, pdf_path:str, retry_failed:bool = False) -> bool:
+        record = self.records.get(pdf_path)
+        if record is None:
+            return False
+        return record["status"] == "completed" or not retry_failed
+
+    def add(self, record:dict):
+        self.records[record["path"]] = record
+        self.file.write(ENCODER.encode(record) + "\n")
+        self.file.flush()
+
+    def shard_ends(self) -> dict:
+        """
+        end offset of the last recorded document of every shard
+        """
+        ends = {}
+        for record in self.records.values():
+            if "shard" in record:
+                ends[record["shard"]] = max(ends.get(record["shard"], 0), record["shard_end"])
+        return ends
+
+    def close(self):
+        self.file.close()
+
+class ShardWriter:
+    """
+    Writes the document lines to numbered JSON lines shards (results-00000.jsonl), a new shard every shard_size
+    documents. With compress every line is written as its own gzip member, the shard is still a valid gzip file
+    and can be cut after any line.
+    """
+
+    def __init__(self, output_dir:Path, shard_size:int, compress:bool, shard_ends:dict):
+        self.output_dir = output_dir
+        self.shard_size = shard_size
+        self.compress = compress
+        suffix = ".jsonl.gz" if compress else ".jsonl"
+        existing = sorted(output_dir.glob(f"results-*{suffix}"))
+        # cut the shards back to the last checkpointed document, lines after it are written again
+        for path in existing:
+            end = shard_ends.get(path.name, 0)
+            if path.stat().st_size > end:
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+        # a resumed run starts a new shard
+        self.shard_idx = len(existing)
+        self.suffix = suffix
+        self.file = None
+        self.n_lines = 0
+
+    def write(self, line:str) -> tuple:
+        """
+        appends the line, returns (shard name, end offset of the line)
+        """
+        if self.file is None or self.n_lines >= self.shard_size:
+            self.close()
+            self.file = open(self.output_dir / f"results-{self.shard_idx:05d}{self.suffix}", "ab")
+            self.shard_idx += 1
+            self.n_lines = 0
+        data = line.encode("utf-8", "surrogatepass")
+        self.file.write(gzip.compress(data, compresslevel=6) if self.compress else data)
+        self.file.flush()
+        self.n_lines += 1
+        return Path(self.file.name).name, self.file.tell()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+def print_report(records:list, elapsed:float, n_skipped:int, top:int):
+    """
+    throughput of the run and the slowest documents
+    """
+    completed = [record for record in records if record["status"] == "completed"]
+    n_pages = sum(record["pages"] for record in completed)
+    print(
+        f"\n{len(completed)} documents completed :: {len(records) - len(completed)} failed :: "
+        f"{n_skipped} skipped (already done) :: {n_pages} pages :: {elapsed:.1f} s"
+    )
+    if elapsed > 0:
+        print(f"{len(completed) / elapsed:.2f} docs/sec :: {n_pages / elapsed:.1f} pages/sec")
+    if records:
+        print("\nslowest documents")
+        for record in sorted(records, key=lambda record: record["seconds"], reverse=True)[:top]:
+            print(f"{record['seconds']:>9.2f} s {record['pages']:>6} pages  {record['path']}")
+    for record in records:
+        if record["status"] != "completed":
+            print(f"FAILED {record['path']} :: {record['status']}")
+
+def run_batch(args) -> list:
+    """
+    extracts the pdfs not done yet in a process pool, returns the records of the documents processed in this run
+    """
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    options = {
+        "outputs": validate_outputs(args.outputs),
+        "gzip": args.gzip,
+        "format": args.format,
+        "cache": ResultCache(args.cache_dir) if args.cache_dir else None,
+        "extract": {
+            "process_data": not args.no_process_data,
+            "extract_tables": args.table_mode != "off",
+            "categorizer_engine": args.engine,
+            "table_mode": args.table_mode if args.table_mode != "off" else "screened",
+            "memory_budget_mb": args.memory_budget_mb,
+            "layouts": LayoutStore(args.layout_dir) if args.layout_dir else None,
+        },
+    }
+
+    checkpoint = Checkpoint(output_dir)
+    pdf_paths = find_pdfs(args.source)
+    todo = [pdf_path for pdf_path in pdf_paths if not checkpoint.is_done(pdf_path, args.retry_failed)]
+    n_skipped = len(pdf_paths) - len(todo)
+    print(f"{len(pdf_paths)} pdfs :: {n_skipped} already done :: {len(todo)} to process with {args.workers} workers")
+
+    json_dir = None
+    dataset_dir = None
+    shards = None
+    if args.format == "json":
+        json_dir = output_dir / "json"
+        json_dir.mkdir(exist_ok=True)
+    elif args.format in DATASET_FORMATS:
+        dataset_dir = output_dir / "dataset"
+    else:
+        shards = ShardWriter(output_dir, args.shard_size, args.gzip, checkpoint.shard_ends())
+
+    records = []
+    start = time.perf_counter()
+    pool = None
+    try:
+        with tqdm(total=len(todo)) as pbar:
+            todo_iter = iter(todo)
+            # pdf path of the submitted documents
+            pending = {}
+            # documents in flight when a worker died, they are run again one at a time to find the one that killed it
+            suspects = []
+            while True:
+                if pool is None:
+                    pool = ProcessPoolExecutor(max_workers=args.workers, max_tasks_per_child=args.max_tasks_per_child)
+                if suspects:
+                    if not pending:
+                        pdf_path = suspects.pop(0)
+                        pending[pool.submit(process_document, pdf_path, options, json_dir, dataset_dir)] = pdf_path
+                else:
+                    # only a few documents per worker are submitted at a time, so results are written as they come
+                    for pdf_path in todo_iter:
+                        pending[pool.submit(process_document, pdf_path, options, json_dir, dataset_dir)] = pdf_path
+                        if len(pending) >= args.workers * PENDING_PER_WORKER:
+                            break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                    # a worker died (a crash in pymupdf, the out of memory killer), the pool takes no more documents.
+                    # A document that was alone in flight killed it and is recorded as failed (see --retry-failed),
+                    # so it does not block a resumed run. The remaining documents go to a new pool
+                    done, _ = wait(pending)
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = None
+                    broken = [future for future in done if isinstance(future.exception(), BrokenProcessPool)]
+                    if len(broken) > 1:
+                        suspects.extend(pending.pop(future) for future in broken)
+                        done = [future for future in done if future not in broken]
+                for future in done:
+                    pdf_path = pending.pop(future)
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        record = {"path": pdf_path, "status": WORKER_DIED, "pages": 0, "seconds": 0.0}
+                    else:
+                        record = future.result()
+                    line = record.pop("line", None)
+                    if line is not None:
+                        record["shard"], record["shard_end"] = shards.write(line)
+                    checkpoint.add(record)
+                    records.append(record)
+                    pbar.update(1)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        checkpoint.close()
+        if shards is not None:
+            shards.close()
+
+    print_report(records, time.perf_counter() - start, n_skipped, args.top)
+    return records
+
+def parse_args(argv:list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of pdfs or manifest file with one pdf path per line")
+    parser.add_argument("--output", required=True, help="output directory, also holds the checkpoint")
+    parser.add_argument(
+        "--format", default="jsonl", choices=("jsonl", "json", *DATASET_FORMATS),
+        help="sharded json lines, one json file per document or parquet / arrow datasets (see dataset_writer)",
+    )
+    parser.add_argument("--shard-size", type=int, default=1000, help="documents per json lines shard")
+    parser.add_argument("--gzip", action="store_true", help="gzip compress the output files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--max-tasks-per-child", type=int, default=100, help="documents before a worker is replaced")
+    parser.add_argument("--outputs", nargs="+", default=["processed_data"], choices=list(OUTPUTS))
+    parser.add_argument("--engine", default="dbscan", choices=list(CATEGORIZER_ENGINES))
+    parser.add_argument("--table-mode", default="screened", choices=TABLE_MODES)
+    parser.add_argument("--no-process-data", action="store_true", help="page wise sections only")
+    parser.add_argument("--memory-budget-mb", type=float, help="extract large pdfs in windows spilled to disk")
+    parser.add_argument("--cache-dir", help="ResultCache directory, only used with the json lines output")
+    parser.add_argument(
+        "--layout-dir", help="LayoutStore directory, documents matching a learned layout skip the header / footer clustering",
+    )
+    parser.add_argument("--retry-failed", action="store_true", help="process the documents that failed before again")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest documents reported")
+    return parser.parse_args(argv)
+
+def main():
+    records = run_batch(parse_args())
+    if any(record["status"] != "completed" for record in records):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
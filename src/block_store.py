@@ -0,0 +1,174 @@
+from typing import List
+
+import numpy as np
+
+# number of lines assign_headers maps at a time
+ASSIGN_CHUNK_LINES = 65536
+
+class BlockStore:
+    """
+    Compact columnar store of the text blocks of a document.
+    The block attributes are numpy arrays (page, block number, bbox and the range of the block lines), the text
+    of all lines is kept in a single string buffer with offsets and the span font sizes of every line in a single
+    array. The pymupdf "dict" blocks can be dropped as soon as a page is added.
+    After the header levels of the document are known (assign_headers) every line gets a header code which
+    indexes header_tags, the list of distinct per line header tag lists.
+    """
+
+    def __init__(
+            self, page:np.ndarray, number:np.ndarray, bbox:np.ndarray, line_offsets:np.ndarray, text:str,
+            text_offsets:np.ndarray, span_sizes:np.ndarray, span_offsets:np.ndarray,
+            ):
+        self.page = page
+        self.number = number
+        self.bbox = bbox
+        self.line_offsets = line_offsets
+        self.text = text
+        self.text_offsets = text_offsets
+        self.span_sizes = span_sizes
+        self.span_offsets = span_offsets
+        self.header_codes = None
+        self.header_tags = []
+
+    @classmethod
+    def from_page_blocks(cls, page_cnt:int, blocks:List):
+        """
+        store of the text blocks (type 0) of a pymupdf page "dict" extraction
+        """
+        number, bbox, n_lines, texts, span_sizes, n_spans = [], [], [], [], [], []
+        for blk in blocks:
+            if blk["type"] != 0:
+                continue
+            number.append(blk["number"])
+            bbox.append(blk["bbox"])
+            n_lines.append(len(blk["lines"]))
+            for line in blk["lines"]:
+                texts.append("".join([span["text"] for span in line["spans"]]))
+                span_sizes.extend(round(span["size"]) for span in line["spans"])
+                n_spans.append(len(line["spans"]))
+
+        return cls(
+            page=np.full(len(number), page_cnt, dtype=np.int32),
+            number=np.array(number, dtype=np.int32),
+            bbox=np.array(bbox, dtype=np.float64).reshape(-1, 4),
+            line_offsets=offsets(n_lines),
+            text="".join(texts),
+            text_offsets=offsets([len(txt) for txt in texts]),
+            span_sizes=np.array(span_sizes, dtype=np.int16),
+            span_offsets=offsets(n_spans),
+        )
+
+    @classmethod
+    def concat(cls, stores:List):
+        """
+        single store of the blocks of all stores, in the given order
+        """
+        stores = [store for store in stores if store is not None]
+        if not stores:
+            return cls.from_page_blocks(0, [])
+        return cls(
+            page=np.concatenate([store.page for store in stores]),
+            number=np.concatenate([store.number for store in stores]),
+            bbox=np.concatenate([store.bbox for store in stores]),
+            line_offsets=concat_offsets([store.line_offsets for store in stores]),
+            text="".join([store.text for store in stores]),
+            text_offsets=concat_offsets([store.text_offsets for store in stores]),
+            span_sizes=np.concatenate([store.span_sizes for store in stores]),
+            span_offsets=concat_offsets([store.span_offsets for store in stores]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.page)
+
+    @property
+    def n_lines(self) -> int:
+        return len(self.text_offsets) - 1
+
+    def nbytes(self) -> int:
+        """
+        approximate memory used by the store
+        """
+        arrays = [
+            self.page, self.number, self.bbox, self.line_offsets, self.text_offsets, self.span_sizes, self.span_offsets,
+        ]
+        if self.header_codes is not None:
+            arrays.append(self.header_codes)
+        return sum(arr.nbytes for arr in arrays) + len(self.text.encode("utf-8"))
+
+    def line_texts(self) -> List[str]:
+        """
+        text of every line
+        """
+        text_offsets = self.text_offsets.tolist()
+        return [self.text[start:end] for start, end in zip(text_offsets[:-1], text_offsets[1:])]
+
+    def line_blocks(self) -> np.ndarray:
+        """
+        block index of every line
+        """
+        return np.repeat(np.arange(len(self)), np.diff(self.line_offsets))
+
+    def pg_blk(self) -> List[str]:
+        """
+        page.block_number id of every block
+        """
+        return [f"{page}.{number}" for page, number in zip(self.page.tolist(), self.number.tolist())]
+
+    def assign_headers(self, header_id:dict):
+        """
+        maps the span font sizes of every line to the distinct markdown header tags of the line
+        the lines are mapped in chunks of ASSIGN_CHUNK_LINES so that the columns can be memory mapped
+        """
+        tag_codes = {}
+        header_codes = np.empty(self.n_lines, dtype=np.int32)
+        for chunk_start in range(0, self.n_lines, ASSIGN_CHUNK_LINES):
+            chunk_end = min(chunk_start + ASSIGN_CHUNK_LINES, self.n_lines)
+            span_offsets = self.span_offsets[chunk_start:chunk_end + 1].tolist()
+            span_sizes = self.span_sizes[span_offsets[0]:span_offsets[-1]].tolist()
+            span_offsets = [offset - span_offsets[0] for offset in span_offsets]
+            for line_idx, (start, end) in enumerate(zip(span_offsets[:-1], span_offsets[1:]), start=chunk_start):
+                tags = tuple(dict.fromkeys(header_id.get(size, "") for size in span_sizes[start:end]))
+                header_codes[line_idx] = tag_codes.setdefault(tags, len(tag_codes))
+        self.header_codes = header_codes
+        self.header_tags = [list(tags) for tags in tag_codes]
+
+    def line_header_tags(self) -> List[List[str]]:
+        """
+        header tag list of every line (assign_headers has to be called first)
+        """
+        return [self.header_tags[code] for code in self.header_codes.tolist()]
+
+    def iter_windows(self):
+        """
+        yields (index of the first block, store) of consecutive windows of the blocks, the store itself is the only
+        window of an in memory store (see spill_store.SpilledBlockStore)
+        """
+        yield 0, self
+
+    def iter_block_lines(self, values:List):
+        """
+        yields the slice of the per line values belonging to every block
+        """
+        line_offsets = self.line_offsets.tolist()
+        for start, end in zip(line_offsets[:-1], line_offsets[1:]):
+            yield values[start:end]
+
+
+def offsets(lengths:List) -> np.ndarray:
+    """
+    start offsets (and the final end offset) of consecutive items with the given lengths
+    """
+    result = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(np.asarray(lengths, dtype=np.int64), out=result[1:])
+    return result
+
+def concat_offsets(offsets_lst:List[np.ndarray]) -> np.ndarray:
+    """
+    offsets of the concatenation of the items described by every offsets array
+    """
+    shifted = [offsets_lst[0]]
+    end = offsets_lst[0][-1]
+    for item_offsets in offsets_lst[1:]:
+        shifted.append(item_offsets[1:] + end)
+        end += item_offsets[-1]
+    return np.concatenate(shifted)
@@ -0,0 +1,412 @@
+"""
+Columnar export of the extraction results : Parquet (or Arrow IPC) datasets partitioned by document, so analytics
+and embedding jobs read only the columns and documents they need instead of parsing whole json files.
+Every document is one hive partition (document_id=<id>) of each dataset :
+
+    <output>/documents/document_id=<id>/part-0.parquet   document_name, local_doc_path and the row counts
+    <output>/sections/document_id=<id>/part-0.parquet    section_idx, title, page_nos, content
+    <output>/toc/document_id=<id>/part-0.parquet         toc_idx, page, text, header_tag_md
+    <output>/tables/document_id=<id>/part-0.parquet      page, table_idx, content (markdown)
+    <output>/blocks/document_id=<id>/part-0.parquet      raw_data, one row per text block
+
+Run as script to compact a directory of parsed json files (written by the service, write_json or batch.py, json
+lines shards included) into the datasets. Files compacted before and unchanged since are skipped.
+pyarrow is only needed for this export and imported on first use.
+
+usage : python src/dataset_writer.py data/json_files --output data/datasets
+        python src/dataset_writer.py data/batch --output data/datasets --format arrow --workers 4
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+from json_writer import ENCODER, open_json_file, read_json
+from section_index import json_doc_id
+from tqdm import tqdm
+
+# parquet : compressed, for scans with column projection / filters. arrow : Arrow IPC files, uncompressed by default
+# so that they can be memory mapped
+DATASET_FORMATS = ("parquet", "arrow")
+DEFAULT_COMPRESSION = {"parquet": "zstd", "arrow": None}
+FILE_SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow"}
+
+DATASETS = ("documents", "sections", "toc", "tables", "blocks")
+PARTITION_COLUMN = "document_id"
+# rows buffered per dataset before they are written as one parquet row group / arrow record batch
+BATCH_ROWS = 4096
+
+# source files compacted by compact_json_dir, the leading _ hides the file from the dataset readers
+COMPACTED_FILE = "_compacted.jsonl"
+
+def import_pyarrow():
+    """
+    pyarrow with the dataset, ipc and parquet modules, raises when it is not installed
+    """
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("The parquet / arrow export needs pyarrow :: pip install pyarrow") from None
+    return pyarrow
+
+@functools.lru_cache(maxsize=None)
+def get_schemas() -> dict:
+    """
+    schema of every dataset, without the document_id partition column
+    """
+    pa = import_pyarrow()
+    return {
+        "documents": pa.schema([
+            ("document_name", pa.string()),
+            ("local_doc_path", pa.string()),
+            ("n_sections", pa.int32()),
+            ("n_toc", pa.int32()),
+            ("n_tables", pa.int32()),
+            ("n_blocks", pa.int32()),
+        ]),
+        "sections": pa.schema([
+            ("section_idx", pa.int32()),
+            ("title", pa.string()),
+            ("page_nos", pa.list_(pa.int32())),
+            ("content", pa.string()),
+            # canonical section of a near-duplicate section (see section_dedup), null for the other sections
+            ("duplicate_of_doc_id", pa.string()),
+            ("duplicate_of_section_idx", pa.int32()),
+            ("similarity", pa.float64()),
+        ]),
+        "toc": pa.schema([
+            ("toc_idx", pa.int32()),
+            ("page", pa.int32()),
+            ("text", pa.string()),
+            ("header_tag_md", pa.string()),
+        ]),
+        "tables": pa.schema([
+            ("page", pa.int32()),
+            ("table_idx", pa.int32()),
+            ("content", pa.string()),
+        ]),
+        # text_and_tag of the raw_data is left out, it repeats text_lst and header_tag
+        "blocks": pa.schema([
+            ("page", pa.int32()),
+            ("pg_blk", pa.string()),
+            ("bbox", pa.list_(pa.float64(), 4)),
+            ("rect_center", pa.list_(pa.float64(), 2)),
+            ("text_lst", pa.list_(pa.string())),
+            ("header_tag", pa.list_(pa.list_(pa.string()))),
+            ("cluster", pa.int32()),
+            ("header_footer", pa.bool_()),
+        ]),
+    }
+
+def validate_format(format:str) -> str:
+    if format not in DATASET_FORMATS:
+        raise Exception(f"Invalid dataset format :: {format} :: expected one of {DATASET_FORMATS}")
+    return format
+
+def partition_dir(output_dir, dataset:str, document_id:str) -> Path:
+    """
+    hive partition directory of the document, the document id is url encoded as the partition value
+    """
+    return Path(output_dir) / dataset / f"{PARTITION_COLUMN}={quote(document_id, safe='')}"
+
+def iter_section_rows(sections):
+    for section_idx, section in enumerate(sections):
+        duplicate_of = section.get("duplicate_of") or {}
+        yield {
+            "section_idx": section_idx, "title": section["title"], "page_nos": section["page_nos"],
+            "content": section["content"], "duplicate_of_doc_id": duplicate_of.get("doc_id"),
+            "duplicate_of_section_idx": duplicate_of.get("section_idx"), "similarity": duplicate_of.get("similarity"),
+        }
+
+def iter_toc_rows(toc):
+    for toc_idx, entry in enumerate(toc):
+        yield {"toc_idx": toc_idx, "page": entry["page"], "text": entry["text"], "header_tag_md": entry["header_tag_md"]}
+
+def iter_table_rows(tables):
+    for rec in tables:
+        for table_idx, table in enumerate(rec["tables"]):
+            yield {"page": rec["page"], "table_idx": table_idx, "content": table}
+
+class PartitionFile:
+    """
+    Writes the rows of one dataset of a document in batches of BATCH_ROWS rows to a temporary file, commit moves it
+    over the partition file. A document without rows in the dataset has no file, so empty tables are not written
+    :: Args ::
+        Param :: path :: partition file
+        Param :: schema :: pyarrow schema of the rows
+        Param :: format :: one of DATASET_FORMATS
+        Param :: compression :: parquet / arrow ipc compression codec or None
+    """
+
+    def __init__(self, path:Path, schema, format:str, compression:str = None):
+        self.path = path
+        self.tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        self.schema = schema
+        self.format = format
+        self.compression = compression
+        self.columns = {name: [] for name in schema.names}
+        self.n_rows = 0
+        self.sink = None
+        self.writer = None
+
+    def append(self, row:dict):
+        for name, values in self.columns.items():
+            values.append(row[name])
+        if len(values) >= BATCH_ROWS:
+            self.flush()
+
+    def open(self):
+        pa = import_pyarrow()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.format == "parquet":
+            self.writer = pa.parquet.ParquetWriter(self.tmp_path, self.schema, compression=self.compression or "none")
+        else:
+            self.sink = pa.OSFile(str(self.tmp_path), "wb")
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            self.writer = pa.ipc.new_file(self.sink, self.schema, options=options)
+
+    def flush(self):
+        n_pending = len(next(iter(self.columns.values())))
+        if n_pending == 0:
+            return
+        batch = import_pyarrow().RecordBatch.from_pydict(self.columns, schema=self.schema)
+        if self.writer is None:
+            self.open()
+        self.writer.write_batch(batch)
+        self.n_rows += n_pending
+        self.columns = {name: [] for name in self.schema.names}
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+
+    def commit(self) -> int:
+        """
+        replaces the partition file with the written rows (removes it when there are none), returns its size
+        """
+        self.flush()
+        self.close()
+        if self.n_rows == 0:
+            remove_partition_file(self.path)
+            return 0
+        os.replace(self.tmp_path, self.path)
+        return self.path.stat().st_size
+
+    def abort(self):
+        self.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+def remove_partition_file(path:Path):
+    path.unlink(missing_ok=True)
+    # the partition directory is only removed when no other file is in it
+    with contextlib.suppress(OSError):
+        path.parent.rmdir()
+
+def write_rows(path:Path, dataset:str, rows, format:str, compression:str) -> tuple:
+    """
+    writes the rows (any iterable of row dicts) to the partition file, returns (number of rows, bytes written)
+    """
+    partition_file = PartitionFile(path, get_schemas()[dataset], format, compression)
+    try:
+        for row in rows:
+            partition_file.append(row)
+        n_bytes = partition_file.commit()
+    except BaseException:
+        partition_file.abort()
+        raise
+    return partition_file.n_rows, n_bytes
+
+def write_document(output_dir, document_id:str, data:dict, format:str = "parquet", compression:str = "default") -> int:
+    """
+    writes the raw_data / processed_data of one document (the result of extract_all_text_blocks or the content of a
+    json file written by write_json) as partition document_id of the datasets in output_dir, the earlier partition
+    of the document is replaced. The sections, toc, tables and raw_data records can be generators, they are written
+    in batches of BATCH_ROWS rows, returns the number of bytes written
+    compression "default" is zstd for parquet and uncompressed for arrow, None writes uncompressed files
+    """
+    format = validate_format(format)
+    if compression == "default":
+        compression = DEFAULT_COMPRESSION[format]
+    suffix = FILE_SUFFIXES[format]
+    rows = {}
+    document = {"document_name": None, "local_doc_path": None}
+    if "processed_data" in data:
+        processed_data = data["processed_data"]
+        rows["toc"] = iter_toc_rows(processed_data.get("table_of_contentx_(toc)", []))
+        rows["tables"] = iter_table_rows(processed_data.get("tables", []))
+        rows["sections"] = iter_section_rows(processed_data["sections"])
+        document.update({key: processed_data.get(key) for key in document})
+    if "raw_data" in data:
+        raw_data = data["raw_data"]
+        rows["blocks"] = raw_data["sections"]
+        document.update({key: document[key] or raw_data.get(key) for key in document})
+
+    n_bytes = 0
+    for dataset in ("toc", "tables", "sections", "blocks"):
+        path = partition_dir(output_dir, dataset, document_id) / f"part-0{suffix}"
+        if dataset not in rows:
+            # the outputs not written this time are not kept from an earlier version of the document
+            remove_partition_file(path)
+            continue
+        n_rows, n_dataset_bytes = write_rows(path, dataset, rows[dataset], format, compression)
+        document[f"n_{dataset}"] = n_rows
+        n_bytes += n_dataset_bytes
+    # the documents row is written last, a reader seeing it finds the other datasets of the document complete
+    document = {"n_sections": 0, "n_toc": 0, "n_tables": 0, "n_blocks": 0, **document}
+    path = partition_dir(output_dir, "documents", document_id) / f"part-0{suffix}"
+    n_bytes += write_rows(path, "documents", [document], format, compression)[1]
+    return n_bytes
+
+def open_dataset(output_dir, dataset:str, format:str = "parquet"):
+    """
+    pyarrow dataset of one of DATASETS with the document_id partition column (always a string), e.g. the titles of
+    one document : open_dataset(dir, "sections").to_table(columns=["title"], filter=pc.field("document_id") == id)
+    """
+    pa = import_pyarrow()
+    if dataset not in DATASETS:
+        raise Exception(f"Invalid dataset :: {dataset} :: expected one of {DATASETS}")
+    partition_field = pa.field(PARTITION_COLUMN, pa.string())
+    return pa.dataset.dataset(
+        Path(output_dir) / dataset,
+        schema=get_schemas()[dataset].append(partition_field),
+        format="ipc" if validate_format(format) == "arrow" else "parquet",
+        partitioning=pa.dataset.partitioning(pa.schema([partition_field]), flavor="hive"),
+    )
+
+def find_json_files(source:str) -> list:
+    """
+    parsed json / json lines files (optionally .gz) of a directory (recursively, sorted) or the given file
+    the checkpoint of batch.py and hidden files are skipped
+    """
+    source = Path(source)
+    if source.is_file():
+        return [str(source)]
+    suffixes = (".json", ".json.gz", ".jsonl", ".jsonl.gz")
+    return sorted(
+        str(path) for path in source.rglob("*")
+        if path.name.endswith(suffixes) and not path.name.startswith((".", "_")) and path.name != "checkpoint.jsonl"
+        and path.is_file()
+    )
+
+def iter_json_documents(json_path:str):
+    """
+    yields (document id, data) of a json file or of every line of a json lines shard
+    the data of a json file is its processed_data or a dict with raw_data and / or processed_data
+    """
+    if ".jsonl" not in Path(json_path).name:
+        data = read_json(json_path)
+        if "sections" in data:
+            data = {"processed_data": data}
+        yield json_doc_id(Path(json_path)), data
+        return
+    # the shard lines are named like the json files of batch.py, imported here as batch imports this module
+    from batch import document_id
+    with open_json_file(json_path, "rt") as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                yield document_id(data["path"]), data
+
+def compact_file(json_path:str, output_dir:str, format:str, compression:str) -> dict:
+    """
+    process pool worker : writes the documents of a json / json lines file to the datasets
+    """
+    start = time.perf_counter()
+    record = {"file": json_path, "status": "completed", "documents": 0, "bytes": 0}
+    try:
+        for document_id, data in iter_json_documents(json_path):
+            record["bytes"] += write_document(output_dir, document_id, data, format=format, compression=compression)
+            record["documents"] += 1
+    except Exception as e:
+        record["status"] = f"failed : {str(e)}"
+    record["seconds"] = time.perf_counter() - start
+    return record
+
+def file_stamp(path:str) -> str:
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+def compact_json_dir(
+        source:str, output_dir:str, format:str = "parquet", compression:str = "default", workers:int = 1,
+        overwrite:bool = False,
+        ) -> list:
+    """
+    writes the documents of the parsed json files of source (see find_json_files) to the datasets of output_dir in
+    a process pool. The compacted files are recorded in output_dir / COMPACTED_FILE with their size and mtime,
+    unchanged files are skipped unless overwrite. returns the records of the files compacted in this run
+    """
+    format = validate_format(format)
+    import_pyarrow()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    compacted_path = output_dir / COMPACTED_FILE
+    compacted = {}
+    if compacted_path.exists() and not overwrite:
+        with open(compacted_path, encoding="utf-8") as f:
+            for line in f:
+                with contextlib.suppress(json.JSONDecodeError):
+                    record = json.loads(line)
+                    compacted[record["file"]] = record["stamp"]
+
+    json_paths = find_json_files(source)
+    todo = [path for path in json_paths if compacted.get(os.path.abspath(path)) != file_stamp(path)]
+    print(f"{len(json_paths)} json files :: {len(json_paths) - len(todo)} unchanged :: {len(todo)} to compact")
+
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(compacted_path, "a", encoding="utf-8") as log:
+        # the stamp is taken before the file is read, a file changed while it is compacted is compacted again
+        stamps = {path: file_stamp(path) for path in todo}
+        worker = functools.partial(compact_file, output_dir=str(output_dir), format=format, compression=compression)
+        results = pool.map(worker, todo)
+        for record in tqdm(results, total=len(todo)):
+            records.append(record)
+            if record["status"] == "completed":
+                log.write(ENCODER.encode({"file": os.path.abspath(record["file"]), "stamp": stamps[record["file"]]}) + "\n")
+                log.flush()
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="directory of parsed json / json lines files, or a single file")
+    parser.add_argument("--output", required=True, help="directory of the datasets")
+    parser.add_argument("--format", default="parquet", choices=DATASET_FORMATS)
+    parser.add_argument("--compression", default="default", help="codec (zstd, snappy, lz4, ...) or none")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--overwrite", action="store_true", help="compact the files recorded as compacted again")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    compression = None if args.compression == "none" else args.compression
+    records = compact_json_dir(
+        args.source, args.output, format=args.format, compression=compression, workers=args.workers,
+        overwrite=args.overwrite,
+    )
+    completed = [record for record in records if record["status"] == "completed"]
+    n_input_bytes = sum(os.path.getsize(record["file"]) for record in completed)
+    print(
+        f"{sum(record['documents'] for record in completed)} documents of {len(completed)} files :: "
+        f"{n_input_bytes / 2**20:.1f} MB json -> {sum(record['bytes'] for record in completed) / 2**20:.1f} MB "
+        f"{args.format} :: {time.perf_counter() - start:.1f} s"
+    )
+    for record in records:
+        if record["status"] != "completed":
+            print(f"FAILED {record['file']} :: {record['status']}")
+    if len(completed) < len(records):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
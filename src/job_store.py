@@ -0,0 +1,238 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# task states after which the job does not change anymore, finished jobs are expired after the ttl
+FINISHED_STATES = ("completed", "failed", "cancelled")
+
+# bump when the tables change, the jobs of an older database are dropped
+SCHEMA_VERSION = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    task_id TEXT PRIMARY KEY,
+    content_hash TEXT,
+    file_name TEXT,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    version INTEGER NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_content_hash ON jobs (content_hash);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+CREATE INDEX IF NOT EXISTS jobs_unfinished_owner ON jobs (owner_pid) WHERE finished_at IS NULL;
+CREATE TABLE IF NOT EXISTS job_version (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER NOT NULL);
+INSERT OR IGNORE INTO job_version VALUES (0, 0);
+"""
+
+def is_finished(status:str) -> bool:
+    """
+    completed, cancelled and failed (the status of a failed task is "failed : <reason>") tasks are finished
+    """
+    return status.startswith(FINISHED_STATES)
+
+def is_process_alive(pid:int) -> bool:
+    """
+    True when a process with the pid runs on this host, the database can only be shared by the processes of one host
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobStore:
+    """
+    Task statuses of the Fast API service in a SQLite database in WAL mode.
+    The database is shared by all api processes (uvicorn workers) and their pool workers, every process and thread
+    opens its own connection. A job is its task id, the sha256 of the pdf, the uploaded file name and the task
+    status dict (status, download_url, stats, ...) stored as json. Finished jobs are deleted ttl_seconds after they
+    finished (expire). A job is owned by the api process which created it (queued it), the unfinished jobs of an
+    api process that stopped are failed by fail_orphaned.
+    Every write gives the job the next value of a database wide version counter, in the order the writes are
+    committed, so a reader that saw all changes up to a version gets the later ones with changes(since=version).
+    :: Args ::
+        Param :: db_path :: sqlite database file, created with its directory when missing
+        Param :: ttl_seconds :: time finished jobs are kept
+    """
+
+    def __init__(self, db_path:str, ttl_seconds:float = 86400):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.local = threading.local()
+        conn = self.connect()
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.executescript(
+                f"DROP TABLE IF EXISTS jobs; DROP TABLE IF EXISTS job_version; PRAGMA user_version = {SCHEMA_VERSION};"
+            )
+        conn.executescript(SCHEMA)
+
+    def __getstate__(self):
+        # the store is passed to the process pool workers, connections cannot be pickled
+        return {"db_path": self.db_path, "ttl_seconds": self.ttl_seconds}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        connection of the current thread, a forked process opens a new one
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def write(self, sql:str, params:dict) -> int:
+        """
+        runs the insert / update of jobs in one transaction with the next version as parameter :version, returns the
+        number of written jobs
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("UPDATE job_version SET version = version + 1 RETURNING version").fetchone()[0]
+            n_rows = conn.execute(sql, {**params, "version": version}).rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return n_rows
+
+    def create(self, task_id:str, status:dict, content_hash:str = None, file_name:str = None):
+        """
+        adds a new job with the given status, owned by the current process
+        """
+        now = time.time()
+        self.write(
+            "INSERT INTO jobs (task_id, content_hash, file_name, status, data, created_at, updated_at, finished_at, "
+            "version, owner_pid) VALUES (:task_id, :content_hash, :file_name, :status, :data, :now, :now, "
+            ":finished_at, :version, :owner_pid)",
+            {
+                "task_id": str(task_id), "content_hash": content_hash, "file_name": file_name,
+                "status": status["status"], "data": json.dumps(status), "now": now,
+                "finished_at": now if is_finished(status["status"]) else None, "owner_pid": os.getpid(),
+            },
+        )
+
+    def update(self, task_id:str, status:dict):
+        """
+        replaces the status of the job, a finished status starts the ttl of the job
+        """
+        now = time.time()
+        self.write(
+            "UPDATE jobs SET status = :status, data = :data, updated_at = :now, finished_at = :finished_at, "
+            "version = :version WHERE task_id = :task_id",
+            {
+                "task_id": str(task_id), "status": status["status"], "data": json.dumps(status), "now": now,
+                "finished_at": now if is_finished(status["status"]) else None,
+            },
+        )
+
+    def fail_orphaned(self, status:dict) -> int:
+        """
+        sets the given (failed) status on the unfinished jobs of api processes that are not running anymore, their
+        queue and running extractions were lost with them. The jobs of the other live api processes (uvicorn workers)
+        are left as they are, the jobs with the pid of the current process are from a former process with the same
+        pid (e.g. a restarted container) when it is called at startup. Returns the number of failed jobs
+        """
+        conn = self.connect()
+        owner_pids = [
+            owner_pid for owner_pid, in conn.execute("SELECT DISTINCT owner_pid FROM jobs WHERE finished_at IS NULL")
+        ]
+        n_failed = 0
+        for owner_pid in owner_pids:
+            if owner_pid is not None and owner_pid != os.getpid() and is_process_alive(owner_pid):
+                continue
+            now = time.time()
+            n_failed += self.write(
+                "UPDATE jobs SET status = :status, data = :data, updated_at = :now, finished_at = :now, "
+                "version = :version WHERE owner_pid IS :owner_pid AND finished_at IS NULL",
+                {"status": status["status"], "data": json.dumps(status), "now": now, "owner_pid": owner_pid},
+            )
+        return n_failed
+
+    def get(self, task_id:str) -> dict:
+        """
+        status dict of the job or None
+        """
+        row = self.connect().execute("SELECT data FROM jobs WHERE task_id = ?", (str(task_id),)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def changes(self, task_ids:list, since:int = 0) -> list:
+        """
+        (task id, version, status dict) of the given jobs written after the version since, in version order
+        """
+        conn = self.connect()
+        rows = []
+        # the task ids are passed in chunks below the sqlite parameter limit
+        for start in range(0, len(task_ids), 500):
+            chunk = [str(task_id) for task_id in task_ids[start:start + 500]]
+            rows.extend(conn.execute(
+                f"SELECT task_id, version, data FROM jobs WHERE version > ? AND task_id IN ({','.join('?' * len(chunk))})",
+                (since, *chunk),
+            ).fetchall())
+        rows.sort(key=lambda row: row[1])
+        return [(task_id, version, json.loads(data)) for task_id, version, data in rows]
+
+    def find(self, content_hash:str, limit:int = 100) -> list:
+        """
+        jobs of the pdf with the given sha256, the latest first
+        """
+        rows = self.connect().execute(
+            "SELECT task_id, file_name, data, created_at FROM jobs WHERE content_hash = ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (content_hash, limit),
+        ).fetchall()
+        return [
+            {"task_id": task_id, "file_name": file_name, "created_at": created_at, **json.loads(data)}
+            for task_id, file_name, data, created_at in rows
+        ]
+
+    def request_cancel(self, task_id:str) -> bool:
+        """
+        marks the job to be cancelled by the api process running it (see cancel_requests), returns False when the job
+        does not exist or is finished already
+        """
+        cursor = self.connect().execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE task_id = ? AND finished_at IS NULL", (str(task_id),)
+        )
+        return cursor.rowcount > 0
+
+    def cancel_requests(self, task_ids:list) -> list:
+        """
+        the task ids of the given jobs to be cancelled
+        """
+        conn = self.connect()
+        cancelled = []
+        for start in range(0, len(task_ids), 500):
+            chunk = [str(task_id) for task_id in task_ids[start:start + 500]]
+            cancelled.extend(task_id for task_id, in conn.execute(
+                f"SELECT task_id FROM jobs WHERE cancel_requested = 1 AND task_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ))
+        return cancelled
+
+    def expire(self) -> int:
+        """
+        deletes the jobs finished more than ttl_seconds ago, returns the number of deleted jobs
+        """
+        cursor = self.connect().execute(
+            "DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        return cursor.rowcount
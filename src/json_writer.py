@@ -0,0 +1,74 @@
+import gzip
+import json
+import os
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+
+# compact separators, ensure_ascii=False keeps the text readable and small, NaN / Infinity are rejected as they
+# are not valid json
+ENCODER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, allow_nan=False)
+
+# containers down to this depth are written piece by piece, deeper values are encoded in one go by the C encoder
+STREAM_DEPTH = 3
+
+def json_suffix(compress:bool = False) -> str:
+    return ".json.gz" if compress else ".json"
+
+def open_json_file(path, mode:str = "rt", compress:bool = None):
+    """
+    opens a (gzip compressed when the name ends with .gz) json file as text
+    """
+    if compress is None:
+        compress = str(path).endswith(".gz")
+    if compress:
+        return gzip.open(path, mode, encoding="utf-8", compresslevel=6)
+    return open(path, mode.replace("t", ""), encoding="utf-8")
+
+def write_value(f, value, depth:int = 0):
+    """
+    writes the value as compact json to the text file f
+    dicts and lists down to STREAM_DEPTH and iterators (e.g. generators) at any depth are written item by item,
+    so the sections of a document can be passed as generator and are never held in memory all at once
+    """
+    if depth < STREAM_DEPTH and isinstance(value, dict):
+        f.write("{")
+        for idx, (key, item) in enumerate(value.items()):
+            if idx > 0:
+                f.write(",")
+            f.write(ENCODER.encode(str(key)))
+            f.write(":")
+            write_value(f, item, depth + 1)
+        f.write("}")
+    elif isinstance(value, Iterator) or (depth < STREAM_DEPTH and isinstance(value, (list, tuple))):
+        f.write("[")
+        for idx, item in enumerate(value):
+            if idx > 0:
+                f.write(",")
+            write_value(f, item, depth + 1)
+        f.write("]")
+    else:
+        f.write(ENCODER.encode(value))
+
+def write_json(path, data, compress:bool = False) -> int:
+    """
+    writes data as compact (optionally gzip compressed) json file, returns the number of bytes written
+    the file is written to a temporary name first so that readers never see a partial file
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open_json_file(tmp_path, "wt", compress=compress) as f:
+            write_value(f, data)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return path.stat().st_size
+
+def read_json(path):
+    """
+    reads a json file written by write_json (or json.dump)
+    """
+    with open_json_file(path, "rt") as f:
+        return json.load(f)
@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+# the fingerprint check only looks at the blocks of the first pages of a document
+FINGERPRINT_PAGES = 3
+# share of the fingerprint regions that have to be found on the first pages, and share of the page coverage of the
+# template the whole document has to reach, below it the full header / footer detection runs
+MIN_MATCH_SCORE = 0.8
+# points a block may be off the position of a learned header / footer region
+POSITION_TOLERANCE = 3.0
+# header / footer regions printed on at least this share of the pages make up the fingerprint of a template
+FINGERPRINT_PAGE_RATIO = 0.5
+# labelled blocks on fewer pages are not learned as a region : blocks the categorizer engines label on a few pages
+# only (e.g. headings at the top of some pages) would be labelled on every page of the next documents
+MIN_REGION_PAGE_RATIO = 0.1
+# least recently used templates are deleted beyond this number
+MAX_TEMPLATES = 500
+# number of blocks labelled at a time, bounds the (blocks, regions) matrices of large documents
+LABEL_CHUNK_BLOCKS = 65536
+
+# bump when the structure of the templates or the labels they are learned from change, templates of another version
+# are ignored
+TEMPLATE_VERSION = 2
+
+@dataclass
+class LayoutTemplate:
+    """
+    dataclass of a learned document layout : the header / footer regions (x0, y0, x1, y1, share of the pages they
+    are printed on) and the font size -> header tag mapping of a document whose layout was detected in full
+    """
+
+    template_id: str
+    categorizer_engine: str
+    page_size: tuple
+    regions: list
+    coverage: float
+    header_id: dict
+    body_size: int = None
+    pages: int = 0
+    version: int = TEMPLATE_VERSION
+    fingerprint: np.ndarray = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.page_size = tuple(self.page_size)
+        # json object keys are strings, the font sizes are ints
+        self.header_id = {int(size): tag for size, tag in self.header_id.items()}
+        regions = np.array(self.regions, dtype=float).reshape(-1, 5)
+        self.fingerprint = regions[regions[:, 4] >= FINGERPRINT_PAGE_RATIO, :4]
+
+    def region_hits(self, bbox:np.ndarray, regions:np.ndarray = None) -> np.ndarray:
+        """
+        (blocks, regions) boolean matrix of the blocks lying on the regions (default all regions) : same top and
+        bottom within POSITION_TOLERANCE and overlapping horizontally, the width changes with the text (page numbers)
+        """
+        regions = np.array(self.regions, dtype=float).reshape(-1, 5)[:, :4] if regions is None else regions
+        bbox = bbox[:, None, :]
+        return (
+            (np.abs(bbox[..., 1] - regions[:, 1]) <= POSITION_TOLERANCE)
+            & (np.abs(bbox[..., 3] - regions[:, 3]) <= POSITION_TOLERANCE)
+            & (bbox[..., 0] <= regions[:, 2] + POSITION_TOLERANCE)
+            & (bbox[..., 2] >= regions[:, 0] - POSITION_TOLERANCE)
+        )
+
+    def fingerprint_score(self, bbox:np.ndarray) -> float:
+        """
+        share of the fingerprint regions found among the blocks (of the first pages of a document)
+        """
+        if len(self.fingerprint) == 0:
+            return 0.0
+        return float(self.region_hits(bbox, self.fingerprint).any(axis=0).mean())
+
+    def label(self, bbox:np.ndarray) -> np.ndarray:
+        """
+        header / footer labels (1) of the blocks, in the format of the categorizer engines
+        """
+        return np.concatenate(
+            [
+                self.region_hits(np.asarray(bbox[start:start + LABEL_CHUNK_BLOCKS])).any(axis=1).astype(np.int8)
+                for start in range(0, len(bbox), LABEL_CHUNK_BLOCKS)
+            ] or [np.zeros(0, dtype=np.int8)]
+        )
+
+    def misses_headers(self, fontsizes:dict, body_size:int = None) -> bool:
+        """
+        whether the header levels of the template would be wrong for the document : its body font size is not the
+        body font of the template (body text of the document would become headers, or headers body text), or it has
+        header font sizes (larger than the body font of the template) the mapping of the template does not know
+        """
+        if self.body_size is None:
+            return False
+        if body_size is not None and body_size != self.body_size:
+            return True
+        return any(size > self.body_size and size not in self.header_id for size, count in fontsizes.items() if count)
+
+    def to_dict(self) -> dict:
+        template = asdict(self)
+        del template["fingerprint"]
+        return template
+
+def page_size_key(page_size) -> tuple:
+    """
+    page width and height rounded to points, the templates of other page sizes are not tried
+    """
+    return tuple(int(round(value)) for value in page_size)
+
+def learn_regions(bbox:np.ndarray, pages:np.ndarray, labels:np.ndarray, n_pages:int) -> list:
+    """
+    header / footer regions of a document from its header / footer labelled blocks : the blocks are grouped by their
+    top and bottom rounded to POSITION_TOLERANCE, groups printed on a single page or on less than MIN_REGION_PAGE_RATIO
+    of the pages are not part of the layout
+    """
+    labelled = np.flatnonzero(labels == 1)
+    if len(labelled) == 0 or n_pages == 0:
+        return []
+    keys = np.round(bbox[labelled][:, [1, 3]] / POSITION_TOLERANCE).astype(np.int64)
+    _, group = np.unique(keys, axis=0, return_inverse=True)
+    regions = []
+    for group_id in range(group.max() + 1):
+        idx = labelled[group.ravel() == group_id]
+        group_pages = len(np.unique(pages[idx]))
+        if group_pages < max(2, MIN_REGION_PAGE_RATIO * n_pages):
+            continue
+        regions.append([
+            round(float(bbox[idx, 0].min()), 1), round(float(bbox[idx, 1].mean()), 1),
+            round(float(bbox[idx, 2].max()), 1), round(float(bbox[idx, 3].mean()), 1),
+            round(group_pages / n_pages, 3),
+        ])
+    return regions
+
+def page_coverage(pages:np.ndarray, labels:np.ndarray) -> float:
+    """
+    share of the pages (with blocks) that have at least one header / footer block
+    """
+    n_pages = len(np.unique(pages))
+    if n_pages == 0:
+        return 0.0
+    return len(np.unique(pages[labels == 1])) / n_pages
+
+class LayoutStore:
+    """
+    On-disk store of the layout templates of recurring documents (e.g. the same report every month).
+    A template is learned from every document whose header / footer blocks were detected by a categorizer engine.
+    An incoming document is first matched against the stored templates of its page size with a cheap check of its
+    first FINGERPRINT_PAGES pages, on a match the header / footer regions and header levels of the template are
+    applied and the clustering is skipped. A poor match (fingerprint or page coverage below MIN_MATCH_SCORE, another
+    body font size or header font sizes the template does not know) falls back to the full detection, which learns a
+    new template.
+    Every template is a json file, the directory may be shared by several processes.
+    :: Args ::
+        Param :: layout_dir :: directory holding the templates
+        Param :: max_templates :: the least recently matched templates are deleted beyond this number
+        Param :: min_score :: match score required to apply a template
+    """
+
+    def __init__(self, layout_dir:str, max_templates:int = MAX_TEMPLATES, min_score:float = MIN_MATCH_SCORE):
+        self.layout_dir = Path(layout_dir)
+        self.layout_dir.mkdir(parents=True, exist_ok=True)
+        self.max_templates = max_templates
+        self.min_score = min_score
+        # template id -> (file modification time, template), reloaded when a file changes
+        self.loaded = {}
+
+    def template_path(self, template_id:str) -> Path:
+        return self.layout_dir / f"{template_id}.json"
+
+    def templates(self) -> list:
+        """
+        all stored templates, files written by other processes are loaded on the next call
+        """
+        loaded = {}
+        for path in self.layout_dir.glob("*.json"):
+            try:
+                mtime = path.stat().st_mtime_ns
+                template_id = path.stem
+                if template_id in self.loaded and self.loaded[template_id][0] == mtime:
+                    loaded[template_id] = self.loaded[template_id]
+                    continue
+                with path.open("r", encoding="utf-8") as f:
+                    template = json.load(f)
+                if template.get("version") != TEMPLATE_VERSION:
+                    continue
+                loaded[template_id] = (mtime, LayoutTemplate(**template))
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"Dropping unreadable layout template {path}. Exception Occurred: {str(e)}")
+                path.unlink(missing_ok=True)
+        self.loaded = loaded
+        return [template for _, template in loaded.values()]
+
+    def match(
+            self, block_store, page_size:tuple, categorizer_engine:str, fontsizes:dict = None, body_size:int = None,
+            ) -> tuple:
+        """
+        (template, header / footer labels of all blocks, score) of the best matching template of the blocks of a
+        document (BlockStore or SpilledBlockStore), (None, None, best score) when no template matches well enough.
+        fontsizes are the font size counts of the document and body_size its body font size, a template of another
+        body font size or missing one of its header sizes is not applied
+        """
+        page_size = page_size_key(page_size)
+        candidates = [
+            template for template in self.templates()
+            if template.page_size == page_size and template.categorizer_engine == categorizer_engine
+        ]
+        if not candidates:
+            return None, None, 0.0
+
+        # the blocks are in page order, the blocks of the first pages are the first ones
+        pages = np.asarray(block_store.page)
+        if len(pages) == 0:
+            return None, None, 0.0
+        sample_pages = np.unique(pages)[:FINGERPRINT_PAGES]
+        sample_bbox = np.asarray(block_store.bbox[:np.searchsorted(pages, sample_pages[-1], side="right")])
+        scored = sorted(
+            ((template.fingerprint_score(sample_bbox), template) for template in candidates),
+            key=lambda scored_template: scored_template[0], reverse=True,
+        )
+        best_score = scored[0][0]
+        for score, template in scored:
+            if score < self.min_score:
+                break
+            if fontsizes is not None and template.misses_headers(fontsizes, body_size):
+                continue
+            labels = template.label(block_store.bbox)
+            coverage = page_coverage(pages, labels)
+            if coverage < self.min_score * template.coverage:
+                continue
+            # matched templates are kept by the eviction
+            os.utime(self.template_path(template.template_id))
+            return template, labels, score
+        return None, None, best_score
+
+    def learn(
+            self, block_store, labels:np.ndarray, page_size:tuple, categorizer_engine:str, header_id:dict,
+            body_size:int = None,
+            ) -> LayoutTemplate:
+        """
+        stores the layout of a document from its header / footer labels and header levels, returns the template or
+        None when the document has no repeated header / footer region to recognize it by
+        """
+        bbox = np.asarray(block_store.bbox)
+        pages = np.asarray(block_store.page)
+        labels = np.asarray(labels)
+        n_pages = len(np.unique(pages))
+        regions = learn_regions(bbox, pages, labels, n_pages)
+        if not any(region[4] >= FINGERPRINT_PAGE_RATIO for region in regions):
+            return None
+
+        page_size = page_size_key(page_size)
+        # the same layout learned again replaces its template
+        key_data = json.dumps(
+            {"engine": categorizer_engine, "page_size": page_size, "regions": [region[:4] for region in regions]},
+            sort_keys=True,
+        )
+        template = LayoutTemplate(
+            template_id=hashlib.sha256(key_data.encode("utf-8")).hexdigest()[:16],
+            categorizer_engine=categorizer_engine,
+            page_size=page_size,
+            regions=regions,
+            coverage=round(page_coverage(pages, labels), 3),
+            header_id={int(size): tag for size, tag in header_id.items()},
+            body_size=body_size,
+            pages=n_pages,
+        )
+        path = self.template_path(template.template_id)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(template.to_dict(), f)
+        os.replace(tmp_path, path)
+        self.evict()
+        return template
+
+    def evict(self) -> int:
+        """
+        deletes the least recently matched templates beyond max_templates, returns the number of deleted templates
+        """
+        entries = []
+        for path in self.layout_dir.glob("*.json"):
+            try:
+                entries.append((path.stat().st_mtime, path))
+            except FileNotFoundError:
+                continue
+        entries.sort()
+        n_evicted = max(len(entries) - self.max_templates, 0)
+        for _, path in entries[:n_evicted]:
+            path.unlink(missing_ok=True)
+        return n_evicted
+
+    def stats(self) -> dict:
+        return {"templates": len(list(self.layout_dir.glob("*.json"))), "max_templates": self.max_templates}
+
+    def clear(self) -> bool:
+        """
+        deletes all templates
+        """
+        try:
+            for path in self.layout_dir.iterdir():
+                path.unlink()
+        except Exception as e:
+            print(f"failed to clear the layout templates {self.layout_dir}. Exception Occurred: {str(e)}")
+            return False
+        self.loaded = {}
+        return True
@@ -0,0 +1,138 @@
+import math
+import threading
+
+# latency buckets in seconds, pdf extractions take from milliseconds (cache hits) to minutes
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def format_value(value:float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels:dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels.items()) + "}"
+
+class Metric:
+    """
+    base class of the metrics, keeps one value per label combination
+    """
+
+    metric_type = "untyped"
+
+    def __init__(self, name:str, description:str, labelnames:tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            # metrics without labels are exported from the start
+            self.values[()] = self.initial_value()
+
+    def initial_value(self):
+        return 0
+
+    def label_key(self, labels:dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """
+        yields (sample name, labels, value) of the metric
+        """
+        for key, value in sorted(self.values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.metric_type}"]
+        with self.lock:
+            lines.extend(f"{name}{format_labels(labels)} {format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def inc(self, value:float = 1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def set(self, value:float, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, value:float = 1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value:float = 1, **labels):
+        self.inc(-value, **labels)
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name:str, description:str, labelnames:tuple = (), buckets:tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, description, labelnames)
+
+    def initial_value(self):
+        return [0] * len(self.buckets), 0.0
+
+    def observe(self, value:float, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            bucket_counts, total = self.values.get(key) or self.initial_value()
+            for idx, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    bucket_counts[idx] += 1
+                    break
+            self.values[key] = (bucket_counts, total + value)
+
+    def samples(self):
+        for key, (bucket_counts, total) in sorted(self.values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets, bucket_counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": format_value(upper_bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+class MetricsRegistry:
+    """
+    Minimal in process metrics registry rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric:Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name:str, description:str, labelnames:tuple = ()) -> Counter:
+        return self.register(Counter(name, description, labelnames))
+
+    def gauge(self, name:str, description:str, labelnames:tuple = ()) -> Gauge:
+        return self.register(Gauge(name, description, labelnames))
+
+    def histogram(
+            self, name:str, description:str, labelnames:tuple = (), buckets:tuple = DEFAULT_BUCKETS
+            ) -> Histogram:
+        return self.register(Histogram(name, description, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
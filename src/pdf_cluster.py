@@ -1,8 +1,25 @@
+import hashlib
+import re
 from collections import Counter
 from typing import List
 
 import numpy as np
-from sklearn.cluster import DBSCAN
+
+# sklearn is imported by the DBSCAN engines when they run, the repetition engine does not need it and importing it
+# takes about a second (see warm_up in pdf_extractor)
+DIGITS_PATTERN = re.compile(r"\d+")
+
+def block_features(blocks:List) -> np.ndarray:
+    """
+    (x0, y0, x1, y1, text length, page) of every block, the summary the DBSCAN engines cluster on
+    """
+    return np.array(
+        [
+            (rect[0], rect[1], rect[2], rect[3], len("\n".join(text_lst) + "\n"), int(pg_blk.split(".")[0]))
+            for rect, text_lst, pg_blk, header_tag in blocks
+        ],
+        dtype=float,
+    ).reshape(-1, 6)
 
 
 class PDFTextBlockCategorizer:
@@ -13,19 +30,26 @@ class PDFTextBlockCategorizer:
     https://github.com/pymupdf/PyMuPDF/discussions/2259#discussioncomment-6669190
     """
 
-    def __init__(self, blocks:List) :
+    def __init__(self, blocks:List, summary:np.ndarray = None) :
         self.blocks = blocks
+        self.summary = summary
+
+    def summarize(self, blocks:List) -> np.ndarray:
+        """
+        compact per block summary the clustering runs on, see block_features.
+        The summaries of consecutive parts of the blocks can be concatenated and passed as summary instead of the
+        blocks, so that the blocks of a large document never have to be in memory at once
+        """
+        return block_features(blocks)
 
     def run(self):
         """
         Run clustering on text blocks
         """
-        X = np.array(
-            [
-                (rect[0], rect[1], rect[2], rect[3], len("\n".join(text_lst) + "\n"))
-                for rect, text_lst, pg_blk, header_tag in self.blocks
-            ]
-        )
+        summary = self.summary if self.summary is not None else self.summarize(self.blocks)
+        X = summary[:, :5]
+
+        from sklearn.cluster import DBSCAN
 
         dbscan = DBSCAN()
         dbscan.fit(X)
@@ -36,4 +60,144 @@ class PDFTextBlockCategorizer:
         labels = [0 if label == most_common_label else 1 for label in labels]
         self.labels = labels
 
-        print(f"{self.n_clusters} clusters for {len(self.blocks)} blocks")
\ No newline at end of file
+        print(f"{self.n_clusters} clusters for {len(summary)} blocks")
+
+class ChunkedDBSCANTextBlockCategorizer:
+    """
+    DBSCAN variant of PDFTextBlockCategorizer which fits the clustering on chunks of pages.
+    The features are divided by explicit tolerances, so eps=1 joins blocks whose coordinates differ by about
+    position_tolerance points and whose text length differs by about length_tolerance characters.
+    PDFTextBlockCategorizer runs on the raw features with eps=0.5, the same as tolerances of 0.5. The default
+    2 points / 2 characters also join the running headers of pages whose number has one more digit.
+    Memory and run time grow with the chunk size instead of the document size.
+    """
+
+    def __init__(
+            self, blocks:List, chunk_pages:int = 50, position_tolerance:float = 2.0, length_tolerance:float = 2.0,
+            min_samples:int = 5, summary:np.ndarray = None,
+            ):
+        self.blocks = blocks
+        self.summary = summary
+        self.chunk_pages = chunk_pages
+        self.position_tolerance = position_tolerance
+        self.length_tolerance = length_tolerance
+        self.min_samples = min_samples
+
+    def summarize(self, blocks:List) -> np.ndarray:
+        """
+        compact per block summary the clustering runs on, see block_features
+        """
+        return block_features(blocks)
+
+    def run(self):
+        """
+        Run clustering on the text blocks of every chunk of pages
+        """
+        summary = self.summary if self.summary is not None else self.summarize(self.blocks)
+        X = summary[:, :5] / np.array([self.position_tolerance] * 4 + [self.length_tolerance])
+        pages = summary[:, 5].astype(int)
+        chunk_ids = (pages - 1) // self.chunk_pages
+
+        from sklearn.cluster import DBSCAN
+
+        labels = np.zeros(len(summary), dtype=int)
+        self.n_clusters = 0
+        for chunk_id in np.unique(chunk_ids):
+            chunk_idx = np.flatnonzero(chunk_ids == chunk_id)
+            dbscan = DBSCAN(eps=1.0, min_samples=self.min_samples)
+            dbscan.fit(X[chunk_idx])
+            chunk_labels = dbscan.labels_
+            self.n_clusters += len(np.unique(chunk_labels))
+            most_common_label = Counter(chunk_labels).most_common(1)[0][0]
+            labels[chunk_idx] = chunk_labels != most_common_label
+        self.labels = labels.tolist()
+
+        print(f"{self.n_clusters} clusters in {len(np.unique(chunk_ids))} chunks for {len(summary)} blocks")
+
+
+class RepetitionTextBlockCategorizer:
+    """
+    Linear time header / footer detection based on repetition across pages.
+    Running headers, footers and page numbers are printed at the same vertical position with the same text on
+    many pages. Blocks are grouped by their rounded vertical position and their text with digits masked
+    (so "Page 3" and "Page 4" match), and a group spanning at least min_page_ratio of the pages
+    (and at least min_pages pages) is labelled as header / footer when it lies in the top or bottom margin_ratio of
+    the text area (the extent of all blocks). The digits of blocks with a header tag are kept, numbered headings
+    ("Chapter 3") printed at the same position on every page are no running header.
+    """
+
+    def __init__(
+            self, blocks:List, min_page_ratio:float = 0.2, min_pages:int = 3, position_tolerance:float = 2.0,
+            margin_ratio:float = 0.15, summary:np.ndarray = None,
+            ):
+        self.blocks = blocks
+        self.summary = summary
+        self.min_page_ratio = min_page_ratio
+        self.min_pages = min_pages
+        self.position_tolerance = position_tolerance
+        self.margin_ratio = margin_ratio
+
+    def block_key(self, rect:tuple, text_lst:List, header_tag:List = ()) -> tuple:
+        """
+        repetition key of a block : rounded vertical position and a 64 bit hash of the text, with masked digits
+        unless a line of the block has a header tag
+        """
+        text = " ".join(" ".join(text_lst).split()).lower()
+        if not any("".join(tags) for tags in header_tag):
+            text = DIGITS_PATTERN.sub("#", text)
+        text_hash = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+        return (round(rect[1] / self.position_tolerance), round(rect[3] / self.position_tolerance), text_hash)
+
+    def summarize(self, blocks:List) -> np.ndarray:
+        """
+        (block key, page) of every block as integer array, the summaries of consecutive parts of the blocks can be
+        concatenated and passed as summary instead of the blocks
+        """
+        return np.array(
+            [
+                (*self.block_key(rect, text_lst, header_tag), int(pg_blk.split(".")[0]))
+                for rect, text_lst, pg_blk, header_tag in blocks
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 4)
+
+    def run(self):
+        """
+        Count on how many pages every block key appears and label the repeated ones
+        """
+        summary = self.summary if self.summary is not None else self.summarize(self.blocks)
+        keys, key_idx = np.unique(summary[:, :3], axis=0, return_inverse=True)
+        key_idx = key_idx.ravel()
+
+        # distinct (key, page) pairs give the number of pages of every key
+        key_pages = np.unique(np.stack([key_idx, summary[:, 3]], axis=1), axis=0)
+        key_n_pages = np.bincount(key_pages[:, 0], minlength=len(keys))
+
+        n_pages = len(np.unique(summary[:, 3]))
+        min_pages = max(self.min_pages, self.min_page_ratio * n_pages)
+        # rounded vertical positions of the keys against the margins of the text area
+        top, bottom = summary[:, 0].min(initial=0), summary[:, 1].max(initial=0)
+        margin = self.margin_ratio * (bottom - top)
+        in_margin = (keys[:, 1] <= top + margin) | (keys[:, 0] >= bottom - margin)
+        repeated = (key_n_pages >= min_pages) & in_margin
+
+        self.labels = repeated[key_idx].astype(int).tolist()
+        self.n_clusters = int(repeated.sum()) + 1
+
+        print(f"{int(repeated.sum())} repeated header / footer positions for {len(summary)} blocks")
+
+
+# categorizer engines selectable by name from PDFExtractor
+CATEGORIZER_ENGINES = {
+    "dbscan": PDFTextBlockCategorizer,
+    "chunked_dbscan": ChunkedDBSCANTextBlockCategorizer,
+    "repetition": RepetitionTextBlockCategorizer,
+}
+
+def get_categorizer(engine:str, blocks:List, **kwargs):
+    """
+    instantiate the categorizer engine with the given name on the text blocks
+    """
+    if engine not in CATEGORIZER_ENGINES:
+        raise Exception(f"Invalid categorizer engine :: {engine} :: expected one of {list(CATEGORIZER_ENGINES)}")
+    return CATEGORIZER_ENGINES[engine](blocks, **kwargs)
@@ -1,24 +1,139 @@
+import contextlib
+import io
 import itertools
 import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import cached_property
 from itertools import islice
-from typing import List
+from typing import Callable, List
 
 import fitz
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
-import pymupdf4llm
-from matplotlib.patches import Rectangle
-from pdf_cluster import PDFTextBlockCategorizer
+from block_store import BlockStore
+from dataset_writer import write_document
+from layout_templates import LayoutStore
+from pdf_cluster import get_categorizer
+from pdf_headers import FontSizeHeaders
+from json_writer import write_json
+from result_cache import ResultCache, hash_bytes, hash_file, hash_page, make_cache_key
+from spill_store import BlockStoreWriter, RecordSpill
+from stage_stats import StageStats
 from tqdm import tqdm
 
+# number of page chunks handed to each worker, more chunks balance uneven pages better
+PAGE_CHUNKS_PER_WORKER = 4
+
+RAW_DATA_COLUMNS = [
+    "bbox", "text_lst", "pg_blk", "header_tag", "cluster", "rect_center", "page", "header_footer", "text_and_tag",
+]
+
+# outputs of extract_all_text_blocks, raw_data has one record per text block
+OUTPUTS = ("raw_data", "processed_data")
+
+# off : no tables, screened : find_tables only on pages with enough vector edges, exhaustive : find_tables on all pages
+TABLE_MODES = ("off", "screened", "exhaustive")
+# find_tables builds the table cells from drawn lines / rectangles and a cell needs at least 4 edges,
+# so pages with fewer vector edges cannot contain a table
+TABLE_SCREEN_MIN_EDGES = 4
+
+# share of memory_budget_mb taken by the block store of one window of pages in windowed mode, the python strings
+# and records built from a window when it is read back take several times its size
+WINDOW_BUDGET_SHARE = 0.1
+
+@dataclass
+class PageRecord:
+    """
+    dataclass to store the extraction result of a single page
+    """
+
+    page: int
+    blocks: BlockStore = None
+    table_rec: dict = None
+    table_searched: bool = False
+    fontsizes: dict = None
+    stats: StageStats = None
+
+def split_page_range(n_pages:int, n_chunks:int) -> List[range]:
+    """
+    split the page indices 0..n_pages-1 into at most n_chunks contiguous ranges of similar size
+    """
+    n_chunks = max(1, min(n_chunks, n_pages))
+    chunk_size, remainder = divmod(n_pages, n_chunks)
+    page_ranges = []
+    start = 0
+    for chunk_idx in range(n_chunks):
+        stop = start + chunk_size + (1 if chunk_idx < remainder else 0)
+        page_ranges.append(range(start, stop))
+        start = stop
+    return page_ranges
+
+def extract_page_chunk(
+        pdf_path:str, page_range:range, table_mode:str="screened", fontsize_pages:set=None,
+        page_cache:ResultCache=None, stream:bytes=None,
+        ) -> list:
+    """
+    process pool worker : opens the pdf itself (from stream when given) and extracts the page records of the given
+    page range
+    """
+    extractor = PDFExtractor(pdf_path, stream=stream)
+    try:
+        return [
+            extractor.get_page_records(
+                extractor.pdf_doc[page_idx], page_idx + 1, table_mode=table_mode,
+                count_fontsizes=fontsize_pages is None or page_idx in fontsize_pages, page_cache=page_cache,
+            )
+            for page_idx in page_range
+        ]
+    finally:
+        extractor.pdf_doc.close()
+
+def validate_outputs(outputs) -> tuple:
+    """
+    the requested outputs in the order of OUTPUTS
+    """
+    if isinstance(outputs, str):
+        outputs = (outputs,)
+    invalid = set(outputs) - set(OUTPUTS)
+    if invalid or not outputs:
+        raise Exception(f"Invalid outputs :: {tuple(outputs)} :: expected one or more of {OUTPUTS}")
+    return tuple(output for output in OUTPUTS if output in outputs)
+
+def layout_key_options(layouts) -> dict:
+    """
+    cache key option of the layout templates, the labels of a matched template may differ from the categorizer
+    engine. Empty without templates so that the keys of earlier results stay valid
+    """
+    return {} if layouts is None else {"layout_templates": True}
+
+def set_document_info(result:dict, pdf_path:str, document_name:str = None) -> dict:
+    """
+    points the document name and path of a (cached) extraction result to the given pdf
+    document_name defaults to the file name of pdf_path (e.g. the uploaded name of a content addressed pdf)
+    """
+    for key in OUTPUTS:
+        if key not in result:
+            continue
+        data = result[key]
+        data["document_name"] = document_name or os.path.basename(pdf_path)
+        data["local_doc_path"] = os.path.abspath(pdf_path)
+    return result
+
 class PDFExtractor:
     """
     PDF parser to read the pdf and parse the data into more structured format
     :: Args ::
-        Param :: pdf_path :: file path of the pdf
+        Param :: pdf_path :: file path of the pdf, only the name when stream is given
+        Param :: stream :: content of the pdf (bytes, bytearray, memoryview or mmap) instead of reading pdf_path
+        Param :: headers :: precomputed header levels of the document (FontSizeHeaders or pymupdf4llm.IdentifyHeaders).
+                            When not given they are computed from the font sizes seen in the extraction pass
+        Param :: header_sample_pages :: only use the font sizes of this many evenly spaced pages for the header levels
     
     """
-    def __init__(self,pdf_path:str = ""):
+    def __init__(self,pdf_path:str = "", headers=None, header_sample_pages:int = None, stream=None):
         if pdf_path != "":
             self.pdf_filename = os.path.basename(pdf_path)
         else:
@@ -31,28 +146,64 @@ class PDFExtractor:
                 )
         
         self.pdf_path = pdf_path
-        self.pdf_doc = fitz.open(os.path.abspath(self.pdf_path))
-        self.headers = pymupdf4llm.IdentifyHeaders(self.pdf_doc)
-        if self.headers == {}:
-            print(f"Headers and TOC cannot be parsed for the document {self.pdf_filename}.\n Processing pagewise data only")
+        # pymupdf only opens bytes like objects it can hold on to, buffers (memoryview, mmap) are copied once
+        self.stream = stream if stream is None or isinstance(stream, (bytes, bytearray)) else bytes(stream)
+        self.stats = StageStats()
+        with self.stats.time("open"):
+            self.pdf_doc = self.open_document()
+        # hashes of the pdf objects shared by the pages, see result_cache.hash_page
+        self.object_digests = {}
+        self.fuse_headers = headers is None
+        self.headers = headers if headers is not None else FontSizeHeaders()
+        self.header_sample_pages = header_sample_pages
+        # windowed mode of extract_blocks, the blocks and tables are spilled to spill_tmp_dir
+        self.windowed = False
+        self.spill_tmp_dir = None
+
+    def open_document(self):
+        """opens the pdf from the stream when given, otherwise from pdf_path"""
+
+        if self.stream is not None:
+            return fitz.open(stream=self.stream, filetype="pdf")
+        return fitz.open(os.path.abspath(self.pdf_path))
+
+    @cached_property
+    def content_hash(self) -> str:
+        """sha256 of the pdf file content"""
+
+        if self.stream is not None:
+            return hash_bytes(self.stream)
+        return hash_file(self.pdf_path)
 
     def retrieve_text_from_lines(self, lines:List) -> List:
         """retrieves text from span object of pymupdf"""
 
         return ["".join([span["text"] for span in line["spans"]]) for line in lines]
     
-    def get_header4block(self, blk:dict)-> dict:
+    def get_fontsize_pages(self):
         """
-        retrieves headers from the span object of pymupdf
+        page indices whose font sizes are counted for the header levels, None for all pages
         """
-        header_lst = []
-        if "lines" in blk:
-            lines = blk["lines"]
-            header_lst = [list(set(self.headers.get_header_id(span) for span in line["spans"])) for line in lines]
-
-        blk["header_lst"] = header_lst
-        return blk
+        if not self.fuse_headers:
+            return set()
+        n_pages = len(self.pdf_doc)
+        if self.header_sample_pages is None or self.header_sample_pages >= n_pages:
+            return None
+        return set(np.linspace(0, n_pages - 1, max(self.header_sample_pages, 1)).round().astype(int).tolist())
     
+    def header_key_options(self) -> dict:
+        """
+        cache key options of the header levels : the font size -> header tag mapping of headers given by the caller,
+        the number of sampled pages of computed header levels. Empty for header levels computed from all pages so
+        that the keys of earlier results stay valid
+        """
+        if not self.fuse_headers:
+            header_id = getattr(self.headers, "header_id", None) or {}
+            return {"headers": sorted([str(size), tag] for size, tag in header_id.items())}
+        if self.get_fontsize_pages() is not None:
+            return {"header_sample_pages": self.header_sample_pages}
+        return {}
+
     def calc_rect_center(self, rect:tuple, reverse_y: bool=False) -> tuple:
         """
         given the coordinates, identify the center of the rectangle
@@ -75,181 +226,626 @@ class PDFExtractor:
         tag_lst = rec["header_tag"]
         return [{"txt": txt, "tag": tag} for txt, tag in zip(lst, tag_lst)]
     
-    def extract_all_text_blocks(
-            self, process_data:bool=True, plot_cluster:bool = False, extract_tables:bool=True
-            ) -> dict:
+    def is_table_candidate(self, page, min_edges:int = TABLE_SCREEN_MIN_EDGES) -> bool:
         """
-        extract and parse the data from pdf
+        cheap pre-screening for find_tables : whether the page draws at least min_edges lines / rectangle edges
+        """
+        n_edges = 0
+        for path in page.get_cdrawings():
+            for item in path["items"]:
+                if item[0] == "l":
+                    n_edges += 1
+                elif item[0] in ("re", "qu"):
+                    n_edges += 4
+                if n_edges >= min_edges:
+                    return True
+        return False
+
+    def extract_page_records(
+            self, page, page_cnt:int, table_mode:str="screened", count_fontsizes:bool=True
+            ) -> PageRecord:
+        """
+        extract the text blocks (as BlockStore), the tables (as dict) and the font size counts of a single page
+        the tables are None when table_mode is off
+        """
+        record = PageRecord(page=page_cnt, stats=StageStats())
+        if table_mode != "off":
+            table_lst = []
+            with record.stats.time("table_screen"):
+                table_candidate = table_mode == "exhaustive" or self.is_table_candidate(page)
+            if table_candidate:
+                record.table_searched = True
+                with record.stats.time("find_tables"):
+                    table_lst = [tbl.to_markdown(clean=False) for tbl in page.find_tables()]
+            record.table_rec = {"page": page_cnt, "tables": table_lst}
+
+        with record.stats.time("get_text"):
+            blocks = page.get_text(option="dict")["blocks"]
+        with record.stats.time("font_stats"):
+            record.fontsizes = FontSizeHeaders.count_fontsizes(blocks) if count_fontsizes else {}
+        with record.stats.time("block_store"):
+            record.blocks = BlockStore.from_page_blocks(page_cnt, blocks)
+        return record
+
+    def get_page_records(
+            self, page, page_cnt:int, table_mode:str="screened", count_fontsizes:bool=True,
+            page_cache:ResultCache=None,
+            ) -> PageRecord:
+        """
+        extract_page_records through the page cache : the records are stored under the hash of the page content
+        and resources (see result_cache.hash_page), so unchanged pages of a revised document are not decoded again
         """
-        dicts_df_lst = []
-        if extract_tables:
+        if page_cache is None:
+            return self.extract_page_records(page, page_cnt, table_mode=table_mode, count_fontsizes=count_fontsizes)
+
+        stats = StageStats()
+        with stats.time("page_cache_lookup"):
+            page_key = make_cache_key(hash_page(page, self.object_digests), kind="page", table_mode=table_mode)
+            record = page_cache.get(page_key)
+
+        if record is None:
+            stats.count("page_cache_misses")
+            # the font sizes are always kept in the cache entry, a later run may sample other pages
+            record = self.extract_page_records(page, page_cnt, table_mode=table_mode, count_fontsizes=True)
+            stats.add(record.stats)
+            record.stats = None
+            with stats.time("page_cache_store"):
+                page_cache.put(page_key, record, evict=False)
+        else:
+            stats.count("page_cache_hits")
+            # the cached record may come from another page number
+            record.page = page_cnt
+            record.blocks.page[:] = page_cnt
+            if record.table_rec is not None:
+                record.table_rec["page"] = page_cnt
+
+        if not count_fontsizes:
+            record.fontsizes = {}
+        record.stats = stats
+        return record
+
+    def iter_page_records(self, table_mode:str="screened", workers:int=1, page_cache:ResultCache=None):
+        """
+        yields the PageRecord of every page in page order
+        with workers > 1 the page range is split into chunks which are extracted in a process pool
+        with a page_cache only the pages not found in the cache are decoded
+        """
+        n_pages = len(self.pdf_doc)
+        fontsize_pages = self.get_fontsize_pages()
+        if workers <= 1 or n_pages < 2:
+            # the pages are loaded by index, the document may be reopened in between (see release_pages)
+            for page_idx in tqdm(range(n_pages), total=n_pages):
+                yield self.get_page_records(
+                    self.pdf_doc[page_idx], page_idx + 1, table_mode=table_mode,
+                    count_fontsizes=fontsize_pages is None or page_idx in fontsize_pages, page_cache=page_cache,
+                )
+            return
+
+        page_ranges = split_page_range(n_pages, workers * PAGE_CHUNKS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers) as pool, tqdm(total=n_pages) as pbar:
+            chunk_results = pool.map(
+                extract_page_chunk,
+                itertools.repeat(os.path.abspath(self.pdf_path)),
+                page_ranges,
+                itertools.repeat(table_mode),
+                itertools.repeat(fontsize_pages),
+                itertools.repeat(page_cache),
+                itertools.repeat(self.stream),
+            )
+            for page_range, records in zip(page_ranges, chunk_results):
+                yield from records
+                pbar.update(len(page_range))
+
+    def release_pages(self):
+        """
+        reopens the document, pymupdf keeps the objects of every loaded page until the document is closed
+        the cached fonts / images are released as well
+        """
+        self.pdf_doc.close()
+        self.pdf_doc = self.open_document()
+        fitz.TOOLS.store_shrink(100)
+
+    def extract_blocks(
+            self, extract_tables:bool=True, workers:int=1, categorizer_engine:str="dbscan", table_mode:str="screened",
+            page_cache:ResultCache=None, memory_budget_mb:float=None, spill_dir:str=None, progress:Callable=None,
+            layouts:LayoutStore=None,
+            ):
+        """
+        extract the text blocks and tables of all pages and separate the header / footer blocks
+        sets block_store (text blocks of all pages), labels (1 for header / footer blocks), tables_dict_lst
+        (one record per page), table_stats and stats (stage timings and counters, the page stages are summed over
+        all pages and workers)
+        categorizer_engine is one of pdf_cluster.CATEGORIZER_ENGINES (dbscan, chunked_dbscan, repetition)
+        table_mode is one of TABLE_MODES, extract_tables=False is the same as table_mode="off"
+        page_cache is a ResultCache for the page records of unchanged pages, e.g. of earlier versions of the pdf
+        memory_budget_mb turns on the windowed mode for very large documents : the pages are collected in windows of
+        about WINDOW_BUDGET_SHARE of the budget, every window is spilled to a temporary directory (in spill_dir) and
+        the pymupdf pages are released (see release_pages). block_store is then a memory mapped SpilledBlockStore and
+        tables_dict_lst a RecordSpill, the later steps read the blocks back one window at a time.
+        The result is the same as without a budget
+        progress is called with (pages done, number of pages) after every page of the page pass
+        layouts is a LayoutStore of the layouts of recurring documents : when the first pages match a stored template
+        its header / footer regions and header levels are applied instead of running the categorizer engine
+        (layout_template is set), otherwise the detected layout is stored as a new template
+        """
+        if table_mode not in TABLE_MODES:
+            raise Exception(f"Invalid table mode :: {table_mode} :: expected one of {TABLE_MODES}")
+        if not extract_tables:
+            table_mode = "off"
+
+        self.__dict__.pop("pdf_data", None)
+        # stats of this extraction, the time to open the document is kept
+        stats = StageStats()
+        stats.timings["open"] = self.stats.timings.get("open", 0.0)
+        self.stats = stats
+        self.windowed = memory_budget_mb is not None
+        if self.windowed:
+            # the directory is removed with the extractor or by the next extraction
+            self.spill_tmp_dir = tempfile.TemporaryDirectory(prefix="pdf_parser_spill_", dir=spill_dir)
+            writer = BlockStoreWriter(self.spill_tmp_dir.name)
+            window_bytes = memory_budget_mb * 1024 * 1024 * WINDOW_BUDGET_SHARE
+            window_nbytes = 0
+            self.tables_dict_lst = RecordSpill(os.path.join(self.spill_tmp_dir.name, "tables.jsonl"))
+        else:
+            self.spill_tmp_dir = None
             self.tables_dict_lst = []
-        
-        for page_idx, page in tqdm(islice(enumerate(self.pdf_doc), len(self.pdf_doc)), total=len(self.pdf_doc)):
-            page_cnt = page_idx + 1
+        self.table_stats = {
+            "table_mode": table_mode, "pages": 0, "pages_searched": 0, "pages_skipped": 0, "pages_with_tables": 0,
+            "tables": 0,
+        }
+        page_stores = []
+        if self.fuse_headers:
+            self.headers = FontSizeHeaders()
+
+        page_pass_start = time.perf_counter()
+        n_pages = len(self.pdf_doc)
+        for record in self.iter_page_records(table_mode=table_mode, workers=workers, page_cache=page_cache):
+            if progress is not None:
+                progress(self.table_stats["pages"] + 1, n_pages)
+            if self.fuse_headers:
+                self.headers.add_fontsizes(record.fontsizes)
+            self.stats.add(record.stats)
+            self.table_stats["pages"] += 1
+            if record.table_rec is not None:
+                self.tables_dict_lst.append(record.table_rec)
+                self.table_stats["pages_searched"] += int(record.table_searched)
+                self.table_stats["pages_skipped"] += int(not record.table_searched)
+                self.table_stats["pages_with_tables"] += int(len(record.table_rec["tables"]) > 0)
+                self.table_stats["tables"] += len(record.table_rec["tables"])
+            page_stores.append(record.blocks)
+            if self.windowed:
+                window_nbytes += record.blocks.nbytes()
+                if window_nbytes >= window_bytes:
+                    with self.stats.time("spill"):
+                        writer.append(BlockStore.concat(page_stores))
+                        page_stores, window_nbytes = [], 0
+                        self.release_pages()
+        if self.windowed and (page_stores or not writer.windows):
+            with self.stats.time("spill"):
+                writer.append(BlockStore.concat(page_stores))
+                page_stores = []
+        self.stats.timings["page_pass"] = time.perf_counter() - page_pass_start
+
+        if page_cache is not None:
+            self.stats.count("page_cache_hits", 0)
+            self.stats.count("page_cache_misses", 0)
+            with self.stats.time("page_cache_store"):
+                page_cache.evict()
+            print(
+                f"page cache :: {self.stats.counters.get('page_cache_hits', 0)} hits :: "
+                f"{self.stats.counters.get('page_cache_misses', 0)} misses"
+            )
 
-            if extract_tables:
-                table_lst = page.find_tables()
-                table_lst = [tbl.to_markdown(clean=False) for tbl in table_lst]
-                self.tables_dict_lst.append({"page": page_cnt, "tables": table_lst})
+        if table_mode != "off":
+            print(
+                f"find_tables ran on {self.table_stats['pages_searched']} of {self.table_stats['pages']} pages "
+                f"({table_mode}) :: {self.table_stats['tables']} tables"
+            )
 
-            dicts = page.get_text(option="dict")
-            if len(dicts["blocks"]) == 0:
-                continue
-            lines_present = any(["lines" in dct for dct in dicts["blocks"]])
-            dicts = [self.get_header4block(blk) for blk in dicts["blocks"]]
-            dicts_df = pd.DataFrame(dicts)
-            dicts_df["pg_blk"] = [str(page_cnt) + "." + str(num) for num in dicts_df["number"]]
-            
-            if lines_present:
-                dicts_df["text_lst"] = [
-                    self.retrieve_text_from_lines(lines) if blk_type == 0 else ""
-                    for blk_type, lines in zip(dicts_df["type"], dicts_df["lines"])
-                ]
+        with self.stats.time("block_store"):
+            if self.windowed:
+                self.block_store = writer.close()
+                self.stats.count("windows", len(self.block_store.windows))
+                self.stats.count("spilled_bytes", self.block_store.nbytes())
             else:
-                dicts_df["text_lst"] = [[]]
-                dicts_df["lines"] = [[]]
-            dicts_df = dicts_df[dicts_df["type"] == 0].reset_index(drop = True)
-            req_cols = ["number", "type", "bbox", "lines", "header_lst", "pg_blk", "text_lst"]
-            dicts_df = dicts_df[req_cols]
-            dicts_df_lst.append(dicts_df)
-
-        data = pd.concat(dicts_df_lst)
-
-        categorize_vectors = data[["bbox", "text_lst", "pg_blk", "header_lst"]].values.tolist()
-        categorizer = PDFTextBlockCategorizer(categorize_vectors)
-        categorizer.run()
-        del data
-        self.pdf_data = pd.concat(
-            [
-                pd.DataFrame(categorizer.blocks, columns=["bbox", "text_lst", "pg_blk", "header_tag"]),
-                pd.DataFrame(categorizer.labels, columns=["cluster"]),
-
-            ],
-            axis=1
+                self.block_store = BlockStore.concat(page_stores)
+            del page_stores
+
+        self.layout_template = None
+        if layouts is not None:
+            page_size = (self.pdf_doc[0].rect.width, self.pdf_doc[0].rect.height) if n_pages else (0, 0)
+            with self.stats.time("layout_match"):
+                self.layout_template, labels, score = layouts.match(
+                    self.block_store, page_size, categorizer_engine,
+                    fontsizes=self.headers.fontsizes if self.fuse_headers else None,
+                    body_size=self.headers.get_body_size() if self.fuse_headers else None,
+                )
+            self.stats.count("layout_hits", int(self.layout_template is not None))
+            self.stats.count("layout_misses", int(self.layout_template is None))
+            if self.layout_template is not None:
+                print(f"layout template {self.layout_template.template_id} :: score {score:.2f}")
+
+        if self.layout_template is not None and self.fuse_headers:
+            self.headers = FontSizeHeaders.from_header_id(self.layout_template.header_id)
+        elif self.fuse_headers:
+            with self.stats.time("header_levels"):
+                self.headers.compute_header_id()
+        if self.headers.header_id == {}:
+            print(f"Headers and TOC cannot be parsed for the document {self.pdf_filename}.\n Processing pagewise data only")
+
+        with self.stats.time("block_store"):
+            self.block_store.assign_headers(self.headers.header_id)
+
+        if self.layout_template is not None:
+            self.labels = labels
+            self.n_clusters = 2
+        else:
+            with self.stats.time("categorize"):
+                # the engines run on compact per block summaries built window by window
+                categorizer = get_categorizer(categorizer_engine, None)
+                categorizer.summary = np.concatenate(
+                    [
+                        categorizer.summarize(self.get_categorize_vectors(window))
+                        for _, window in self.block_store.iter_windows()
+                    ]
+                )
+                categorizer.run()
+                self.labels = np.array(categorizer.labels, dtype=np.int8)
+            self.n_clusters = categorizer.n_clusters
+            if layouts is not None:
+                with self.stats.time("layout_learn"):
+                    layouts.learn(
+                        self.block_store, self.labels, page_size, categorizer_engine, self.headers.header_id,
+                        body_size=getattr(self.headers, "body_size", None),
+                    )
+
+        self.stats.count("pages", self.table_stats["pages"])
+        self.stats.count("tables", self.table_stats["tables"])
+        self.stats.count("table_pages_searched", self.table_stats["pages_searched"])
+        self.stats.count("blocks", len(self.block_store))
+        self.stats.count("lines", self.block_store.n_lines)
+        self.stats.count("header_levels", len(self.headers.header_id))
+        self.stats.count("clusters", self.n_clusters)
+        self.stats.count("header_footer_blocks", int((self.labels == 1).sum()))
+
+    def get_categorize_vectors(self, store:BlockStore = None) -> List:
+        """
+        (bbox, text_lst, pg_blk, header_lst) of every block of the store (default block_store), the input of the
+        categorizer engines
+        """
+        if store is None:
+            store = self.block_store
+        return list(
+            zip(
+                store.bbox.tolist(),
+                store.iter_block_lines(store.line_texts()),
+                store.pg_blk(),
+                store.iter_block_lines(store.line_header_tags()),
             )
+        )
+
+    def iter_raw_records(self):
+        """
+        yields one record per text block with its lines, header tags and header / footer cluster (the raw_data)
+        """
+        for block_start, store in self.block_store.iter_windows():
+            for bbox, text_lst, pg_blk, header_tag, cluster, page in zip(
+                store.bbox.tolist(),
+                store.iter_block_lines(store.line_texts()),
+                store.pg_blk(),
+                store.iter_block_lines(store.line_header_tags()),
+                self.labels[block_start:block_start + len(store)].tolist(),
+                store.page.tolist(),
+            ):
+                bbox = tuple(bbox)
+                yield {
+                    "bbox": bbox,
+                    "text_lst": text_lst,
+                    "pg_blk": pg_blk,
+                    "header_tag": header_tag,
+                    "cluster": cluster,
+                    "rect_center": self.calc_rect_center(bbox, reverse_y=True),
+                    "page": page,
+                    "header_footer": cluster == 1,
+                    "text_and_tag": [{"txt": txt, "tag": tag} for txt, tag in zip(text_lst, header_tag)],
+                }
+
+    @cached_property
+    def pdf_data(self) -> pd.DataFrame:
+        """
+        raw_data records as dataframe, built from the block store on first access
+        """
+        return pd.DataFrame(self.iter_raw_records(), columns=RAW_DATA_COLUMNS)
+
+    def iter_content_lines(self):
+        """
+        yields (line texts, block of every line, indices of the content lines) of every window of the block store,
+        the content lines are the non empty lines of the content blocks (cluster 0)
+        """
+        for block_start, store in self.block_store.iter_windows():
+            line_texts = store.line_texts()
+            line_blocks = store.line_blocks()
+            labels = self.labels[block_start:block_start + len(store)]
+            is_content = (labels[line_blocks] == 0) & np.array([txt.strip() != "" for txt in line_texts], dtype=bool)
+            yield store, line_texts, line_blocks, np.flatnonzero(is_content)
+
+    def iter_content_texts(self):
+        """
+        yields the text of every row of expl_data, in windowed mode the texts are read back from the block store
+        """
+        if not self.windowed:
+            yield from self.expl_data["text"].tolist()
+            return
+        for _, line_texts, _, line_idx in self.iter_content_lines():
+            yield from (line_texts[idx] for idx in line_idx.tolist())
+
+    def build_header_index(self) -> pd.DataFrame:
+        """
+        explode the content blocks into lines, identify the markdown header of every line and build the toc
+        returns one row per section with the line index range [start_index, end_index) of its content
+        in windowed mode expl_data has no pg_blk column and only holds the text of the lines with a header tag,
+        the content is read back by iter_header_sections
+        """
+        header_tag_strs = ["".join(tags) for tags in self.block_store.header_tags]
+        pg_blk, pages, texts, header_tags = [], [], [], []
+        # one row per non empty line of the content blocks (cluster 0)
+        for store, line_texts, line_blocks, line_idx in self.iter_content_lines():
+            content_blocks = line_blocks[line_idx]
+            pages.append(store.page[content_blocks])
+            line_tags = [header_tag_strs[code] for code in store.header_codes[line_idx].tolist()]
+            header_tags.extend(line_tags)
+            if self.windowed:
+                texts.extend(line_texts[idx] if tag != "" else None for idx, tag in zip(line_idx.tolist(), line_tags))
+            else:
+                store_pg_blk = store.pg_blk()
+                pg_blk.extend(store_pg_blk[blk] for blk in content_blocks.tolist())
+                texts.extend(line_texts[idx] for idx in line_idx.tolist())
+
+        columns = {} if self.windowed else {"pg_blk": pg_blk}
+        self.expl_data = pd.DataFrame(
+            {
+                **columns,
+                "page": np.concatenate(pages).astype(np.int64),
+                "text": texts,
+                "header_tag": header_tags,
+            }
+        )
+
+        h_tags = sorted(set(self.expl_data["header_tag"]) - {""})
         
-        self.pdf_data["rect_center"] = [self.calc_rect_center(bbox, reverse_y=True) for bbox in self.pdf_data["bbox"]]
-        self.pdf_data["page"] = [pg_blk.split(".")[0] for pg_blk in self.pdf_data["pg_blk"]]
-        self.pdf_data["page"] = self.pdf_data["page"].astype(int)
-        self.pdf_data["header_footer"] = [True if cluster == 1 else False for cluster in self.pdf_data["cluster"]]
-        self.pdf_data["text_and_tag"] = self.pdf_data.apply(self.get_tag_txt_dct, 1)
+        if len(h_tags) > 6:
+            h_tags = h_tags[:6]
         
-        self.header_content_dict = []
-        self.toc = pd.DataFrame(None)
-        if process_data and self.headers.header_id != {}:
-            self.expl_data = self.pdf_data[self.pdf_data["cluster"] == 0].copy()
-            self.expl_data = self.expl_data.explode("text_and_tag")
-            self.expl_data.reset_index(drop = True, inplace = True)
-
-            ind_to_drop = []
-            for ind, rec in self.expl_data.iterrows():
-                if rec["text_and_tag"]["txt"].strip() == "":
-                    ind_to_drop.append(ind)
-            
-            self.expl_data.drop(index = ind_to_drop, inplace = True)
-            self.expl_data.reset_index(drop = True, inplace =True)
-
-            self.expl_data["text"] = [d["txt"] for d in self.expl_data["text_and_tag"]]
-            self.expl_data["header_tag"] = [d["tag"] for d in self.expl_data["text_and_tag"]]
-
-            self.expl_data["header_tag"] = ["".join(lst) for lst in self.expl_data["header_tag"]]
-
-            h_tags = self.expl_data["header_tag"].value_counts().index.tolist()
-            h_tags = [tag for tag in h_tags if tag != ""]
-            h_tags.sort()
-            
-            if len(h_tags) > 6:
-                h_tags = h_tags[:6]
-            
-            h_tags_map = {ele: f"h{ele.count("#")}" for ele in h_tags}
-            h_tags_map = {key: val for key, val in h_tags_map.items() if int(val[1:]) <= 6}
-
-            self.expl_data["header_tag_md"] = self.expl_data["header_tag"].map(h_tags_map)
-
-            self.toc = self.expl_data[(self.expl_data["header_tag"] != "") & (self.expl_data["cluster"] == 0)][
-                ["page", "text", "header_tag_md"]
-            ]
-
-            self.expl_data.reset_index(drop = True, inplace=True)
-
-            header_df = self.expl_data.dropna(subset="header_tag_md")[["header_tag", "header_tag_md", "text"]].copy()
-            header_df.reset_index(drop=False , inplace=True)
-            header_df["start_index"] = header_df["index"] + 1
-            
-            header_df["end_index"] = header_df["index"].shift(-1)
-            header_df["end_index"].fillna(self.expl_data.shape[0], inplace=True)
-
-            if header_df.iloc[0]["start_index"] != 0:
-                init_header_df = pd.DataFrame(
-                    [[0, "no_tag", "h0", "**no_header**", 0, header_df.iloc[0]["start_index"] - 1]],
-                    columns=header_df.columns,
-                )
-                header_df = pd.concat([init_header_df, header_df])
+        h_tags_map = {ele: f"h{ele.count('#')}" for ele in h_tags}
+        h_tags_map = {key: val for key, val in h_tags_map.items() if int(val[1:]) <= 6}
+
+        self.expl_data["header_tag_md"] = self.expl_data["header_tag"].map(h_tags_map)
+
+        self.toc = self.expl_data.loc[self.expl_data["header_tag"] != "", ["page", "text", "header_tag_md"]]
+        # header tags beyond h6 have no markdown tag, None instead of NaN keeps the toc valid json
+        self.toc["header_tag_md"] = self.toc["header_tag_md"].astype(object).where(self.toc["header_tag_md"].notna(), None)
+
+        is_header = self.expl_data["header_tag_md"].notna().to_numpy()
+        header_idx = np.flatnonzero(is_header)
+        if len(header_idx) == 0:
+            return pd.DataFrame(None)
+
+        # content of a header runs from the next line up to the following header, the text before the first
+        # header goes to the **no_header** section
+        header_df = pd.DataFrame(
+            {
+                "index": np.concatenate([[0], header_idx]),
+                "header_tag": ["no_tag"] + self.expl_data["header_tag"].to_numpy()[header_idx].tolist(),
+                "header_tag_md": ["h0"] + self.expl_data["header_tag_md"].to_numpy()[header_idx].tolist(),
+                "text": ["**no_header**"] + self.expl_data["text"].to_numpy()[header_idx].tolist(),
+                "start_index": np.concatenate([[0], header_idx + 1]),
+                "end_index": np.concatenate([header_idx, [self.expl_data.shape[0]]]),
+            }
+        )
+        return header_df
 
-            header_df.reset_index(drop = True, inplace = True)
+    def iter_header_sections(self, header_df:pd.DataFrame):
+        """
+        yields one section per header with the content lines up to the next header
+        the line ranges of the sections are consecutive, so the texts are consumed in a single pass
+        """
+        texts = self.iter_content_texts()
+        pages = self.expl_data["page"].to_numpy()
+        position = 0
+        for title, start, end in zip(header_df["text"], header_df["start_index"].tolist(), header_df["end_index"].tolist()):
+            # skip the header line in front of the content
+            next(islice(texts, start - position, start - position), None)
+            yield {
+                "title" : title,
+                "page_nos": list(dict.fromkeys(pages[start:end].tolist())),
+                "content": "\n".join(islice(texts, end - start)),
+            }
+            position = end
 
-            header_df["end_index"] = header_df["end_index"].astype(int)
+    def iter_page_sections(self):
+        """
+        yields one section per page, used when the headers of the document cannot be identified
+        the blocks are stored in page order, a page is yielded as soon as the blocks of the next page start
+        """
+        current_page, page_lines = None, []
+        for block_start, store in self.block_store.iter_windows():
+            for page, cluster, text_lst in zip(
+                store.page.tolist(),
+                self.labels[block_start:block_start + len(store)].tolist(),
+                store.iter_block_lines(store.line_texts()),
+            ):
+                if cluster != 0:
+                    continue
+                if page != current_page:
+                    if current_page is not None:
+                        yield self.get_page_section(current_page, page_lines)
+                    current_page, page_lines = page, []
+                page_lines.extend(text_lst)
+
+        if current_page is not None:
+            yield self.get_page_section(current_page, page_lines)
+
+    def get_page_section(self, page:int, page_lines:List) -> dict:
+        return {
+            "title": f"Page: {page}",
+            "page_nos": [page],
+            "content": "\n".join(page_lines),
+        }
 
-            for ind, rec in header_df.iterrows():
-                sub_dt = self.expl_data.iloc[rec["start_index"] : rec["end_index"]].copy()
-                content = "\n".join(sub_dt["text"].values.tolist())
-                self.header_content_dict.append(
-                    {
-                        "title" : rec["text"],
-                        "page_nos": list(dict.fromkeys(sub_dt["page"].values.tolist()).keys()),
-                        "content": content,
-                    }
-                )
-        
-        if self.header_content_dict == []:
-            grp_dt = pd.DataFrame(
-                self.pdf_data[self.pdf_data["cluster"] == 0].groupby("page", as_index = False)["text_lst"].apply(list)
-            )
-            grp_dt["content"] = ["\n".join(itertools.chain.from_iterable(lst)) for lst in grp_dt["text_lst"]]
-            grp_dt["title"] = "Page: " + grp_dt["page"].astype(str)
-            grp_dt["page_nos"] = [[pg] for pg in grp_dt["page"]]
-            self.header_content_dict = grp_dt[["title", "page_nos", "content"]].to_dict(orient = "records")
+    def iter_table_sections(self, tables_by_page:dict, page_nos:list, keep_pages:list = ()):
+        """
+        yields the <table> sections of the given pages (except keep_pages) and removes them from tables_by_page
+        """
+        for page in page_nos:
+            if page in keep_pages or page not in tables_by_page:
+                continue
+            for table in self.tables_dict_lst[tables_by_page.pop(page)]["tables"]:
+                yield {"title": "<table>", "page_nos": [page], "content": table}
 
-        if len(self.tables_dict_lst) > 0:
-            self.header_content_df = pd.DataFrame(self.header_content_dict)
-            self.table_df = pd.DataFrame(self.tables_dict_lst)
+    def merge_table_sections(self, sections):
+        """
+        places the extracted tables right after the last section containing their page
+        tables of pages without any section are placed at the end
+        a section is held back until the next section with page numbers is known
+        """
+        # index of the table record of every page with tables, the records may be spilled (windowed mode)
+        tables_by_page = {rec["page"]: idx for idx, rec in enumerate(self.tables_dict_lst) if len(rec["tables"]) > 0}
+        last_section = None
+        after_last_section = []
+
+        for section in sections:
+            if not section["page_nos"]:
+                if last_section is None:
+                    yield section
+                else:
+                    after_last_section.append(section)
+                continue
 
-            self.header_content_df.reset_index(drop = True, inplace=True)
-            self.header_content_df.reset_index(drop = False, inplace=True)
+            if last_section is not None:
+                yield last_section
+                yield from self.iter_table_sections(tables_by_page, last_section["page_nos"], section["page_nos"])
+                yield from after_last_section
+            last_section, after_last_section = section, []
 
-            self.table_df["table_exist"] = [True if len(lst) > 0 else False for lst in self.table_df["tables"]]
-            self.table_df = self.table_df[self.table_df["table_exist"]].copy()
+        if last_section is not None:
+            yield last_section
+            yield from self.iter_table_sections(tables_by_page, last_section["page_nos"])
+            yield from after_last_section
 
-            page_nos = self.table_df["page"].values.tolist()
+        yield from self.iter_table_sections(tables_by_page, sorted(tables_by_page))
 
-            proc_data_sub = self.header_content_df[["index", "page_nos"]].copy()
-            proc_data_sub = proc_data_sub.explode("page_nos")
-            proc_data_sub.fillna("", inplace=True)
+    def iter_processed_sections(self, process_data:bool=True):
+        """
+        yields the processed sections of the already extracted blocks (see extract_blocks)
+        """
+        self.toc = pd.DataFrame(None)
+        header_df = None
+        if process_data and self.headers.header_id != {}:
+            header_df = self.build_header_index()
 
-            ind_pos_df = (
-                proc_data_sub[proc_data_sub["page_nos"].isin(page_nos)]
-                .groupby("page_nos", as_index=False)["index"]
-                .max()
-            )
-            
-            ind_pos_df.rename(columns = {"page_nos": "page"}, inplace = True)
-            self.table_df = pd.merge(self.table_df, ind_pos_df, on = "page", how = "left")
-            self.table_df["index"] = self.table_df["index"] + 0.1
-            self.table_df["title"] = "<table>"
-            self.table_df["page"] = [[ele] for ele in self.table_df["page"]]
-            self.table_df.rename(columns={"page": "page_nos", "tables" : "content"}, inplace = True)
-            self.table_df = self.table_df.explode("content")[self.header_content_df.columns.values.tolist()]
-            self.header_content_df_with_tables = pd.concat([self.header_content_df, self.table_df])
-            self.header_content_df_with_tables.sort_values("index", inplace = True)
-            self.header_content_dict = self.header_content_df_with_tables[["title", "page_nos", "content"]].to_dict(orient= "records")
+        if header_df is not None and not header_df.empty:
+            sections = self.iter_header_sections(header_df)
+        else:
+            sections = self.iter_page_sections()
+
+        yield from self.merge_table_sections(sections)
+
+    def iter_sections(
+            self, process_data:bool=True, extract_tables:bool=True, workers:int=1, categorizer_engine:str="dbscan",
+            table_mode:str="screened", page_cache:ResultCache=None, memory_budget_mb:float=None,
+            progress:Callable=None, layouts:LayoutStore=None,
+            ):
+        """
+        extract the pdf and yield the sections (same records as processed_data["sections"]) one by one
+        sections are yielded as soon as they are built instead of collecting them into one list.
+        The pages are extracted and categorized before the first section is yielded.
+        """
+        self.extract_blocks(
+            extract_tables=extract_tables, workers=workers, categorizer_engine=categorizer_engine, table_mode=table_mode,
+            page_cache=page_cache, memory_budget_mb=memory_budget_mb, progress=progress, layouts=layouts,
+        )
+        yield from self.iter_processed_sections(process_data=process_data)
+
+    def get_output(self, output:str, sections, stream:bool=False) -> dict:
+        """
+        raw_data / processed_data dict of the extracted pdf with the given sections (a list or a generator)
+        the toc has to be built before (see iter_processed_sections)
+        with stream the tables are passed as iterator, e.g. for json_writer.write_json
+        """
+        data = {"document_name": self.pdf_filename, "local_doc_path": os.path.abspath(self.pdf_path)}
+        if output == "processed_data":
+            data["table_of_contentx_(toc)"] = self.toc.to_dict(orient="records")
+            data["tables"] = iter(self.tables_dict_lst) if stream else list(self.tables_dict_lst)
+        data["sections"] = sections
+        return data
+
+    def extract_all_text_blocks(
+            self, process_data:bool=True, plot_cluster:bool = False, extract_tables:bool=True, workers:int=1,
+            cache:ResultCache = None, categorizer_engine:str="dbscan", table_mode:str="screened",
+            outputs:tuple=OUTPUTS, page_cache:ResultCache = None, memory_budget_mb:float = None,
+            progress:Callable = None, layouts:LayoutStore = None,
+            ) -> dict:
+        """
+        extract and parse the data from pdf
+        :: Args ::
+            Param :: workers :: number of processes used for the page extraction, 1 runs serially
+            Param :: cache :: ResultCache to look up / store the result by pdf content and options.
+                             On a cache hit the result is returned as is and the dataframe attributes are not set
+            Param :: categorizer_engine :: header / footer detection engine, one of pdf_cluster.CATEGORIZER_ENGINES
+            Param :: table_mode :: screened (default) only runs find_tables on pages with vector lines / rectangles,
+                                   exhaustive runs it on every page. The counters are kept in table_stats
+            Param :: outputs :: outputs to build, raw_data (one record per text block) and / or processed_data
+            Param :: page_cache :: ResultCache of the page records by page content, only the pages not found in it
+                                   are decoded (e.g. the changed pages of a revised pdf). The hits and misses are
+                                   counted in the stats
+            Param :: memory_budget_mb :: extract the pages in windows spilled to disk (see extract_blocks), only the
+                                         result itself is held in memory. write_json streams the result as well
+            Param :: progress :: called with (pages done, number of pages) after every extracted page
+            Param :: layouts :: LayoutStore of recurring document layouts, a matching template replaces the header /
+                                footer clustering and header level detection (see extract_blocks)
+        the result holds the stage timings and counters of the extraction under "stats" (see StageStats.to_dict)
+        """
+        outputs = validate_outputs(outputs)
+        start = time.perf_counter()
+        if cache is not None:
+            cache_stats = StageStats()
+            with cache_stats.time("cache_lookup"):
+                cache_key = make_cache_key(
+                    self.content_hash, process_data=process_data, extract_tables=extract_tables,
+                    categorizer_engine=categorizer_engine, table_mode=table_mode if extract_tables else "off",
+                    outputs=list(outputs), **layout_key_options(layouts), **self.header_key_options(),
+                )
+                cached_result = cache.get(cache_key)
+            if cached_result is not None:
+                cache_stats.timings["open"] = self.stats.timings.get("open", 0.0)
+                cache_stats.count("cache_hits")
+                cache_stats.timings["total"] = time.perf_counter() - start
+                self.stats = cache_stats
+                cached_result["stats"] = self.stats.to_dict()
+                return set_document_info(cached_result, self.pdf_path)
+
+        self.extract_blocks(
+            extract_tables=extract_tables, workers=workers, categorizer_engine=categorizer_engine, table_mode=table_mode,
+            page_cache=page_cache, memory_budget_mb=memory_budget_mb, progress=progress, layouts=layouts,
+        )
+        if cache is not None:
+            self.stats.add(cache_stats)
+            self.stats.count("cache_hits", 0)
+        if "processed_data" in outputs:
+            with self.stats.time("sections"):
+                self.header_content_dict = list(self.iter_processed_sections(process_data=process_data))
+            self.stats.count("sections", len(self.header_content_dict))
 
         if plot_cluster:
+            # matplotlib is only needed for the plot, importing it takes longer than a small extraction
+            import matplotlib.pyplot as plt
+            from matplotlib.patches import Rectangle
+
             fig, ax = plt.subplots()
             colors = list("brgcmyk")
 
             for i, rec in self.pdf_data[["bbox", "rect_center", "pg_blk"]].iterrows():
-                label_idx = categorizer.labels[i]
+                label_idx = self.labels[i]
                 color = colors[label_idx]
 
                 x0,y0,x1,y1 = rec["bbox"][0], rec["bbox"][1], rec["bbox"][2], rec["bbox"][3]
@@ -260,28 +856,124 @@ class PDFExtractor:
                 plt.annotate(rec["pg_blk"], rec["rect_center"])
             plt.show()
 
-        return {
-            "raw_data": {
-                "document_name":self.pdf_filename,
-                "local_doc_path": os.path.abspath(self.pdf_path),
-                "sections": self.pdf_data.to_dict(orient="records"),
-            },
-            "processed_data": {
-                "document_name":self.pdf_filename,
-                "local_doc_path": os.path.abspath(self.pdf_path),
-                "table_of_contentx_(toc)": self.toc.to_dict(orient="records"),
-                "tables": self.tables_dict_lst,
-                "sections": self.header_content_dict
-            }
-        }
-
-
-
-
-
-
-            
-        
-
-
+        result = {}
+        if "raw_data" in outputs:
+            with self.stats.time("raw_data"):
+                result["raw_data"] = self.get_output("raw_data", list(self.iter_raw_records()))
+        if "processed_data" in outputs:
+            result["processed_data"] = self.get_output("processed_data", self.header_content_dict)
+
+        if cache is not None:
+            with self.stats.time("cache_store"):
+                cache.put(cache_key, result)
+        self.stats.timings["total"] = time.perf_counter() - start
+        result["stats"] = self.stats.to_dict()
+
+        return result
+
+    def write_json(
+            self, json_path:str, outputs:tuple=("processed_data",), compress:bool=False, process_data:bool=True,
+            extract_tables:bool=True, workers:int=1, categorizer_engine:str="dbscan", table_mode:str="screened",
+            page_cache:ResultCache=None, memory_budget_mb:float=None, progress:Callable=None,
+            layouts:LayoutStore=None,
+            ) -> int:
+        """
+        extract the pdf and write the outputs as compact json file (gzip compressed with compress), the file holds
+        the same dict as extract_all_text_blocks without the stats.
+        The sections are written one by one while they are built, returns the number of bytes written
+        with memory_budget_mb the pages are extracted in windows spilled to disk (see extract_blocks), the memory
+        use then stays about the same for any number of pages
+        progress is called with (pages done, number of pages) after every extracted page
+        """
+        outputs = validate_outputs(outputs)
+        start = time.perf_counter()
+        self.extract_blocks(
+            extract_tables=extract_tables, workers=workers, categorizer_engine=categorizer_engine, table_mode=table_mode,
+            page_cache=page_cache, memory_budget_mb=memory_budget_mb, progress=progress, layouts=layouts,
+        )
+
+        data = self.get_stream_outputs(outputs, process_data=process_data)
+        with self.stats.time("write_json"):
+            n_bytes = write_json(json_path, data, compress=compress)
+        self.stats.count("bytes_written", n_bytes)
+        self.stats.timings["total"] = time.perf_counter() - start
+        return n_bytes
+
+    def write_dataset(
+            self, output_dir:str, document_id:str=None, outputs:tuple=("processed_data",), format:str="parquet",
+            compression:str="default", process_data:bool=True, extract_tables:bool=True, workers:int=1,
+            categorizer_engine:str="dbscan", table_mode:str="screened", page_cache:ResultCache=None,
+            memory_budget_mb:float=None, progress:Callable=None, layouts:LayoutStore=None,
+            ) -> int:
+        """
+        extract the pdf and write the outputs as partition document_id (default: the file name without .pdf) of the
+        parquet / arrow datasets in output_dir, see dataset_writer.write_document. Like write_json the sections and
+        raw_data records are written in batches while they are built, returns the number of bytes written
+        """
+        outputs = validate_outputs(outputs)
+        start = time.perf_counter()
+        self.extract_blocks(
+            extract_tables=extract_tables, workers=workers, categorizer_engine=categorizer_engine, table_mode=table_mode,
+            page_cache=page_cache, memory_budget_mb=memory_budget_mb, progress=progress, layouts=layouts,
+        )
+
+        data = self.get_stream_outputs(outputs, process_data=process_data)
+        if document_id is None:
+            document_id = os.path.splitext(self.pdf_filename)[0]
+        with self.stats.time("write_dataset"):
+            n_bytes = write_document(output_dir, document_id, data, format=format, compression=compression)
+        self.stats.count("bytes_written", n_bytes)
+        self.stats.timings["total"] = time.perf_counter() - start
+        return n_bytes
+
+    def get_stream_outputs(self, outputs:tuple, process_data:bool=True) -> dict:
+        """
+        outputs of the extracted pdf with the raw_data records, the tables and the sections as generators, the
+        sections are built while they are written
+        """
+        data = {}
+        if "raw_data" in outputs:
+            data["raw_data"] = self.get_output("raw_data", self.iter_raw_records())
+        if "processed_data" in outputs:
+            sections = self.iter_processed_sections(process_data=process_data)
+            # the toc is built before the first section
+            first_sections = list(islice(sections, 1))
+            data["processed_data"] = self.get_output(
+                "processed_data", itertools.chain(first_sections, sections), stream=True,
+            )
+        return data
 
+def make_warm_up_pdf(n_pages:int = 3) -> bytes:
+    """
+    small in memory pdf with headings, body text, a running footer and a ruled table on every page
+    """
+    doc = fitz.open()
+    for page_idx in range(n_pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Section {page_idx + 1}", fontsize=16)
+        for line_idx in range(5):
+            page.insert_text((72, 110 + 14 * line_idx), f"body text line {line_idx} of page {page_idx + 1}", fontsize=10)
+        for row in range(4):
+            page.draw_line((72, 220 + 20 * row), (372, 220 + 20 * row))
+        for col in range(3):
+            page.draw_line((72 + 150 * col, 220), (72 + 150 * col, 280))
+        page.insert_text((72, 800), f"page {page_idx + 1}", fontsize=8)
+    stream = doc.tobytes()
+    doc.close()
+    return stream
+
+def warm_up(categorizer_engine:str = "dbscan", table_mode:str = "screened"):
+    """
+    runs a full extraction of a small in memory pdf, so that a fresh process (e.g. a process pool worker, see the
+    initializer in asgi) imports the lazily loaded dependencies (sklearn for the DBSCAN engines) and initializes
+    pymupdf before its first real pdf
+    """
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        extractor = PDFExtractor("warm_up.pdf", stream=make_warm_up_pdf())
+        try:
+            extractor.extract_all_text_blocks(
+                categorizer_engine=categorizer_engine, extract_tables=table_mode != "off",
+                table_mode=table_mode if table_mode != "off" else "screened",
+            )
+        finally:
+            extractor.pdf_doc.close()
@@ -0,0 +1,82 @@
+import string
+from typing import List
+
+WHITE = set(string.whitespace)
+
+
+class FontSizeHeaders:
+    """
+    Identifies the markdown header level of text spans from the font size statistics of the document.
+    Uses the same rules as pymupdf4llm.IdentifyHeaders : the font size with the most characters is the body text
+    and every larger font size is a header, the largest one being "# ", the next one "## " and so on.
+    Unlike IdentifyHeaders it does not read the document itself, the font sizes of every page are added during
+    the extraction pass of PDFExtractor and the header levels are computed once all pages are added.
+    :: Args ::
+        Param :: body_limit :: font size of the body text, the most frequent font size when not given
+    """
+
+    def __init__(self, body_limit:float = None):
+        self.body_limit = body_limit
+        # rounded font size -> number of non white characters, in order of first appearance like IdentifyHeaders
+        self.fontsizes = {}
+        self.header_id = {}
+        # font size of the body text the header levels were computed with
+        self.body_size = None
+
+    @classmethod
+    def from_header_id(cls, header_id:dict):
+        """
+        headers with a known font size -> header tag mapping, e.g. the header_id of another document
+        """
+        headers = cls()
+        headers.header_id = dict(header_id)
+        return headers
+
+    @staticmethod
+    def count_fontsizes(blocks:List) -> dict:
+        """
+        number of non white characters per rounded font size in the blocks of a page "dict" extraction
+        """
+        fontsizes = {}
+        for blk in blocks:
+            for line in blk.get("lines", []):
+                for span in line["spans"]:
+                    if WHITE.issuperset(span["text"]):
+                        continue
+                    fontsz = round(span["size"])
+                    fontsizes[fontsz] = fontsizes.get(fontsz, 0) + len(span["text"].strip())
+        return fontsizes
+
+    def add_fontsizes(self, fontsizes:dict):
+        """
+        add the font size counts of a page, pages have to be added in page order
+        """
+        for fontsz, count in fontsizes.items():
+            self.fontsizes[fontsz] = self.fontsizes.get(fontsz, 0) + count
+
+    def get_body_size(self) -> int:
+        """
+        font size of the body text : body_limit, else the most frequent of the added font sizes
+        """
+        body_limit = self.body_limit
+        if body_limit is None:
+            temp = sorted(self.fontsizes.items(), key=lambda i: i[1], reverse=True)
+            body_limit = temp[0][0] if temp else 12
+        return body_limit
+
+    def compute_header_id(self) -> dict:
+        """
+        computes the font size -> header tag mapping from the added font sizes
+        """
+        body_limit = self.get_body_size()
+
+        self.body_size = body_limit
+        sizes = sorted([f for f in self.fontsizes.keys() if f > body_limit], reverse=True)
+        self.header_id = {size: "#" * (i + 1) + " " for i, size in enumerate(sizes)}
+        return self.header_id
+
+    def get_header_id(self, span:dict) -> str:
+        """
+        markdown header prefix of a span, same as pymupdf4llm.IdentifyHeaders.get_header_id
+        """
+        return self.header_id.get(round(span["size"]), "")
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+import shutil
+import uuid
+from pathlib import Path
+
+# bump when the structure of the extraction result changes so that stale entries are not served
+CACHE_VERSION = 4
+
+def hash_file(file_path:str, chunk_size:int = 1 << 20) -> str:
+    """
+    sha256 hex digest of the file content, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_bytes(data) -> str:
+    """
+    sha256 hex digest of an in memory pdf (bytes or any buffer), the same digest as hash_file of the file
+    """
+    return hashlib.sha256(data).hexdigest()
+
+# indirect object reference of a pdf object source, e.g. "12 0 R"
+REFERENCE_PATTERN = re.compile(r"\b(\d+) (\d+) R\b")
+
+def hash_pdf_object(doc, xref:int, digests:dict) -> str:
+    """
+    sha256 of a pdf object, its stream and all objects it references
+    references are replaced by the hash of the referenced object so that the hash does not depend on the
+    object numbers, which change when a document is saved again. digests memoizes the hashes per document
+    """
+    if xref in digests:
+        return digests[xref]
+    # a reference back to an object being hashed (a cycle) hashes as empty
+    digests[xref] = ""
+    digest = hashlib.sha256(resolve_references(doc, doc.xref_object(xref, compressed=True), digests).encode())
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref))
+    digests[xref] = digest.hexdigest()
+    return digests[xref]
+
+def resolve_references(doc, source:str, digests:dict) -> str:
+    """
+    pdf object source with every indirect reference replaced by the hash of the referenced object
+    """
+    return REFERENCE_PATTERN.sub(lambda match: hash_pdf_object(doc, int(match.group(1)), digests), source)
+
+def get_page_resources(doc, page) -> str:
+    """
+    source of the resources of the page, inherited from the page tree when the page has none
+    """
+    xref = page.xref
+    while xref > 0:
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            return value
+        kind, value = doc.xref_get_key(xref, "Parent")
+        xref = int(value.split()[0]) if kind == "xref" else 0
+    return ""
+
+def hash_page(page, digests:dict = None) -> str:
+    """
+    sha256 of what the text and table extraction of a page depends on : the page boxes and rotation, the
+    decoded content streams and the resources (fonts, images, forms ...) of the page
+    digests memoizes the hashes of the shared resources, it has to be used for one document only
+    """
+    doc = page.parent
+    digests = {} if digests is None else digests
+    digest = hashlib.sha256(f"{tuple(page.mediabox)}{tuple(page.cropbox)}{page.rotation}".encode())
+    for xref in page.get_contents():
+        digest.update(doc.xref_stream(xref) or b"")
+    digest.update(resolve_references(doc, get_page_resources(doc, page), digests).encode())
+    return digest.hexdigest()
+
+def make_cache_key(content_hash:str, **options) -> str:
+    """
+    cache key of a pdf content hash together with the extraction options that change the result
+    """
+    key_data = json.dumps({"version": CACHE_VERSION, "content": content_hash, "options": options}, sort_keys=True)
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    Content addressed on-disk cache of PDFExtractor results.
+    Entries are pickled result dicts stored under their cache key, the least recently used entries are
+    evicted once the cache grows beyond max_bytes. The directory may be shared by several processes.
+    :: Args ::
+        Param :: cache_dir :: directory holding the cache entries
+        Param :: max_bytes :: maximum total size of the cache entries
+    """
+
+    def __init__(self, cache_dir:str, max_bytes:int = 1 << 30):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def entry_path(self, key:str) -> Path:
+        """
+        file path of the cache entry for the given key
+        """
+        return self.cache_dir / key[:2] / f"{key}.pkl"
+
+    def get(self, key:str):
+        """
+        returns the cached result for the key or None, a hit marks the entry as recently used
+        """
+        path = self.entry_path(key)
+        try:
+            with path.open("rb") as f:
+                result = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Dropping unreadable cache entry {path}. Exception Occurred: {str(e)}")
+            path.unlink(missing_ok=True)
+            return None
+        return result
+
+    def put(self, key:str, result, evict:bool = True) -> Path:
+        """
+        stores the result under the key and evicts old entries when the cache is over its size
+        with evict=False the eviction is left to the caller, e.g. once after storing many entries
+        """
+        path = self.entry_path(key)
+        path.parent.mkdir(exist_ok=True)
+        tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        with tmp_path.open("wb") as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        if evict:
+            self.evict()
+        return path
+
+    def entries(self) -> list:
+        """
+        (last access time, size, path) of all cache entries, oldest first
+        """
+        entries = []
+        for path in self.cache_dir.glob("*/*.pkl"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self) -> int:
+        """
+        deletes the least recently used entries until the cache fits in max_bytes
+        returns the number of deleted entries
+        """
+        entries = self.entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        n_evicted = 0
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total_bytes -= size
+            n_evicted += 1
+        return n_evicted
+
+    def stats(self) -> dict:
+        """
+        number of entries and total size of the cache
+        """
+        entries = self.entries()
+        return {"entries": len(entries), "bytes": sum(size for _, size, _ in entries), "max_bytes": self.max_bytes}
+
+    def clear(self) -> bool:
+        """
+        deletes all cache entries
+        """
+        try:
+            for path in self.cache_dir.iterdir():
+                if path.is_dir():
+                    shutil.rmtree(path)
+                else:
+                    path.unlink()
+        except Exception as e:
+            print(f"failed to clear the cache {self.cache_dir}. Exception Occurred: {str(e)}")
+            return False
+        return True
@@ -0,0 +1,179 @@
+import asyncio
+import collections
+import heapq
+import itertools
+
+# fifo : arrival order, sjf : shortest (estimated) job first, fair : weighted fair queueing between the tenants and
+# shortest job first within a tenant
+SCHEDULING_POLICIES = ("fifo", "sjf", "fair")
+
+# cost of a job in page equivalents : the text extraction of a page is 1, the table search adds the cost of the
+# table mode per page (screened only searches the pages with vector lines / rectangles) and every MB of the pdf adds
+# MB_COST for the images, fonts and content streams to decode. Rough weights, only the order of the jobs matters
+TABLE_PAGE_COST = {"off": 0.0, "screened": 0.5, "exhaustive": 2.0}
+MB_COST = 1.0
+
+def estimate_cost(pages:int, size:int, table_mode:str = "screened") -> float:
+    """
+    estimated cost of the extraction of a pdf with the given number of pages and size in bytes
+    """
+    return pages * (1.0 + TABLE_PAGE_COST.get(table_mode, 0.0)) + size / 2**20 * MB_COST
+
+def parse_tenant_weights(text:str) -> dict:
+    """
+    "tenant_a=2,tenant_b=0.5" -> {"tenant_a": 2.0, "tenant_b": 0.5}
+    """
+    weights = {}
+    for pair in filter(None, (pair.strip() for pair in text.split(","))):
+        tenant, _, weight = pair.rpartition("=")
+        if not tenant or float(weight) <= 0:
+            raise Exception(f"Invalid tenant weight :: {pair} :: expected <tenant>=<weight above 0>")
+        weights[tenant] = float(weight)
+    return weights
+
+class JobScheduler:
+    """
+    Queue of the extraction jobs of the service, ordered by their estimated cost instead of their arrival.
+    A job is any object with task_id, tenant, cost and enqueued_at (time.perf_counter) attributes.
+    With sjf and fair a waiting job ages : its cost counts aging_cost_per_second less for every second it waits, so
+    a large job waits at most cost / aging_cost_per_second seconds for smaller jobs that arrive after it.
+    fair picks the next job from the tenant with the least cost run so far (divided by its weight). A tenant that
+    was idle starts level with the active tenant that ran the least, so a bulk upload of one tenant delays the jobs
+    of the other tenants by about one job at a time instead of the whole upload.
+    :: Args ::
+        Param :: maxsize :: number of queued jobs, put_nowait raises asyncio.QueueFull beyond it. 0 is unlimited
+        Param :: policy :: one of SCHEDULING_POLICIES
+        Param :: aging_cost_per_second :: cost a waiting job is moved ahead per second
+        Param :: tenant_weights :: share of the tenants (default 1), a tenant of weight 2 gets twice the share
+        Param :: tenant_max_running :: number of jobs of one tenant run at the same time, 0 is unlimited
+    """
+
+    def __init__(
+            self, maxsize:int = 0, policy:str = "fair", aging_cost_per_second:float = 10.0, tenant_weights:dict = None,
+            tenant_max_running:int = 0,
+            ):
+        if policy not in SCHEDULING_POLICIES:
+            raise Exception(f"Invalid scheduling policy :: {policy} :: expected one of {SCHEDULING_POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.aging_cost_per_second = aging_cost_per_second
+        self.tenant_weights = tenant_weights or {}
+        self.tenant_max_running = tenant_max_running
+        # heap of [key, seq, job] per tenant with queued jobs, a removed job is set to None in its entry
+        self.queues = {}
+        self.entries = {}
+        self.queued = collections.Counter()
+        self.running = collections.Counter()
+        # cost run per weight of the active tenants (with queued or running jobs)
+        self.virtual_time = {}
+        self.queued_cost = 0.0
+        self.seq = itertools.count()
+        self.waiters = []
+
+    def qsize(self) -> int:
+        return len(self.entries)
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self.qsize()
+
+    def key(self, job) -> float:
+        if self.policy == "fifo":
+            return job.enqueued_at
+        return job.enqueued_at + job.cost / self.aging_cost_per_second
+
+    def put_nowait(self, job):
+        if self.full():
+            raise asyncio.QueueFull
+        tenant = job.tenant
+        if tenant not in self.virtual_time:
+            self.virtual_time[tenant] = min(self.virtual_time.values(), default=0.0)
+        entry = [self.key(job), next(self.seq), job]
+        heapq.heappush(self.queues.setdefault(tenant, []), entry)
+        self.entries[job.task_id] = entry
+        self.queued[tenant] += 1
+        self.queued_cost += job.cost
+        self.wake()
+
+    def can_run(self, tenant:str) -> bool:
+        return self.tenant_max_running <= 0 or self.running[tenant] < self.tenant_max_running
+
+    def pop_next(self):
+        """
+        removes and returns the next job of the policy, None when no queued job can run
+        """
+        candidates = []
+        for tenant, heap in self.queues.items():
+            while heap and heap[0][2] is None:
+                heapq.heappop(heap)
+            if heap and self.can_run(tenant):
+                candidates.append(tenant)
+        if not candidates:
+            return None
+        if self.policy == "fair":
+            tenant = min(candidates, key=lambda tenant: (self.virtual_time[tenant], self.queues[tenant][0][:2]))
+        else:
+            tenant = min(candidates, key=lambda tenant: self.queues[tenant][0][:2])
+
+        _, _, job = heapq.heappop(self.queues[tenant])
+        del self.entries[job.task_id]
+        self.queued[tenant] -= 1
+        self.queued_cost -= job.cost
+        self.running[tenant] += 1
+        self.virtual_time[tenant] += max(job.cost, 1.0) / self.tenant_weights.get(tenant, 1.0)
+        return job
+
+    async def get(self):
+        """
+        waits for the next job, the job counts as running for its tenant until task_done
+        """
+        while True:
+            job = self.pop_next()
+            if job is not None:
+                return job
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+
+    def wake(self):
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.waiters.clear()
+
+    def task_done(self, job):
+        self.running[job.tenant] -= 1
+        self.forget_idle(job.tenant)
+        self.wake()
+
+    def remove(self, task_id):
+        """
+        removes the queued job of task_id, returns it or None when it is not queued
+        """
+        entry = self.entries.pop(task_id, None)
+        if entry is None:
+            return None
+        job, entry[2] = entry[2], None
+        self.queued[job.tenant] -= 1
+        self.queued_cost -= job.cost
+        self.forget_idle(job.tenant)
+        return job
+
+    def forget_idle(self, tenant:str):
+        """
+        drops the state of a tenant without queued or running jobs, it starts level with the others when it returns
+        """
+        if self.queued[tenant] > 0 or self.running[tenant] > 0:
+            return
+        self.queues.pop(tenant, None)
+        self.virtual_time.pop(tenant, None)
+        del self.queued[tenant], self.running[tenant]
+
+    def queued_task_ids(self) -> list:
+        return list(self.entries)
+
+    def tenant_qsize(self, tenant:str) -> int:
+        return self.queued[tenant]
@@ -0,0 +1,456 @@
+"""
+Near-duplicate detection of the parsed sections across all documents (MinHash signatures with LSH banding).
+Boilerplate sections (disclaimers, standard clauses) repeated in many documents are stored once : the first
+occurrence is the canonical section, later sections whose estimated Jaccard similarity (of their word 5-grams) to
+it reaches the threshold are emitted as a reference to it instead of their content. Run as script to deduplicate
+the json files written by the service or by write_json and to report the dedup ratio.
+
+usage : python src/section_dedup.py data/json_files --db data/section_dedup.db
+        python src/section_dedup.py data/json_files --db data/section_dedup.db --threshold 0.9 --output data/dedup_json
+"""
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from json_writer import json_suffix, read_json, write_json
+from section_index import json_doc_id
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    content_hash TEXT,
+    document_name TEXT,
+    n_sections INTEGER NOT NULL,
+    n_duplicates INTEGER NOT NULL,
+    content_bytes INTEGER NOT NULL,
+    duplicate_bytes INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    section_idx INTEGER NOT NULL,
+    title TEXT,
+    content_bytes INTEGER NOT NULL,
+    signature BLOB NOT NULL,
+    canonical_id INTEGER,
+    similarity REAL,
+    content BLOB
+);
+CREATE INDEX IF NOT EXISTS sections_doc_id ON sections (doc_id, section_idx);
+CREATE INDEX IF NOT EXISTS sections_canonical_id ON sections (canonical_id);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    section_id INTEGER NOT NULL,
+    PRIMARY KEY (band, bucket, section_id)
+) WITHOUT ROWID;
+"""
+
+# signature length and LSH banding : two sections share a band bucket with probability 1 - (1 - s^ROWS)^BANDS for
+# a similarity s, about 0.5 at 0.7 and above 0.99 at 0.85, the candidates are then verified with the signatures
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# sections are compared by their word shingles of SHINGLE_WORDS words, shorter sections (headings, one line
+# notes) are too short to be told apart and are never deduplicated
+SHINGLE_WORDS = 5
+MIN_WORDS = 30
+# estimated Jaccard similarity from which a section is a duplicate of its canonical section
+DEFAULT_THRESHOLD = 0.85
+# shingles hashed at a time, bounds the (shingles, NUM_PERM) matrix of very long sections
+SHINGLE_CHUNK = 4096
+# the canonical sections of a replaced or removed document that are still referenced are kept under the doc_id
+# f"{doc_id}{VERSION_SEP}{indexed_at}" of their version
+VERSION_SEP = "@"
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+WORD_PATTERN = re.compile(r"\w+")
+
+@lru_cache(maxsize=1)
+def get_permutations() -> tuple:
+    """
+    (a, b) of the NUM_PERM hash functions (a * x + b) % MERSENNE_PRIME, fixed so that the stored signatures stay
+    comparable
+    """
+    rng = np.random.RandomState(1)
+    a = rng.randint(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+    b = rng.randint(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+    return a, b
+
+def shingle_hashes(text:str) -> np.ndarray:
+    """
+    distinct 32 bit hashes of the word SHINGLE_WORDS-grams of the text (lower case), None for texts of less than
+    MIN_WORDS words
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    word_hashes = np.array([zlib.crc32(word.encode("utf-8")) for word in words], dtype=np.uint64)
+    n_shingles = len(words) - SHINGLE_WORDS + 1
+    hashes = np.zeros(n_shingles, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for offset in range(SHINGLE_WORDS):
+            hashes = hashes * np.uint64(1000003) + word_hashes[offset:offset + n_shingles]
+    return np.unique(hashes & MAX_HASH)
+
+def minhash(hashes:np.ndarray) -> np.ndarray:
+    """
+    MinHash signature (NUM_PERM uint32) of the shingle hashes
+    """
+    a, b = get_permutations()
+    signature = np.full(NUM_PERM, MAX_HASH, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for start in range(0, len(hashes), SHINGLE_CHUNK):
+            chunk = hashes[start:start + SHINGLE_CHUNK, None]
+            permuted = ((chunk * a + b) % MERSENNE_PRIME) & MAX_HASH
+            signature = np.minimum(signature, permuted.min(axis=0))
+    return signature.astype(np.uint32)
+
+def band_buckets(signature:np.ndarray) -> list:
+    """
+    (band, bucket) of the signature in every LSH band, the bucket is a signed 64 bit hash of the band rows
+    """
+    return [
+        (band, int.from_bytes(hashlib.blake2b(rows.tobytes(), digest_size=8).digest(), "little", signed=True))
+        for band, rows in enumerate(signature.reshape(BANDS, ROWS))
+    ]
+
+def dedup_sections(sections:list, refs:list) -> list:
+    """
+    the sections with the content of every duplicate replaced by its reference to the canonical section
+    ({"doc_id", "section_idx", "similarity"} under duplicate_of), refs as returned by SectionDedup.add_document
+    """
+    return [
+        section if ref is None else {**section, "content": "", "duplicate_of": ref}
+        for section, ref in zip(sections, refs)
+    ]
+
+class SectionDedup:
+    """
+    On-disk near-duplicate index over the parsed sections of all documents, a SQLite database.
+    Every section of at least MIN_WORDS words gets a MinHash signature. The signatures of the canonical (first seen)
+    sections are indexed by LSH band, a new section is compared with the canonical sections sharing one of its band
+    buckets and is a duplicate of the most similar one when its estimated similarity reaches the threshold. The
+    content of the canonical sections is kept (compressed) so that the references can always be resolved, even
+    after their document is replaced or removed (under a versioned doc_id, see delete_document). The database is
+    shared by all processes (WAL mode), every process and thread opens its own connection.
+    :: Args ::
+        Param :: db_path :: sqlite database file, created with its directory when missing
+        Param :: threshold :: estimated Jaccard similarity from which a section is a duplicate
+    """
+
+    def __init__(self, db_path:str, threshold:float = DEFAULT_THRESHOLD):
+        if not 0 < threshold <= 1:
+            raise Exception(f"Invalid dedup threshold :: {threshold} :: expected a similarity above 0 and up to 1")
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.local = threading.local()
+        self.connect().executescript(SCHEMA)
+
+    def __getstate__(self):
+        # the index is passed to the process pool workers, connections cannot be pickled
+        return {"db_path": self.db_path, "threshold": self.threshold}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        connection of the current thread, a forked process opens a new one
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def find_canonical(self, conn:sqlite3.Connection, signature:np.ndarray, buckets:list) -> tuple:
+        """
+        (section id, doc_id, section_idx, similarity) of the most similar canonical section reaching the threshold,
+        None when there is none
+        """
+        # one primary key lookup per band, sqlite scans the whole table for a (band, bucket) IN (VALUES ...)
+        candidate_ids = [
+            row[0] for row in conn.execute(
+                " UNION ".join(["SELECT section_id FROM bands WHERE band = ? AND bucket = ?"] * len(buckets)),
+                [value for bucket in buckets for value in bucket],
+            )
+        ]
+        best = None
+        for start in range(0, len(candidate_ids), 500):
+            chunk = candidate_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT id, doc_id, section_idx, signature FROM sections WHERE id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            )
+            for section_id, doc_id, section_idx, candidate in rows:
+                similarity = float((np.frombuffer(candidate, dtype=np.uint32) == signature).mean())
+                if similarity >= self.threshold and (best is None or (similarity, -section_id) > (best[3], -best[0])):
+                    best = (section_id, doc_id, section_idx, similarity)
+        return best
+
+    def add_document(self, doc_id:str, sections:list, document_name:str = None, content_hash:str = None) -> list:
+        """
+        deduplicates the sections (processed_data["sections"]) of the document against the sections of all
+        documents added before and earlier sections of the same document. Returns one entry per section : None for
+        a section kept as is, {"doc_id", "section_idx", "similarity"} of its canonical section for a duplicate.
+        An earlier version of doc_id is replaced, the same content_hash again returns the stored references
+        """
+        sections = list(sections)
+        # the signatures are computed before the database is locked
+        signatures = []
+        for section in sections:
+            hashes = shingle_hashes(section["content"])
+            signatures.append(None if hashes is None else minhash(hashes))
+
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT content_hash FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is not None and content_hash is not None and row[0] == content_hash:
+                conn.execute("ROLLBACK")
+                return self.get_refs(doc_id, len(sections))
+            if row is not None:
+                self.delete_document(conn, doc_id)
+
+            refs = []
+            content_bytes = duplicate_bytes = 0
+            for section_idx, (section, signature) in enumerate(zip(sections, signatures)):
+                n_bytes = len(section["content"].encode("utf-8"))
+                content_bytes += n_bytes
+                if signature is None:
+                    refs.append(None)
+                    continue
+                buckets = band_buckets(signature)
+                canonical = self.find_canonical(conn, signature, buckets)
+                if canonical is not None:
+                    canonical_id, canonical_doc_id, canonical_idx, similarity = canonical
+                    conn.execute(
+                        "INSERT INTO sections (doc_id, section_idx, title, content_bytes, signature, canonical_id, "
+                        "similarity) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (doc_id, section_idx, section["title"], n_bytes, signature.tobytes(), canonical_id, similarity),
+                    )
+                    refs.append({"doc_id": canonical_doc_id, "section_idx": canonical_idx, "similarity": similarity})
+                    duplicate_bytes += n_bytes
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO sections (doc_id, section_idx, title, content_bytes, signature, content) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        doc_id, section_idx, section["title"], n_bytes, signature.tobytes(),
+                        zlib.compress(section["content"].encode("utf-8")),
+                    ),
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO bands (band, bucket, section_id) VALUES (?, ?, ?)",
+                    [(band, bucket, cursor.lastrowid) for band, bucket in buckets],
+                )
+                refs.append(None)
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, content_hash, document_name, n_sections, n_duplicates, "
+                "content_bytes, duplicate_bytes, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    doc_id, content_hash, document_name, len(sections), sum(ref is not None for ref in refs),
+                    content_bytes, duplicate_bytes, time.time(),
+                ),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return refs
+
+    def get_refs(self, doc_id:str, n_sections:int) -> list:
+        """
+        stored references of the n_sections sections of the document
+        """
+        refs = [None] * n_sections
+        rows = self.connect().execute(
+            "SELECT s.section_idx, c.doc_id, c.section_idx, s.similarity FROM sections s "
+            "JOIN sections c ON c.id = s.canonical_id WHERE s.doc_id = ?",
+            (doc_id,),
+        )
+        for section_idx, canonical_doc_id, canonical_idx, similarity in rows:
+            if section_idx < n_sections:
+                refs[section_idx] = {"doc_id": canonical_doc_id, "section_idx": canonical_idx, "similarity": similarity}
+        return refs
+
+    def delete_document(self, conn:sqlite3.Connection, doc_id:str):
+        """
+        deletes the duplicates of the document and its canonical sections no other document refers to. The
+        referenced ones are kept for the references under the doc_id of their version (doc_id@indexed_at), so that
+        a new version of the document never shares a (doc_id, section_idx) with them. Such sections are deleted
+        with the last document referring to them
+        """
+        orphaned = [
+            row[0] for row in conn.execute(
+                "SELECT c.id FROM sections c WHERE c.id IN (SELECT canonical_id FROM sections WHERE doc_id = ?) "
+                "AND NOT EXISTS (SELECT 1 FROM documents WHERE documents.doc_id = c.doc_id) "
+                "AND NOT EXISTS (SELECT 1 FROM sections d WHERE d.canonical_id = c.id AND d.doc_id != ?)",
+                (doc_id, doc_id),
+            )
+        ]
+        conn.execute("DELETE FROM sections WHERE doc_id = ? AND canonical_id IS NOT NULL", (doc_id,))
+        if orphaned:
+            conn.execute(f"DELETE FROM bands WHERE section_id IN ({', '.join('?' * len(orphaned))})", orphaned)
+            conn.execute(f"DELETE FROM sections WHERE id IN ({', '.join('?' * len(orphaned))})", orphaned)
+        unreferenced = (
+            "SELECT id FROM sections c WHERE c.doc_id = ? AND c.canonical_id IS NULL "
+            "AND NOT EXISTS (SELECT 1 FROM sections d WHERE d.canonical_id = c.id)"
+        )
+        conn.execute(f"DELETE FROM bands WHERE section_id IN ({unreferenced})", (doc_id,))
+        conn.execute(f"DELETE FROM sections WHERE id IN ({unreferenced})", (doc_id,))
+        row = conn.execute("SELECT indexed_at FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row is not None:
+            # fixed width, the versions of a document sort by time
+            conn.execute(
+                "UPDATE sections SET doc_id = ? WHERE doc_id = ?", (f"{doc_id}{VERSION_SEP}{row[0]:017.6f}", doc_id)
+            )
+        conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+
+    def remove_document(self, doc_id:str):
+        """
+        removes the document from the index, see delete_document
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.delete_document(conn, doc_id)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_section(self, doc_id:str, section_idx:int) -> dict:
+        """
+        title and content of a canonical section (the target of a duplicate_of reference), None when unknown.
+        doc_id is the one of the reference (a versioned doc_id for the sections of a replaced document), a plain
+        doc_id whose document was replaced or removed since falls back to its latest version keeping the section
+        """
+        conn = self.connect()
+        row = conn.execute(
+            "SELECT doc_id, title, content FROM sections WHERE doc_id = ? AND section_idx = ? AND canonical_id IS NULL",
+            (doc_id, section_idx),
+        ).fetchone()
+        if row is None and VERSION_SEP not in doc_id:
+            # the range of the doc_id@... versions, uses the (doc_id, section_idx) index
+            row = conn.execute(
+                "SELECT doc_id, title, content FROM sections WHERE doc_id > ? AND doc_id < ? AND section_idx = ? "
+                "AND canonical_id IS NULL ORDER BY doc_id DESC LIMIT 1",
+                (f"{doc_id}{VERSION_SEP}", f"{doc_id}{VERSION_SEP}\uffff", section_idx),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"doc_id": row[0], "section_idx": section_idx, "title": row[1], "content": zlib.decompress(row[2]).decode("utf-8")}
+
+    def report(self, top:int = 10) -> dict:
+        """
+        dedup ratio of the indexed documents (share of the section content bytes and of the sections emitted as
+        references) and the canonical sections with the most duplicates
+        """
+        conn = self.connect()
+        documents, sections, duplicates, content_bytes, duplicate_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(n_sections), 0), COALESCE(SUM(n_duplicates), 0), "
+            "COALESCE(SUM(content_bytes), 0), COALESCE(SUM(duplicate_bytes), 0) FROM documents"
+        ).fetchone()
+        rows = conn.execute(
+            "SELECT c.doc_id, c.section_idx, c.title, COUNT(*) AS n, SUM(d.content_bytes) FROM sections d "
+            "JOIN sections c ON c.id = d.canonical_id GROUP BY c.id ORDER BY n DESC LIMIT ?",
+            (top,),
+        ).fetchall()
+        return {
+            "documents": documents,
+            "sections": sections,
+            "duplicate_sections": duplicates,
+            "content_bytes": content_bytes,
+            "duplicate_bytes": duplicate_bytes,
+            "dedup_ratio": duplicate_bytes / content_bytes if content_bytes else 0.0,
+            "section_dedup_ratio": duplicates / sections if sections else 0.0,
+            "canonical_sections": conn.execute("SELECT COUNT(*) FROM sections WHERE canonical_id IS NULL").fetchone()[0],
+            "top_duplicated": [
+                {"doc_id": doc_id, "section_idx": section_idx, "title": title, "duplicates": n, "duplicate_bytes": n_bytes}
+                for doc_id, section_idx, title, n, n_bytes in rows
+            ],
+        }
+
+    def clear(self) -> bool:
+        """
+        removes all documents from the index
+        """
+        self.connect().executescript(
+            "BEGIN IMMEDIATE; DELETE FROM bands; DELETE FROM sections; DELETE FROM documents; COMMIT; VACUUM;"
+        )
+        return True
+
+def dedup_json_dir(dedup:SectionDedup, json_dir:str, output_dir:str = None) -> int:
+    """
+    deduplicates the processed_data of every json file of the directory, returns the number of documents added.
+    With output_dir the deduplicated files are written there under the same name. The json file size and
+    modification time are used as content hash, so unchanged files are not deduplicated again
+    """
+    n_added = 0
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    for json_path in sorted(Path(json_dir).glob("*.json*")):
+        data = read_json(json_path)
+        # files written with outputs=("raw_data", "processed_data") hold both
+        processed_data = data.get("processed_data", data)
+        if "sections" not in processed_data:
+            continue
+        stat = json_path.stat()
+        doc_id = json_doc_id(json_path)
+        refs = dedup.add_document(
+            doc_id, processed_data["sections"], document_name=processed_data.get("document_name"),
+            content_hash=f"{stat.st_size}-{stat.st_mtime_ns}",
+        )
+        n_added += 1
+        if output_dir is not None:
+            processed_data["sections"] = dedup_sections(processed_data["sections"], refs)
+            compress = json_path.name.endswith(".gz")
+            output_path = Path(output_dir) / f"{doc_id}{json_suffix(compress)}"
+            try:
+                write_json(output_path, data, compress=compress)
+            except ValueError as e:
+                # json files of older versions may hold NaN values, which are not valid json
+                print(f"failed to write the deduplicated {json_path.name}. Exception Occurred: {str(e)}")
+                output_path.unlink(missing_ok=True)
+    return n_added
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("json_dir", help="directory of parsed json files")
+    parser.add_argument("--db", required=True, help="sqlite database of the dedup index")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="similarity of a duplicate")
+    parser.add_argument("--output", help="write the deduplicated json files to this directory")
+    parser.add_argument("--top", type=int, default=10, help="number of most duplicated sections reported")
+    args = parser.parse_args()
+
+    dedup = SectionDedup(args.db, threshold=args.threshold)
+    start = time.perf_counter()
+    n_added = dedup_json_dir(dedup, args.json_dir, args.output)
+    report = dedup.report(top=args.top)
+    print(
+        f"deduplicated {n_added} documents in {time.perf_counter() - start:.2f} s :: {report['documents']} documents "
+        f":: {report['duplicate_sections']} of {report['sections']} sections are duplicates :: dedup ratio "
+        f"{report['dedup_ratio']:.1%} of {report['content_bytes'] / 2**20:.1f} MB section content"
+    )
+    for section in report["top_duplicated"]:
+        print(f"{section['duplicates']:>6}  {section['doc_id']}  #{section['section_idx']}  {section['title'][:60]!r}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Full text index over the parsed sections. Run as script to index the json files written by the service or by
+write_json (e.g. the files parsed before the index existed), files already indexed with the same size and
+modification time are skipped without reading them.
+
+usage : python src/section_index.py data/json_files --db data/section_index.db
+        python src/section_index.py data/json_files --db data/section_index.db --query "income tax exemption"
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from json_writer import read_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    content_hash TEXT,
+    document_name TEXT,
+    json_file TEXT,
+    n_sections INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sections (
+    id INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    section_idx INTEGER NOT NULL,
+    page_nos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_doc_id ON sections (doc_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(title, content, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+# weight of the title and content columns in the bm25 score, a match in the section title counts more
+BM25_WEIGHTS = (2.0, 1.0)
+
+def plain_query(text:str) -> str:
+    """
+    fts5 query matching the sections that contain all words of the text, the words are quoted so that fts5
+    operators and punctuation in the text are searched as is
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+class SectionIndex:
+    """
+    On-disk full text index over the parsed sections of the documents, a SQLite FTS5 table ranked with bm25.
+    Every section is indexed with its title and content and keyed by document id, section index and page_nos.
+    Documents are added (or replaced) one at a time as their extraction finishes, the database is shared by all
+    processes (WAL mode), every process and thread opens its own connection.
+    :: Args ::
+        Param :: db_path :: sqlite database file, created with its directory when missing
+    """
+
+    def __init__(self, db_path:str):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.local = threading.local()
+        conn = self.connect()
+        conn.executescript(SCHEMA)
+        # the fts5 rank column is the weighted bm25, fts5 then returns the best matches first without sorting them
+        conn.execute(
+            "INSERT INTO sections_fts (sections_fts, rank) VALUES ('rank', ?)",
+            (f"bm25({BM25_WEIGHTS[0]}, {BM25_WEIGHTS[1]})",),
+        )
+
+    def __getstate__(self):
+        # the index is passed to the process pool workers, connections cannot be pickled
+        return {"db_path": self.db_path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        connection of the current thread, a forked process opens a new one
+        """
+        conn = getattr(self.local, "conn", None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return conn
+
+    def add_document(
+            self, doc_id:str, sections, document_name:str = None, content_hash:str = None, json_file:str = None,
+            ) -> bool:
+        """
+        indexes the sections (processed_data["sections"], a list or a generator) of the document, the sections of
+        an earlier version of doc_id are replaced. A document already indexed with the same content_hash is skipped,
+        returns whether the document was indexed
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT content_hash FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is not None and content_hash is not None and row[0] == content_hash:
+                conn.execute("ROLLBACK")
+                return False
+            self.delete_sections(conn, doc_id)
+            n_sections = 0
+            for section_idx, section in enumerate(sections):
+                # a near-duplicate section (see section_dedup) is found by its canonical section
+                if "duplicate_of" in section:
+                    continue
+                cursor = conn.execute(
+                    "INSERT INTO sections (doc_id, section_idx, page_nos) VALUES (?, ?, ?)",
+                    (doc_id, section_idx, json.dumps(section["page_nos"])),
+                )
+                conn.execute(
+                    "INSERT INTO sections_fts (rowid, title, content) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, section["title"], section["content"]),
+                )
+                n_sections += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (doc_id, content_hash, document_name, json_file, n_sections, "
+                "indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_id, content_hash, document_name, json_file, n_sections, time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def get_content_hash(self, doc_id:str) -> str:
+        """
+        content hash the document was indexed with, None when it is not indexed
+        """
+        row = self.connect().execute("SELECT content_hash FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def delete_sections(self, conn:sqlite3.Connection, doc_id:str):
+        conn.execute("DELETE FROM sections_fts WHERE rowid IN (SELECT id FROM sections WHERE doc_id = ?)", (doc_id,))
+        conn.execute("DELETE FROM sections WHERE doc_id = ?", (doc_id,))
+
+    def remove_document(self, doc_id:str):
+        """
+        removes the document and its sections from the index
+        """
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.delete_sections(conn, doc_id)
+            conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def search(self, query:str, limit:int = 10, doc_id:str = None, raw:bool = False) -> list:
+        """
+        best matching sections of the query by bm25 score (higher is better), with a snippet of the matched content
+        the sections have to contain all words of the query, with raw the query is passed to fts5 as is
+        (e.g. "tax OR exemption", "exempt*", "title:income"). doc_id limits the search to one document.
+        """
+        match = query if raw else plain_query(query)
+        if not match:
+            return []
+        # fts5 scores every matching section with bm25 to return the best ones, a query matching most sections (a
+        # frequent term or phrase) takes ~150-250 ms at 100k sections. The snippets are only built for the returned
+        # rows, and neither prefix indexes nor detail=column (no phrase queries) shorten the scoring
+        matches = (
+            "SELECT rowid, rank, title, "
+            "snippet(sections_fts, 1, '[', ']', '...', 16) AS snippet FROM sections_fts WHERE sections_fts MATCH ?"
+        )
+        params = [match]
+        if doc_id is not None:
+            matches += " AND rowid IN (SELECT id FROM sections WHERE doc_id = ?)"
+            params.append(doc_id)
+        matches += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        rows = self.connect().execute(
+            "SELECT s.doc_id, d.document_name, d.json_file, s.section_idx, f.title, s.page_nos, f.rank, f.snippet "
+            f"FROM ({matches}) f JOIN sections s ON s.id = f.rowid JOIN documents d ON d.doc_id = s.doc_id "
+            "ORDER BY f.rank",
+            params,
+        ).fetchall()
+        return [
+            {
+                "doc_id": doc_id, "document_name": document_name, "json_file": json_file, "section_idx": section_idx,
+                "title": title, "page_nos": json.loads(page_nos), "score": -rank, "snippet": snippet,
+            }
+            for doc_id, document_name, json_file, section_idx, title, page_nos, rank, snippet in rows
+        ]
+
+    def stats(self) -> dict:
+        conn = self.connect()
+        return {
+            "documents": conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0],
+            "sections": conn.execute("SELECT COUNT(*) FROM sections").fetchone()[0],
+            # recent writes are in the write ahead log until the next checkpoint
+            "bytes": sum(
+                path.stat().st_size for path in (self.db_path, Path(f"{self.db_path}-wal")) if path.exists()
+            ),
+        }
+
+    def clear(self) -> bool:
+        """
+        removes all documents from the index
+        """
+        conn = self.connect()
+        conn.executescript(
+            "BEGIN IMMEDIATE; DELETE FROM sections_fts; DELETE FROM sections; DELETE FROM documents; COMMIT; VACUUM;"
+        )
+        return True
+
+def json_doc_id(json_path:Path) -> str:
+    """
+    document id of a parsed json file : its name without .json / .json.gz
+    """
+    name = json_path.name
+    return name[:-len(".json.gz")] if name.endswith(".json.gz") else json_path.stem
+
+def index_json_dir(index:SectionIndex, json_dir:str) -> int:
+    """
+    indexes the processed_data of every json file of the directory, returns the number of documents indexed
+    the json file size and modification time are used as content hash, unchanged files are not read again
+    """
+    n_indexed = 0
+    for json_path in sorted(Path(json_dir).glob("*.json*")):
+        stat = json_path.stat()
+        doc_id = json_doc_id(json_path)
+        content_hash = f"{stat.st_size}-{stat.st_mtime_ns}"
+        if index.get_content_hash(doc_id) == content_hash:
+            continue
+        data = read_json(json_path)
+        # files written with outputs=("raw_data", "processed_data") hold both
+        data = data.get("processed_data", data)
+        if "sections" not in data:
+            continue
+        n_indexed += index.add_document(
+            doc_id, data["sections"], document_name=data.get("document_name"), content_hash=content_hash,
+            json_file=json_path.name,
+        )
+    return n_indexed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("json_dir", help="directory of parsed json files")
+    parser.add_argument("--db", required=True, help="sqlite database of the index")
+    parser.add_argument("--query", help="search the index after indexing")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    index = SectionIndex(args.db)
+    start = time.perf_counter()
+    n_indexed = index_json_dir(index, args.json_dir)
+    print(f"indexed {n_indexed} documents in {time.perf_counter() - start:.2f} s :: {index.stats()}")
+    if args.query:
+        start = time.perf_counter()
+        hits = index.search(args.query, limit=args.limit)
+        print(f"{len(hits)} hits in {(time.perf_counter() - start) * 1000:.1f} ms")
+        for hit in hits:
+            print(f"{hit['score']:>8.2f}  {hit['doc_id']}  {hit['title'][:60]!r} pages {hit['page_nos']}\n          {hit['snippet']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import json
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from block_store import BlockStore
+from json_writer import ENCODER
+
+# dtype of every column spilled by BlockStoreWriter
+COLUMN_DTYPES = {
+    "page": np.int32,
+    "number": np.int32,
+    "bbox": np.float64,
+    "line_offsets": np.int64,
+    "text_offsets": np.int64,
+    "span_sizes": np.int16,
+    "span_offsets": np.int64,
+}
+OFFSET_COLUMNS = ("line_offsets", "text_offsets", "span_offsets")
+
+def load_column(path:Path, dtype) -> np.ndarray:
+    """
+    read only memory map of a spilled column (an empty array for an empty file, which cannot be mapped)
+    """
+    if path.stat().st_size == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+class BlockStoreWriter:
+    """
+    Appends the block stores of consecutive windows of pages to column files in a directory.
+    The text of every window is written utf-8 encoded, close returns the SpilledBlockStore of all windows.
+    """
+
+    def __init__(self, directory:str):
+        self.directory = Path(directory)
+        self.files = {name: open(self.directory / f"{name}.bin", "wb") for name in COLUMN_DTYPES}
+        self.text_file = open(self.directory / "text.bin", "wb")
+        # running end of the offset columns, every file starts with the offset 0
+        self.ends = {name: 0 for name in OFFSET_COLUMNS}
+        for name in OFFSET_COLUMNS:
+            np.zeros(1, dtype=COLUMN_DTYPES[name]).tofile(self.files[name])
+        # (first block, end block, first text byte, end text byte) of every window
+        self.windows = []
+        self.n_blocks = 0
+        self.n_text_bytes = 0
+
+    def append(self, store:BlockStore):
+        """
+        writes the blocks of the store after the blocks written so far
+        """
+        for name in ("page", "number", "bbox", "span_sizes"):
+            np.ascontiguousarray(getattr(store, name), dtype=COLUMN_DTYPES[name]).tofile(self.files[name])
+        for name in OFFSET_COLUMNS:
+            item_offsets = getattr(store, name)
+            (item_offsets[1:] + self.ends[name]).astype(COLUMN_DTYPES[name]).tofile(self.files[name])
+            self.ends[name] += int(item_offsets[-1])
+        text = store.text.encode("utf-8", "surrogatepass")
+        self.text_file.write(text)
+        self.windows.append((self.n_blocks, self.n_blocks + len(store), self.n_text_bytes, self.n_text_bytes + len(text)))
+        self.n_blocks += len(store)
+        self.n_text_bytes += len(text)
+
+    def nbytes(self) -> int:
+        """
+        number of bytes written so far
+        """
+        return sum(f.tell() for f in self.files.values()) + self.text_file.tell()
+
+    def close(self):
+        """
+        closes the column files and returns the memory mapped store of all written blocks
+        """
+        for f in [*self.files.values(), self.text_file]:
+            f.close()
+        columns = {name: load_column(self.directory / f"{name}.bin", dtype) for name, dtype in COLUMN_DTYPES.items()}
+        columns["bbox"] = columns["bbox"].reshape(-1, 4)
+        return SpilledBlockStore(
+            text=load_column(self.directory / "text.bin", np.uint8), windows=self.windows, **columns,
+        )
+
+class SpilledBlockStore(BlockStore):
+    """
+    BlockStore written to disk by BlockStoreWriter : the columns are read only memory maps and text is the memory
+    mapped utf-8 text of all lines. The text is decoded one window (the blocks of one BlockStoreWriter.append) at a
+    time with iter_windows, so only the pages of the current window are held as python strings.
+    """
+
+    def __init__(self, windows:List, **columns):
+        super().__init__(**columns)
+        self.windows = windows
+
+    def nbytes(self) -> int:
+        """
+        size of the spilled columns, they are paged in from disk when accessed
+        """
+        arrays = [
+            self.page, self.number, self.bbox, self.line_offsets, self.text_offsets, self.span_sizes, self.span_offsets,
+            self.text,
+        ]
+        if self.header_codes is not None:
+            arrays.append(self.header_codes)
+        return sum(arr.nbytes for arr in arrays)
+
+    def window(self, window_idx:int) -> BlockStore:
+        """
+        in memory store of the blocks of a window, with the header codes when they are assigned
+        """
+        block_start, block_end, byte_start, byte_end = self.windows[window_idx]
+        line_start, line_end = int(self.line_offsets[block_start]), int(self.line_offsets[block_end])
+        span_start, span_end = int(self.span_offsets[line_start]), int(self.span_offsets[line_end])
+        store = BlockStore(
+            page=np.array(self.page[block_start:block_end]),
+            number=np.array(self.number[block_start:block_end]),
+            bbox=np.array(self.bbox[block_start:block_end]),
+            line_offsets=self.line_offsets[block_start:block_end + 1] - line_start,
+            text=self.text[byte_start:byte_end].tobytes().decode("utf-8", "surrogatepass"),
+            text_offsets=self.text_offsets[line_start:line_end + 1] - self.text_offsets[line_start],
+            span_sizes=np.array(self.span_sizes[span_start:span_end]),
+            span_offsets=self.span_offsets[line_start:line_end + 1] - span_start,
+        )
+        if self.header_codes is not None:
+            store.header_codes = self.header_codes[line_start:line_end]
+            store.header_tags = self.header_tags
+        return store
+
+    def iter_windows(self):
+        for window_idx, (block_start, _, _, _) in enumerate(self.windows):
+            yield block_start, self.window(window_idx)
+
+    def line_texts(self) -> List[str]:
+        return [txt for _, window in self.iter_windows() for txt in window.line_texts()]
+
+class RecordSpill:
+    """
+    Json lines file of records (e.g. the table records of the pages), records are read back by index or in order
+    """
+
+    def __init__(self, path:str):
+        self.path = Path(path)
+        self.file = open(self.path, "w+b")
+        self.record_offsets = []
+
+    def append(self, record):
+        self.file.seek(0, 2)
+        self.record_offsets.append(self.file.tell())
+        self.file.write(ENCODER.encode(record).encode("utf-8", "surrogatepass") + b"\n")
+
+    def __len__(self) -> int:
+        return len(self.record_offsets)
+
+    def __getitem__(self, idx:int):
+        self.file.seek(self.record_offsets[idx])
+        return json.loads(self.file.readline().decode("utf-8", "surrogatepass"))
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def close(self):
+        self.file.close()
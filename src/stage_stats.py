@@ -0,0 +1,43 @@
+import time
+from contextlib import contextmanager
+
+
+class StageStats:
+    """
+    Wall time per stage and counters of a pdf extraction.
+    The time of a stage entered several times (e.g. once per page) is summed up. Stats collected in the pool
+    workers are added to the stats of the document with add.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+
+    @contextmanager
+    def time(self, stage:str):
+        """
+        adds the wall time of the with block to the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0.0) + time.perf_counter() - start
+
+    def count(self, name:str, n:int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def add(self, other):
+        """
+        adds the timings and counters of other to these stats
+        """
+        for stage, seconds in other.timings.items():
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    def to_dict(self) -> dict:
+        return {
+            "timings_s": {stage: round(seconds, 6) for stage, seconds in self.timings.items()},
+            "counters": dict(self.counters),
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import multiprocessing
+
+# seconds between two checks of a running job for its result, a cancelled job is stopped after at most this time
+RESULT_POLL_SECONDS = 0.2
+# seconds a worker is given to exit on shutdown before it is killed
+SHUTDOWN_SECONDS = 5
+
+def worker_main(conn, initializer):
+    """
+    worker process : runs the initializer, reports that it is ready and then runs every (function, args) it receives
+    until it receives None or the pipe is closed. The result or the exception of a call is sent back
+    """
+    if initializer is not None:
+        initializer()
+    conn.send(("ready", None))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        fn, args = message
+        try:
+            message = ("result", fn(*args))
+        except Exception as e:
+            message = ("error", e)
+        try:
+            conn.send(message)
+        except Exception as e:
+            # the result or the exception cannot be pickled
+            conn.send(("error", Exception(repr(e))))
+
+class Worker:
+    """
+    worker process of the WorkerPool with the pipe it receives the jobs on
+    """
+
+    def __init__(self, ctx, initializer=None):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=worker_main, args=(child_conn, initializer))
+        self.process.start()
+        child_conn.close()
+        self.ready = False
+
+    def receive(self, timeout:float = None) -> tuple:
+        """
+        blocking : next (kind, value) message of the worker or None when there is none within timeout
+        """
+        try:
+            if not self.conn.poll(timeout):
+                return None
+            return self.conn.recv()
+        except (EOFError, OSError):
+            self.process.join(1)
+            raise Exception(f"worker process {self.process.pid} died (exit code {self.process.exitcode})")
+
+    def wait_ready(self):
+        """
+        blocking : waits until the worker ran its initializer
+        """
+        while not self.ready:
+            self.ready = self.receive(RESULT_POLL_SECONDS) is not None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class WorkerPool:
+    """
+    Process pool for the extraction jobs of the service. Unlike ProcessPoolExecutor a running job can be stopped :
+    when the task awaiting run is cancelled (task cancel, asyncio.wait_for timeout) its worker is killed and replaced
+    by a new one, the other workers keep running. A worker that dies (e.g. a crash in pymupdf) only fails its own job
+    :: Args ::
+        Param :: max_workers :: number of worker processes
+        Param :: initializer :: module level function run by every worker when it starts, e.g. to warm it up
+    """
+
+    def __init__(self, max_workers:int, initializer=None):
+        self.ctx = multiprocessing.get_context()
+        self.initializer = initializer
+        self.workers = []
+        self.idle = asyncio.Queue()
+        self.closed = False
+        for _ in range(max_workers):
+            self.add_worker()
+
+    def add_worker(self):
+        worker = Worker(self.ctx, self.initializer)
+        self.workers.append(worker)
+        self.idle.put_nowait(worker)
+
+    def replace(self, worker:Worker):
+        worker.kill()
+        self.workers.remove(worker)
+        if not self.closed:
+            self.add_worker()
+
+    async def start(self):
+        """
+        waits until every worker ran the initializer
+        """
+        await asyncio.gather(*[asyncio.to_thread(worker.wait_ready) for worker in self.workers])
+
+    async def run(self, fn, *args):
+        """
+        runs fn(*args) (a module level function) in the next idle worker and returns its result or raises its exception
+        """
+        worker = await self.idle.get()
+        try:
+            if not worker.ready:
+                await asyncio.to_thread(worker.wait_ready)
+            worker.conn.send((fn, args))
+            message = None
+            while message is None:
+                message = await asyncio.to_thread(worker.receive, RESULT_POLL_SECONDS)
+        except BaseException:
+            # cancelled or died, the job may still be running in the worker
+            self.replace(worker)
+            raise
+        self.idle.put_nowait(worker)
+        kind, value = message
+        if kind == "error":
+            raise value
+        return value
+
+    def shutdown(self):
+        """
+        stops the workers, running jobs are killed after SHUTDOWN_SECONDS
+        """
+        self.closed = True
+        for worker in self.workers:
+            # a forked worker holds the pipes of the workers started before it, they would not see the pipe closed
+            # until it exits
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.conn.close()
+        for worker in self.workers:
+            worker.process.join(SHUTDOWN_SECONDS)
+            if worker.process.is_alive():
+                worker.process.kill()
+                worker.process.join()
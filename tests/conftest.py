@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+# the modules of the repository are run from src, the pdf generator lives with the benchmarks
+sys.path.insert(0, str(ROOT / "benchmarks"))
+sys.path.insert(0, str(ROOT / "src"))
+
+from synthetic_pdf import make_synthetic_pdf
+
+SAMPLE_PDF = ROOT / "data" / "uploads" / "Income_Tax_Guidelines_for_Exemptions.pdf"
+
+@pytest.fixture(scope="session")
+def sample_pdf() -> Path:
+    """
+    the sample pdf of the repository
+    """
+    return SAMPLE_PDF
+
+@pytest.fixture(scope="session")
+def synthetic_pdf(tmp_path_factory) -> Path:
+    """
+    30 page synthetic pdf with headings, running headers / footers and tables
+    """
+    path = tmp_path_factory.mktemp("pdfs") / "synthetic.pdf"
+    make_synthetic_pdf(str(path), n_pages=30, table_density=0.2, seed=7)
+    return path
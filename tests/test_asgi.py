@@ -0,0 +1,140 @@
+import hashlib
+import importlib
+import json
+import time
+
+import pytest
+
+from pdf_extractor import PDFExtractor
+from synthetic_pdf import make_synthetic_pdf
+
+# every store of the service is pointed to a temporary directory, the uploads and json files go to the data
+# directory of the repository (they are not configurable) and are deleted after the tests
+STORE_PATHS = {
+    "PDF_PARSER_CACHE_DIR": "cache",
+    "PDF_PARSER_PAGE_CACHE_DIR": "page_cache",
+    "PDF_PARSER_LAYOUT_DIR": "layouts",
+    "PDF_PARSER_DATASET_DIR": "datasets",
+    "PDF_PARSER_JOB_DB": "jobs.db",
+    "PDF_PARSER_SECTION_INDEX_DB": "section_index.db",
+    "PDF_PARSER_DEDUP_DB": "section_dedup.db",
+}
+QUEUE_SIZE = 3
+
+@pytest.fixture(scope="module")
+def asgi(tmp_path_factory):
+    tmp_dir = tmp_path_factory.mktemp("service")
+    with pytest.MonkeyPatch.context() as mp:
+        for variable, name in STORE_PATHS.items():
+            mp.setenv(variable, str(tmp_dir / name))
+        mp.setenv("PDF_PARSER_WARM_WORKERS", "false")
+        mp.setenv("PDF_PARSER_WORKERS", "2")
+        mp.setenv("PDF_PARSER_QUEUE_SIZE", str(QUEUE_SIZE))
+        yield importlib.import_module("asgi")
+
+@pytest.fixture(scope="module")
+def uploaded():
+    """
+    content of the pdfs uploaded by the tests
+    """
+    return []
+
+@pytest.fixture(scope="module")
+def client(asgi, uploaded):
+    from fastapi.testclient import TestClient
+
+    with TestClient(asgi.app) as client:
+        yield client
+    for pdf_bytes in uploaded:
+        content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+        (asgi.UPLOAD_DIR / f"{content_hash}.pdf").unlink(missing_ok=True)
+        for json_path in asgi.JSON_DIR.glob(f"*-{content_hash[:12]}.json*"):
+            json_path.unlink()
+
+def make_pdf(uploaded:list, seed:int, n_pages:int = 3) -> bytes:
+    pdf_bytes = make_synthetic_pdf(n_pages=n_pages, table_density=0.0, seed=seed)
+    uploaded.append(pdf_bytes)
+    return pdf_bytes
+
+def upload(client, pdfs:dict, **kwargs):
+    files = [("files", (name, pdf_bytes, "application/pdf")) for name, pdf_bytes in pdfs.items()]
+    return client.post("/parsepdf/", files=files, **kwargs)
+
+def wait_for(client, task_ids:list, timeout:float = 120) -> dict:
+    """
+    final status of every task
+    """
+    statuses = {}
+    deadline = time.perf_counter() + timeout
+    while len(statuses) < len(task_ids) and time.perf_counter() < deadline:
+        for task_id in set(task_ids) - set(statuses):
+            status = client.get(f"/task_status/{task_id}/").json()
+            if status["status"] in ("completed", "cancelled") or status["status"].startswith("failed"):
+                statuses[task_id] = status
+        time.sleep(0.05)
+    assert len(statuses) == len(task_ids), "tasks did not finish"
+    return statuses
+
+def test_uploads_are_extracted_concurrently(client, uploaded):
+    pdfs = {f"doc_{seed}.pdf": make_pdf(uploaded, seed) for seed in (101, 102)}
+    response = upload(client, pdfs)
+    assert response.status_code == 200
+    tasks = response.json()["tasks"]
+    assert [task["file_name"] for task in tasks] == list(pdfs)
+    assert all(task["estimate"]["pages"] == 3 for task in tasks)
+
+    statuses = wait_for(client, [task["task_id"] for task in tasks])
+    for status in statuses.values():
+        assert status["status"] == "completed"
+        download = client.get(status["download_url"]["download_url"])
+        assert download.status_code == 200
+        assert json.loads(download.content)["sections"]
+
+def test_full_queue_is_rejected(client, uploaded):
+    pdfs = {f"doc_{seed}.pdf": make_pdf(uploaded, seed) for seed in range(111, 112 + QUEUE_SIZE)}
+    response = upload(client, pdfs)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert client.get("/download/missing.json").status_code == 404
+
+def test_stream_yields_one_json_line_per_section(client, uploaded, tmp_path):
+    pdf_bytes = make_pdf(uploaded, 121)
+    response = client.post("/parsepdf/stream/", files=[("file", ("stream.pdf", pdf_bytes, "application/pdf"))])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    (tmp_path / "stream.pdf").write_bytes(pdf_bytes)
+    expected = list(PDFExtractor(str(tmp_path / "stream.pdf")).iter_sections())
+    assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+    response = client.post("/parsepdf/stream/", files=[("file", ("notes.txt", b"text", "text/plain"))])
+    assert response.status_code == 415
+
+def test_uploads_are_stored_once_per_content(asgi, client, uploaded):
+    pdf_bytes = make_pdf(uploaded, 131)
+    content_hash = hashlib.sha256(pdf_bytes).hexdigest()
+    response = upload(client, {"first.pdf": pdf_bytes, "second.pdf": pdf_bytes})
+    assert response.status_code == 200
+    task_ids = [task["task_id"] for task in response.json()["tasks"]]
+    wait_for(client, task_ids)
+
+    assert (asgi.UPLOAD_DIR / f"{content_hash}.pdf").read_bytes() == pdf_bytes
+    assert not list(asgi.UPLOAD_DIR.glob("*.tmp"))
+    jobs = client.get(f"/jobs/{content_hash}/").json()["tasks"]
+    assert {job["task_id"]: job["file_name"] for job in jobs} == dict(zip(task_ids, ("first.pdf", "second.pdf")))
+    assert client.get("/jobs/not-a-hash/").status_code == 422
+
+def test_pdf_is_handed_over_in_shared_memory(asgi):
+    item = asgi.Item(task_id="shm-test", file_path="", fil_path_wo_extn="")
+    asgi.share_pdf(item, bytearray())
+    assert item.shm_name is None
+
+    content = bytearray(b"%PDF-1.7 content")
+    asgi.share_pdf(item, content)
+    assert item.size == len(content)
+    assert asgi.read_shared_pdf(item.shm_name, item.size) == bytes(content)
+    asgi.release_pdf(item)
+    assert "shm-test" not in asgi.shared_buffers
+    with pytest.raises(FileNotFoundError):
+        asgi.read_shared_pdf(item.shm_name, item.size)
+    # releasing twice is a no-op
+    asgi.release_pdf(item)
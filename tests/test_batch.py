@@ -0,0 +1,55 @@
+import json
+import os
+
+import batch
+from synthetic_pdf import make_synthetic_pdf
+
+def crashing_process_document(pdf_path:str, *args) -> dict:
+    """
+    batch.process_document that kills its worker process like a segfault in pymupdf for the pdfs named crash, the
+    workers are spawned and import it from this module
+    """
+    if "crash" in os.path.basename(pdf_path):
+        os._exit(1)
+    return batch.process_document(pdf_path, *args)
+
+def make_corpus(corpus_dir, names):
+    corpus_dir.mkdir()
+    for seed, name in enumerate(names):
+        make_synthetic_pdf(str(corpus_dir / f"{name}.pdf"), n_pages=3, table_density=0.0, seed=seed)
+
+def read_checkpoint(output_dir) -> dict:
+    with open(output_dir / batch.CHECKPOINT_FILE, encoding="utf-8") as f:
+        return {os.path.basename(record["path"]): record["status"] for record in map(json.loads, f)}
+
+def test_batch_writes_and_resumes(tmp_path):
+    make_corpus(tmp_path / "corpus", ["a", "b", "c"])
+    args = batch.parse_args([str(tmp_path / "corpus"), "--output", str(tmp_path / "out"), "--workers", "2"])
+    records = batch.run_batch(args)
+    assert sorted(record["status"] for record in records) == ["completed"] * 3
+    lines = (tmp_path / "out" / "results-00000.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 3
+    assert all(json.loads(line)["processed_data"]["sections"] for line in lines)
+    # a second run finds everything done
+    assert batch.run_batch(args) == []
+
+def test_batch_survives_a_dying_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "process_document", crashing_process_document)
+    make_corpus(tmp_path / "corpus", ["a", "b", "crash", "d", "e", "f"])
+    args = batch.parse_args([str(tmp_path / "corpus"), "--output", str(tmp_path / "out"), "--workers", "1"])
+    records = batch.run_batch(args)
+
+    statuses = read_checkpoint(tmp_path / "out")
+    assert len(records) == 6
+    # the documents in flight with the crashing one are run again alone, only the crashing one fails
+    assert statuses.pop("crash.pdf") == batch.WORKER_DIED
+    assert set(statuses.values()) == {"completed"}
+
+    # the crashing pdf does not block a resumed run, retrying the failed documents only fails it again
+    assert batch.run_batch(args) == []
+    retry_args = batch.parse_args(
+        [str(tmp_path / "corpus"), "--output", str(tmp_path / "out"), "--workers", "1", "--retry-failed"]
+    )
+    assert [(os.path.basename(record["path"]), record["status"]) for record in batch.run_batch(retry_args)] == [
+        ("crash.pdf", batch.WORKER_DIED)
+    ]
@@ -0,0 +1,72 @@
+import fitz
+import numpy as np
+
+from block_store import BlockStore
+from spill_store import BlockStoreWriter, RecordSpill
+
+def make_block(number:int, lines:list, bbox=(0, 0, 100, 20)) -> dict:
+    """
+    pymupdf "dict" text block, lines as lists of (text, font size) spans
+    """
+    return {
+        "type": 0, "number": number, "bbox": bbox,
+        "lines": [{"spans": [{"text": text, "size": size} for text, size in spans]} for spans in lines],
+    }
+
+def test_blocks_of_several_pages_are_concatenated():
+    first = BlockStore.from_page_blocks(1, [
+        make_block(0, [[("Heading", 16.2)], [("body ", 10), ("bold", 10.4)]]),
+        {"type": 1, "number": 1, "bbox": (0, 30, 50, 80)},
+        make_block(2, [[("page 1", 8)]], bbox=(0, 800, 50, 810)),
+    ])
+    second = BlockStore.from_page_blocks(2, [make_block(0, [[("Mixed ", 16), ("sizes", 10)]])])
+    store = BlockStore.concat([first, None, second])
+
+    assert len(store) == 3 and store.n_lines == 4
+    assert store.pg_blk() == ["1.0", "1.2", "2.0"]
+    assert store.bbox[1].tolist() == [0, 800, 50, 810]
+    assert list(store.iter_block_lines(store.line_texts())) == [["Heading", "body bold"], ["page 1"], ["Mixed sizes"]]
+    assert store.line_blocks().tolist() == [0, 0, 1, 2]
+
+    store.assign_headers({16: "h1"})
+    assert list(store.iter_block_lines(store.line_header_tags())) == [[["h1"], [""]], [[""]], [["h1", ""]]]
+    assert store.nbytes() > 0
+    assert len(BlockStore.concat([])) == 0
+
+def test_store_keeps_the_text_of_every_line(sample_pdf):
+    with fitz.open(sample_pdf) as doc:
+        stores, expected = [], []
+        for page_cnt, page in enumerate(doc, start=1):
+            blocks = page.get_text("dict")["blocks"]
+            stores.append(BlockStore.from_page_blocks(page_cnt, blocks))
+            expected.extend(
+                "".join(span["text"] for span in line["spans"])
+                for block in blocks if block["type"] == 0 for line in block["lines"]
+            )
+    store = BlockStore.concat(stores)
+    assert store.line_texts() == expected
+    assert np.all(np.diff(store.page) >= 0)
+
+def test_spilled_store_reads_back_the_written_windows(tmp_path, sample_pdf):
+    with fitz.open(sample_pdf) as doc:
+        stores = [
+            BlockStore.from_page_blocks(page_cnt, page.get_text("dict")["blocks"])
+            for page_cnt, page in enumerate(doc, start=1)
+        ]
+    writer = BlockStoreWriter(tmp_path)
+    for start in range(0, len(stores), 4):
+        writer.append(BlockStore.concat(stores[start:start + 4]))
+    spilled = writer.close()
+    store = BlockStore.concat(stores)
+
+    assert len(spilled.windows) == (len(stores) + 3) // 4
+    assert spilled.line_texts() == store.line_texts()
+    assert spilled.bbox.tolist() == store.bbox.tolist() and spilled.page.tolist() == store.page.tolist()
+    assert [block_start for block_start, _ in spilled.iter_windows()] == [window[0] for window in spilled.windows]
+
+    records = RecordSpill(tmp_path / "records.jsonl")
+    for idx in range(3):
+        records.append({"page": idx, "text": "naïve \ud800"})
+    assert records[1] == {"page": 1, "text": "naïve \ud800"}
+    assert list(records) == [{"page": idx, "text": "naïve \ud800"} for idx in range(3)]
+    records.close()
@@ -0,0 +1,61 @@
+import contextlib
+import io
+
+import pyarrow.compute as pc
+import pytest
+
+from dataset_writer import compact_json_dir, open_dataset, write_document
+from json_writer import write_json
+from pdf_extractor import PDFExtractor
+
+@pytest.fixture(scope="module")
+def extracted(sample_pdf):
+    with contextlib.redirect_stdout(io.StringIO()):
+        data = PDFExtractor(str(sample_pdf)).extract_all_text_blocks(outputs=("raw_data", "processed_data"))
+    sections = data["processed_data"]["sections"]
+    sections[1] = {**sections[1], "duplicate_of": {"doc_id": "other/doc", "section_idx": 4, "similarity": 0.93}}
+    return data
+
+def read_rows(output_dir, dataset:str, document_id:str, format:str = "parquet") -> list:
+    table = open_dataset(output_dir, dataset, format=format).to_table(filter=pc.field("document_id") == document_id)
+    return table.to_pylist()
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_document_round_trip(tmp_path, extracted, format):
+    document_id = "tax guide/2024"
+    assert write_document(tmp_path, document_id, extracted, format=format) > 0
+    processed_data = extracted["processed_data"]
+
+    sections = read_rows(tmp_path, "sections", document_id, format)
+    assert [(row["title"], row["page_nos"], row["content"]) for row in sections] == [
+        (section["title"], section["page_nos"], section["content"]) for section in processed_data["sections"]
+    ]
+    assert [row["section_idx"] for row in sections] == list(range(len(sections)))
+    assert (sections[1]["duplicate_of_doc_id"], sections[1]["duplicate_of_section_idx"], sections[1]["similarity"]) == (
+        "other/doc", 4, 0.93,
+    )
+    assert all(row["duplicate_of_doc_id"] is None for row in sections[2:])
+
+    [document] = read_rows(tmp_path, "documents", document_id, format)
+    assert document["document_id"] == document_id
+    assert document["n_sections"] == len(processed_data["sections"])
+    assert document["n_blocks"] == len(extracted["raw_data"]["sections"]) > 0
+    assert len(read_rows(tmp_path, "toc", document_id, format)) == document["n_toc"]
+    assert len(read_rows(tmp_path, "tables", document_id, format)) == document["n_tables"] > 0
+
+    # a new version of the document replaces its partitions, the outputs it does not have are removed
+    write_document(tmp_path, document_id, {"processed_data": processed_data}, format=format)
+    assert read_rows(tmp_path, "blocks", document_id, format) == []
+    assert read_rows(tmp_path, "documents", document_id, format)[0]["n_blocks"] == 0
+
+def test_json_files_are_compacted_once(tmp_path, extracted):
+    json_dir = tmp_path / "json"
+    json_dir.mkdir()
+    write_json(json_dir / "a.json", extracted["processed_data"])
+    write_json(json_dir / "b.json.gz", {"processed_data": extracted["processed_data"]}, compress=True)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        records = compact_json_dir(json_dir, tmp_path / "datasets")
+        assert compact_json_dir(json_dir, tmp_path / "datasets") == []
+    assert sorted((record["status"], record["documents"]) for record in records) == [("completed", 1)] * 2
+    documents = open_dataset(tmp_path / "datasets", "documents").to_table().to_pylist()
+    assert sorted(document["document_id"] for document in documents) == ["a", "b"]
@@ -0,0 +1,92 @@
+import os
+import pickle
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import job_store
+from job_store import JobStore
+
+def test_every_write_gets_the_next_version(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.create("a", {"status": "queued"}, content_hash="h", file_name="a.pdf")
+    store.create("b", {"status": "queued"}, content_hash="h", file_name="b.pdf")
+    assert store.get("a") == {"status": "queued"} and store.get("missing") is None
+
+    changes = store.changes(["a", "b"])
+    assert [(task_id, status["status"]) for task_id, _, status in changes] == [("a", "queued"), ("b", "queued")]
+    version = changes[-1][1]
+    store.update("a", {"status": "running", "pages_done": 2})
+    assert store.changes(["a", "b"], since=version) == [("a", version + 1, {"status": "running", "pages_done": 2})]
+    assert store.changes(["b"], since=version) == []
+    assert {job["file_name"] for job in store.find("h")} == {"a.pdf", "b.pdf"}
+
+def test_concurrent_writers_get_distinct_versions(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    task_ids = [f"task-{idx}" for idx in range(8)]
+
+    def write(task_id):
+        store.create(task_id, {"status": "queued"})
+        for pages_done in range(5):
+            store.update(task_id, {"status": "running", "pages_done": pages_done})
+
+    threads = [threading.Thread(target=write, args=(task_id,)) for task_id in task_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # only the latest version of every job is kept, a reader starting at 0 sees all jobs in their last state
+    changes = store.changes(task_ids)
+    assert len(changes) == len(task_ids)
+    assert len({version for _, version, _ in changes}) == len(task_ids)
+    assert max(version for _, version, _ in changes) == len(task_ids) * 6
+
+def test_cancel_requests_and_expiry(tmp_path):
+    store = JobStore(tmp_path / "jobs.db", ttl_seconds=0)
+    store.create("running", {"status": "running"})
+    store.create("done", {"status": "completed"})
+    assert store.request_cancel("running")
+    assert not store.request_cancel("done") and not store.request_cancel("missing")
+    assert store.cancel_requests(["running", "done"]) == ["running"]
+
+    store.update("running", {"status": "cancelled"})
+    assert store.expire() == 2
+    assert store.get("running") is None and store.get("done") is None
+
+def test_older_schema_is_dropped_and_store_can_be_pickled(tmp_path):
+    db_path = tmp_path / "jobs.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE jobs (task_id TEXT PRIMARY KEY, data TEXT)")
+        conn.execute("PRAGMA user_version = 1")
+    store = JobStore(db_path)
+    store.create("a", {"status": "queued"})
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == job_store.SCHEMA_VERSION
+
+    copy = pickle.loads(pickle.dumps(store))
+    assert copy.get("a") == {"status": "queued"}
+
+def test_unfinished_jobs_of_stopped_processes_are_failed(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    stopped = subprocess.Popen([sys.executable, "-c", "pass"])
+    stopped.wait()
+    statuses = {"queued": "pending", "running": "processing", "done": "completed", "other": "pending"}
+    for task_id, status in statuses.items():
+        store.create(task_id, {"status": status})
+    conn = store.connect()
+    conn.execute("UPDATE jobs SET owner_pid = ? WHERE task_id != 'other'", (stopped.pid,))
+    # a live api process, e.g. another uvicorn worker
+    conn.execute("UPDATE jobs SET owner_pid = ? WHERE task_id = 'other'", (os.getppid(),))
+    version = store.changes(list(statuses))[-1][1]
+
+    assert store.fail_orphaned({"status": "failed : restarted"}) == 2
+    changes = store.changes(list(statuses), since=version)
+    assert {task_id: status["status"] for task_id, _, status in changes} == {
+        "queued": "failed : restarted", "running": "failed : restarted",
+    }
+    assert store.get("done") == {"status": "completed"} and store.get("other") == {"status": "pending"}
+    # the jobs of a former process with the pid of the current one
+    store.create("own", {"status": "pending"})
+    assert store.fail_orphaned({"status": "failed : restarted"}) == 1
+    assert store.get("own") == {"status": "failed : restarted"}
@@ -0,0 +1,42 @@
+import contextlib
+import io
+import json
+
+import pytest
+
+from json_writer import read_json, write_json
+from pdf_extractor import PDFExtractor
+
+def test_round_trip_with_generators_and_gzip(tmp_path):
+    data = {
+        "document_name": "naïve – ünïcode.pdf",
+        "sections": ({"title": f"section {idx}", "page_nos": [idx], "content": "text\n" * idx} for idx in range(3)),
+        "nested": {"deep": [[{"a": (1, 2.5, None, True)}]]},
+    }
+    expected = {
+        "document_name": "naïve – ünïcode.pdf",
+        "sections": [{"title": f"section {idx}", "page_nos": [idx], "content": "text\n" * idx} for idx in range(3)],
+        "nested": {"deep": [[{"a": [1, 2.5, None, True]}]]},
+    }
+    for name, compress in (("data.json", False), ("data.json.gz", True)):
+        path = tmp_path / name
+        data["sections"] = iter(expected["sections"])
+        assert write_json(path, data, compress=compress) == path.stat().st_size
+        assert read_json(path) == expected
+    # the text is written as is, not escaped
+    assert "ünïcode" in (tmp_path / "data.json").read_text(encoding="utf-8")
+
+def test_invalid_values_leave_no_file(tmp_path):
+    with pytest.raises(ValueError):
+        write_json(tmp_path / "nan.json", {"value": float("nan")})
+    assert list(tmp_path.iterdir()) == []
+
+@pytest.mark.parametrize("outputs", [("processed_data",), ("raw_data", "processed_data")])
+def test_extractor_writes_the_requested_outputs(tmp_path, synthetic_pdf, outputs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = PDFExtractor(str(synthetic_pdf)).extract_all_text_blocks(outputs=outputs)
+        PDFExtractor(str(synthetic_pdf)).write_json(tmp_path / "doc.json.gz", outputs=outputs, compress=True)
+    written = read_json(tmp_path / "doc.json.gz")
+    assert list(written) == list(outputs)
+    expected = {output: result[output] for output in outputs}
+    assert written == json.loads(json.dumps(expected))
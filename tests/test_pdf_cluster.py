@@ -0,0 +1,38 @@
+import contextlib
+import io
+
+import fitz
+import pytest
+
+from pdf_cluster import CATEGORIZER_ENGINES
+from pdf_extractor import PDFExtractor
+
+def make_chapters_pdf(pdf_path:str, n_pages:int = 3):
+    """
+    a numbered chapter heading at the same position of every page, the body and a running footer
+    """
+    doc = fitz.open()
+    for chapter in range(1, n_pages + 1):
+        page = doc.new_page()
+        page.insert_text((72, 90), f"Chapter {chapter}", fontsize=20)
+        for line in range(12):
+            page.insert_text((72, 130 + 14 * line), f"Line {line} of chapter {chapter} on the rules of the tax year.", fontsize=10)
+        page.insert_text((72, 400), f"Section {chapter}.1", fontsize=14)
+        page.insert_text((72, 430), f"Text of section {chapter}.1 about the exemptions of the tax year.", fontsize=10)
+        page.insert_text((280, 800), f"Page {chapter}", fontsize=8)
+    doc.save(pdf_path)
+
+@pytest.mark.parametrize("engine", list(CATEGORIZER_ENGINES))
+def test_numbered_headings_are_no_running_headers(tmp_path, engine):
+    pdf_path = str(tmp_path / "chapters.pdf")
+    make_chapters_pdf(pdf_path)
+    extractor = PDFExtractor(pdf_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sections = list(extractor.iter_sections(extract_tables=False, categorizer_engine=engine))
+    titles = [section["title"] for section in sections]
+    for chapter in range(1, 4):
+        assert f"Chapter {chapter}" in titles and f"Section {chapter}.1" in titles
+    labelled = {" ".join(record["text_lst"]).strip() for record in extractor.iter_raw_records() if record["header_footer"]}
+    assert not any(text.startswith(("Chapter", "Section", "Line", "Text")) for text in labelled)
+    if engine == "repetition":
+        assert labelled == {"Page 1", "Page 2", "Page 3"}
@@ -0,0 +1,47 @@
+import contextlib
+import io
+import json
+
+import pytest
+
+from pdf_extractor import PDFExtractor
+
+def extract(pdf_path, **kwargs) -> dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return PDFExtractor(str(pdf_path)).extract_all_text_blocks(**kwargs)
+
+def test_iter_sections_yields_the_processed_sections(synthetic_pdf):
+    processed_data = extract(synthetic_pdf)["processed_data"]
+    with contextlib.redirect_stdout(io.StringIO()):
+        sections = PDFExtractor(str(synthetic_pdf)).iter_sections()
+        assert list(sections) == processed_data["sections"]
+
+def page_contents(sections:list, tables:bool) -> list:
+    return sorted(
+        (section["page_nos"], section["content"]) for section in sections if (section["title"] == "<table>") == tables
+    )
+
+def test_sections_and_toc_match_the_reference_json(sample_pdf):
+    reference_path = sample_pdf.parent.parent / "json_files" / "Income_Tax_Guidelines_for_Exemptions.json"
+    # written by the first version of the parser, it holds NaN values
+    reference = json.loads(reference_path.read_text(encoding="utf-8").replace("NaN", "null"))
+    processed_data = extract(sample_pdf)["processed_data"]
+
+    assert processed_data["table_of_contentx_(toc)"] == reference["table_of_contentx_(toc)"]
+    assert [(section["title"], section["page_nos"]) for section in processed_data["sections"]] == [
+        (section["title"], section["page_nos"]) for section in reference["sections"]
+    ]
+    # the tables of a page may be found in another order by other pymupdf versions
+    for tables in (False, True):
+        assert page_contents(processed_data["sections"], tables) == page_contents(reference["sections"], tables)
+
+@pytest.mark.parametrize("pdf_fixture", ["sample_pdf", "synthetic_pdf"])
+def test_parallel_and_windowed_extraction_match_the_serial_one(request, pdf_fixture):
+    pdf_path = request.getfixturevalue(pdf_fixture)
+    serial = extract(pdf_path)
+    parallel = extract(pdf_path, workers=2)
+    # a budget small enough to spill every few pages
+    windowed = extract(pdf_path, memory_budget_mb=0.05)
+    assert windowed["stats"]["counters"]["windows"] > 1
+    assert parallel["processed_data"] == serial["processed_data"]
+    assert windowed["processed_data"] == serial["processed_data"]
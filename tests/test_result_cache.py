@@ -0,0 +1,74 @@
+import contextlib
+import io
+import os
+
+import fitz
+
+from pdf_extractor import PDFExtractor
+from result_cache import ResultCache, make_cache_key
+
+def test_cache_key_changes_with_the_content_and_every_option():
+    options = {"process_data": True, "extract_tables": True, "categorizer_engine": "dbscan", "outputs": ["processed_data"]}
+    key = make_cache_key("abc", **options)
+    assert key == make_cache_key("abc", **dict(reversed(list(options.items()))))
+    assert key != make_cache_key("abd", **options)
+    for name, value in {
+        "process_data": False, "extract_tables": False, "categorizer_engine": "repetition",
+        "outputs": ["raw_data", "processed_data"],
+    }.items():
+        assert key != make_cache_key("abc", **{**options, name: value}), name
+    assert key != make_cache_key("abc", **options, layout_templates=True)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=1 << 30)
+    for name in ("a", "b", "c"):
+        cache.put(make_cache_key(name), {"name": name, "data": b"x" * 1000})
+    # a is used last, b is the least recently used one
+    for age, name in enumerate(("b", "c", "a")):
+        path = cache.entry_path(make_cache_key(name))
+        os.utime(path, (1000 + age, 1000 + age))
+    cache.max_bytes = cache.stats()["bytes"] - 1
+    assert cache.evict() == 1
+    assert cache.get(make_cache_key("b")) is None
+    assert cache.get(make_cache_key("a"))["name"] == "a"
+
+    cache.entry_path(make_cache_key("c")).write_bytes(b"not a pickle")
+    assert cache.get(make_cache_key("c")) is None
+    assert not cache.entry_path(make_cache_key("c")).exists()
+    assert cache.clear() and cache.stats()["entries"] == 0
+
+def test_extraction_result_is_served_from_the_cache(tmp_path, sample_pdf):
+    cache = ResultCache(tmp_path / "cache")
+    with contextlib.redirect_stdout(io.StringIO()):
+        extracted = PDFExtractor(str(sample_pdf)).extract_all_text_blocks(cache=cache, table_mode="off")
+        cached = PDFExtractor(str(sample_pdf)).extract_all_text_blocks(cache=cache, table_mode="off")
+        other = PDFExtractor(str(sample_pdf)).extract_all_text_blocks(
+            cache=cache, table_mode="off", categorizer_engine="repetition",
+        )
+    assert extracted["stats"]["counters"]["cache_hits"] == 0
+    assert cached["stats"]["counters"]["cache_hits"] == 1
+    assert cached["processed_data"] == extracted["processed_data"]
+    assert other["stats"]["counters"]["cache_hits"] == 0
+    assert cache.stats()["entries"] == 2
+
+def test_unchanged_pages_are_served_from_the_page_cache(tmp_path, sample_pdf):
+    # a revision of the sample with the last two pages swapped and a note added to the first page
+    with fitz.open(sample_pdf) as doc:
+        n_pages = doc.page_count
+        doc.select([*range(n_pages - 2), n_pages - 1, n_pages - 2])
+        doc[0].insert_text((72, 36), "Revised")
+        doc.save(tmp_path / "revised.pdf")
+
+    page_cache = ResultCache(tmp_path / "page_cache")
+    with contextlib.redirect_stdout(io.StringIO()):
+        extracted = PDFExtractor(str(sample_pdf)).extract_all_text_blocks(page_cache=page_cache)
+        cached = PDFExtractor(str(sample_pdf)).extract_all_text_blocks(page_cache=page_cache)
+        revised = PDFExtractor(str(tmp_path / "revised.pdf")).extract_all_text_blocks(page_cache=page_cache)
+        expected = PDFExtractor(str(tmp_path / "revised.pdf")).extract_all_text_blocks()
+    assert extracted["stats"]["counters"]["page_cache_misses"] == n_pages
+    assert cached["stats"]["counters"]["page_cache_hits"] == n_pages
+    assert cached["processed_data"] == extracted["processed_data"]
+    # the moved pages are found under their content, only the edited page is decoded again
+    assert revised["stats"]["counters"]["page_cache_hits"] == n_pages - 1
+    assert revised["stats"]["counters"]["page_cache_misses"] == 1
+    assert revised["processed_data"] == expected["processed_data"]
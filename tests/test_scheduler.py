@@ -0,0 +1,92 @@
+import asyncio
+from dataclasses import dataclass
+
+import pytest
+
+from scheduler import JobScheduler, estimate_cost, parse_tenant_weights
+
+@dataclass
+class Job:
+    task_id: str
+    tenant: str = "default"
+    cost: float = 1.0
+    enqueued_at: float = 0.0
+
+def drain(scheduler:JobScheduler) -> list:
+    """
+    task ids in the order the jobs are run, every job is finished before the next one starts
+    """
+    order = []
+    while (job := scheduler.pop_next()) is not None:
+        order.append(job.task_id)
+        scheduler.task_done(job)
+    return order
+
+def test_cost_estimate_and_tenant_weights():
+    assert estimate_cost(10, 0, "off") < estimate_cost(10, 0, "screened") < estimate_cost(10, 0, "exhaustive")
+    assert estimate_cost(10, 2**20, "off") == 11.0
+    assert parse_tenant_weights(" a=2, b=0.5,") == {"a": 2.0, "b": 0.5}
+    for text in ("a", "a=0", "=1"):
+        with pytest.raises(Exception):
+            parse_tenant_weights(text)
+    with pytest.raises(Exception):
+        JobScheduler(policy="lifo")
+
+def test_policies_order_by_arrival_or_cost():
+    jobs = [Job("large", cost=100, enqueued_at=0.0), Job("small", cost=1, enqueued_at=1.0)]
+    for policy, expected in (("fifo", ["large", "small"]), ("sjf", ["small", "large"])):
+        scheduler = JobScheduler(policy=policy)
+        for job in jobs:
+            scheduler.put_nowait(job)
+        assert drain(scheduler) == expected, policy
+    # a large job that waited long enough runs before smaller jobs that arrived later
+    scheduler = JobScheduler(policy="sjf", aging_cost_per_second=10.0)
+    scheduler.put_nowait(Job("large", cost=100, enqueued_at=0.0))
+    scheduler.put_nowait(Job("small", cost=1, enqueued_at=20.0))
+    assert drain(scheduler) == ["large", "small"]
+
+def test_fair_policy_interleaves_the_tenants():
+    scheduler = JobScheduler(policy="fair", tenant_weights={"heavy": 2})
+    for idx in range(6):
+        scheduler.put_nowait(Job(f"bulk-{idx}", tenant="bulk", enqueued_at=idx))
+    scheduler.put_nowait(Job("single-0", tenant="single", enqueued_at=10))
+    assert scheduler.tenant_qsize("bulk") == 6 and scheduler.qsize() == 7
+    # the tenant arriving later only waits for one job of the bulk upload
+    assert drain(scheduler)[:2] == ["bulk-0", "single-0"]
+
+    for idx in range(4):
+        scheduler.put_nowait(Job(f"light-{idx}", tenant="light", enqueued_at=idx))
+        scheduler.put_nowait(Job(f"heavy-{idx}", tenant="heavy", enqueued_at=idx))
+    order = drain(scheduler)
+    # a tenant of weight 2 runs twice as many jobs of the same cost
+    assert [task_id.split("-")[0] for task_id in order[:6]].count("heavy") == 4
+
+def test_running_limit_and_removed_jobs():
+    scheduler = JobScheduler(maxsize=3, tenant_max_running=1)
+    for task_id, tenant in (("a-0", "a"), ("a-1", "a"), ("b-0", "b")):
+        scheduler.put_nowait(Job(task_id, tenant=tenant))
+    assert scheduler.full()
+    with pytest.raises(asyncio.QueueFull):
+        scheduler.put_nowait(Job("c-0", tenant="c"))
+
+    first = scheduler.pop_next()
+    second = scheduler.pop_next()
+    assert {first.tenant, second.tenant} == {"a", "b"}
+    # the second job of a waits for the running one
+    assert scheduler.pop_next() is None
+    assert scheduler.remove("a-1").task_id == "a-1" and scheduler.remove("a-1") is None
+    assert scheduler.queued_task_ids() == [] and scheduler.tenant_qsize("a") == 0
+    scheduler.task_done(first)
+    scheduler.task_done(second)
+    assert scheduler.virtual_time == {} and scheduler.queued_cost == 0.0
+
+def test_get_waits_for_a_job():
+    async def run():
+        scheduler = JobScheduler()
+        getter = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0)
+        assert not getter.done()
+        scheduler.put_nowait(Job("a"))
+        return await asyncio.wait_for(getter, 1)
+
+    assert asyncio.run(run()).task_id == "a"
@@ -0,0 +1,59 @@
+import random
+
+from section_dedup import SectionDedup, dedup_sections
+
+def make_text(seed:int, n_words:int = 80) -> str:
+    rnd = random.Random(seed)
+    return " ".join(f"word{rnd.randrange(5000)}" for _ in range(n_words))
+
+def make_sections(*contents) -> list:
+    return [{"title": f"section {idx}", "page_nos": [idx + 1], "content": content} for idx, content in enumerate(contents)]
+
+def test_near_duplicates_refer_to_the_first_occurrence(tmp_path):
+    dedup = SectionDedup(tmp_path / "dedup.db")
+    boilerplate = make_text(0)
+    assert dedup.add_document("a", make_sections(make_text(1), boilerplate)) == [None, None]
+    # one word changed, and a section too short to be compared
+    edited = boilerplate.replace(boilerplate.split()[40], "changed", 1)
+    refs = dedup.add_document("b", make_sections(edited, "short note", make_text(2)))
+    assert refs[0]["doc_id"] == "a" and refs[0]["section_idx"] == 1 and refs[0]["similarity"] >= dedup.threshold
+    assert refs[1:] == [None, None]
+
+    sections = dedup_sections(make_sections(edited, "short note", make_text(2)), refs)
+    assert sections[0]["content"] == "" and sections[0]["duplicate_of"] == refs[0]
+    assert dedup.get_section("a", 1)["content"] == boilerplate
+    report = dedup.report()
+    assert (report["documents"], report["sections"], report["duplicate_sections"]) == (2, 5, 1)
+
+def test_same_content_hash_returns_the_stored_refs(tmp_path):
+    dedup = SectionDedup(tmp_path / "dedup.db")
+    boilerplate = make_text(0)
+    dedup.add_document("a", make_sections(boilerplate))
+    refs = dedup.add_document("b", make_sections(boilerplate), content_hash="h1")
+    assert dedup.add_document("b", make_sections("ignored"), content_hash="h1") == refs
+
+def test_readded_document_does_not_resolve_to_its_old_sections(tmp_path):
+    dedup = SectionDedup(tmp_path / "dedup.db")
+    old, new = make_text(0), make_text(1)
+    dedup.add_document("a", make_sections(old), content_hash="v1")
+    ref = dedup.add_document("b", make_sections(old))[0]
+    assert (ref["doc_id"], ref["section_idx"]) == ("a", 0)
+
+    # the changed document gets new sections, the old canonical section is kept for b under a versioned doc_id
+    assert dedup.add_document("a", make_sections(new), content_hash="v2") == [None]
+    assert dedup.get_section("a", 0)["content"] == new
+    ref = dedup.get_refs("b", 1)[0]
+    assert ref["doc_id"].startswith("a@") and ref["section_idx"] == 0
+    assert dedup.get_section(ref["doc_id"], 0)["content"] == old
+
+    # a new copy of the old section still finds it
+    ref = dedup.add_document("c", make_sections(old))[0]
+    assert ref["doc_id"].startswith("a@")
+
+    # once removed, a reference written before the change resolves to the latest version keeping the section
+    dedup.remove_document("a")
+    assert dedup.get_section("a", 0)["content"] == old
+    dedup.remove_document("b")
+    dedup.remove_document("c")
+    assert dedup.get_section("a", 0) is None
+    assert dedup.report()["canonical_sections"] == 0
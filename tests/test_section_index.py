@@ -0,0 +1,50 @@
+import os
+
+import section_index
+from json_writer import write_json
+from section_index import SectionIndex, index_json_dir
+
+SECTIONS = [
+    {"title": "Income Tax Exemptions", "page_nos": [1], "content": "house rent allowance is exempt under section 10"},
+    {"title": "Deductions", "page_nos": [2, 3], "content": "life insurance premium and provident fund deductions"},
+    {"title": "Boilerplate", "page_nos": [4], "content": "", "duplicate_of": {"doc_id": "other", "section_idx": 0}},
+]
+
+def test_search_ranks_title_matches_first(tmp_path):
+    index = SectionIndex(tmp_path / "index.db")
+    assert index.add_document("doc", SECTIONS, document_name="doc.pdf", content_hash="h1")
+    assert not index.add_document("doc", SECTIONS, content_hash="h1")
+    assert index.stats()["sections"] == 2
+
+    hits = index.search("income exempt*", raw=True)
+    assert [(hit["doc_id"], hit["section_idx"], hit["page_nos"]) for hit in hits] == [("doc", 0, [1])]
+    assert "[" in hits[0]["snippet"]
+    # the query words are quoted, fts5 operators are searched as words
+    assert index.search("provident OR nothing") == []
+    assert [hit["section_idx"] for hit in index.search("provident fund", doc_id="doc")] == [1]
+    assert index.search("provident", doc_id="missing") == []
+
+    index.remove_document("doc")
+    assert index.search("provident") == [] and index.get_content_hash("doc") is None
+
+def test_index_json_dir_skips_unchanged_files_without_reading_them(tmp_path, monkeypatch):
+    json_dir = tmp_path / "json"
+    json_dir.mkdir()
+    write_json(json_dir / "a.json", {"document_name": "a.pdf", "sections": SECTIONS})
+    write_json(json_dir / "b.json.gz", {"processed_data": {"document_name": "b.pdf", "sections": SECTIONS}}, compress=True)
+    index = SectionIndex(tmp_path / "index.db")
+    assert index_json_dir(index, json_dir) == 2
+    assert {hit["doc_id"] for hit in index.search("insurance")} == {"a", "b"}
+
+    reads = []
+    read_json = section_index.read_json
+    monkeypatch.setattr(section_index, "read_json", lambda path: reads.append(path.name) or read_json(path))
+    assert index_json_dir(index, json_dir) == 0
+    assert reads == []
+
+    write_json(json_dir / "a.json", {"document_name": "a.pdf", "sections": SECTIONS[:1]})
+    stat = (json_dir / "a.json").stat()
+    os.utime(json_dir / "a.json", ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert index_json_dir(index, json_dir) == 1
+    assert reads == ["a.json"]
+    assert {hit["doc_id"] for hit in index.search("insurance")} == {"b"}
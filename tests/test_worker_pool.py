@@ -0,0 +1,58 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from worker_pool import WorkerPool
+
+def get_pid(seconds:float = 0.0) -> int:
+    time.sleep(seconds)
+    return os.getpid()
+
+def fail(message:str):
+    raise ValueError(message)
+
+def crash():
+    os._exit(1)
+
+def run(coroutine_fn):
+    return asyncio.run(coroutine_fn())
+
+def test_results_and_errors_are_returned():
+    async def main():
+        pool = WorkerPool(2)
+        try:
+            await pool.start()
+            pids = await asyncio.gather(*[pool.run(get_pid, 0.2) for _ in range(2)])
+            with pytest.raises(ValueError, match="bad page"):
+                await pool.run(fail, "bad page")
+            return pids, await pool.run(get_pid)
+        finally:
+            pool.shutdown()
+
+    pids, pid = run(main)
+    # both jobs ran at the same time in their own worker, the worker survives an exception of a job
+    assert len(set(pids)) == 2 and pid in pids
+
+def test_cancelled_job_kills_and_replaces_its_worker():
+    async def main():
+        pool = WorkerPool(2)
+        try:
+            await pool.start()
+            pids = {worker.process.pid for worker in pool.workers}
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(pool.run(get_pid, 30), 0.5)
+            with pytest.raises(Exception, match="died"):
+                await pool.run(crash)
+            new_pids = {worker.process.pid for worker in pool.workers}
+            results = await asyncio.gather(*[pool.run(get_pid, 0.2) for _ in range(2)])
+            return pids, new_pids, results
+        finally:
+            pool.shutdown()
+
+    start = time.perf_counter()
+    pids, new_pids, results = run(main)
+    assert time.perf_counter() - start < 10
+    assert len(new_pids) == 2 and len(pids & new_pids) <= 1
+    assert set(results) == new_pids